@@ -0,0 +1,128 @@
+"""
+benchmark of the analysis stages on synthetic spot tables (see synthetic.py): time and peak memory (RSS) per stage
+
+    python benchmark.py --spots 10000 100000 1000000 10000000 --output benchmark.csv
+
+every number of spots runs in a new process, so memory left over from one run does not affect the next.
+Generated spot tables are kept in --data (and reused by later benchmarks), otherwise they are deleted.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+# only render to files
+matplotlib.use("Agg")
+import pandas as pd
+
+from settings import Settings, DEFAULT_ADVANCED_SETTINGS
+from writers import RESULT_WRITERS
+from figures import render_overview_figure
+from profiling import StageTimer
+from synthetic import get_track_count, write_dataset
+from methods import analyze_dataset
+
+BENCHMARK_SPOTS = (10**4, 10**5, 10**6, 10**7)
+# stages of analyze_dataset (see methods.analyze_dataset) and rendering the overview figure
+BENCHMARK_STAGES = ("load", "pivot", "time_series", "prepare_quality_control", "jumps", "peaks", "divisions",
+                    "filter", "divisions_per_cell", "normalize", "smooth", "figure_data", "result_tables", "export",
+                    "plot")
+BENCHMARK_DATASET = "synthetic"
+
+
+def get_benchmark_settings(n_channels:int, min_len:int=48, tracking_interval:float=60.0)->Settings:
+    return Settings(min_len=min_len,
+                    tracking_interval=tracking_interval,
+                    number_channels=n_channels,
+                    channel_names={channel: f"CH{channel}" for channel in range(1, n_channels + 1)},
+                    tracking_channel=n_channels,
+                    digits=2,
+                    delimiter="_",
+                    transform=False,
+                    suffix="-spots.csv")
+
+
+def benchmark_stages(input_folder:str, files:list, settings:Settings, advanced_settings:dict,
+                     output_folder:str)->list[dict]:
+    """
+    runs methods.analyze_dataset and renders its overview figure, with the stages analyze_dataset records
+    (see profiling.DatasetReport) and "plot"
+    :param files: spot tables of one dataset
+    :return: time and memory per stage, see profiling.StageTimer
+    """
+    results = analyze_dataset(input_folder, BENCHMARK_DATASET, files, settings, output_folder, advanced_settings)
+    if results["error"]:
+        raise RuntimeError(results["error"])
+    timer = StageTimer()
+    with timer.stage("plot"):
+        render_overview_figure(results["figure_data"], results["output_folder"])
+    return results["report"].stages + timer.stages
+
+
+def run_benchmark(spots:int, data_folder:str, n_frames:int=120, n_channels:int=3, subsets:int=3,
+                  output_formats:tuple=("xlsx",), track_store:str="auto")->list[dict]:
+    """
+    benchmark of one dataset with about this many spots (generated in data_folder if not there yet)
+    :return: time and memory per stage, with the number of spots, tracks and cells
+    """
+    dataset_folder = os.path.join(data_folder, f"{spots}_spots_{n_frames}_frames_{n_channels}_channels_{subsets}")
+    settings = get_benchmark_settings(n_channels)
+    settings.output_formats = list(output_formats)
+    advanced_settings = dict(DEFAULT_ADVANCED_SETTINGS, track_store=track_store)
+
+    n_tracks = get_track_count(spots // subsets, n_frames)
+    files = [os.path.join(dataset_folder, f"{BENCHMARK_DATASET}_{subset:02d}{settings.suffix}")
+             for subset in range(1, subsets + 1)]
+    if not all(os.path.exists(file) for file in files):
+        start = time.perf_counter()
+        files = write_dataset(dataset_folder, BENCHMARK_DATASET, n_tracks, n_frames, subsets=subsets,
+                              n_channels=n_channels, tracking_interval=settings.tracking_interval)
+        print(F"generated {spots} spots in {time.perf_counter() - start:.1f} s", flush=True)
+
+    with tempfile.TemporaryDirectory() as output_folder:
+        stages = benchmark_stages(dataset_folder, files, settings, advanced_settings, output_folder + "/")
+    for stage in stages:
+        stage.update({"spots": spots, "tracks": n_tracks * subsets, "frames": n_frames, "channels": n_channels})
+    return stages
+
+
+def main(argv=None)->int:
+    parser = argparse.ArgumentParser(description="time and memory of the analysis stages on synthetic data")
+    parser.add_argument("--spots", nargs="+", type=int, default=list(BENCHMARK_SPOTS),
+                        help="number of spots per dataset, one benchmark each")
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--channels", type=int, default=3)
+    parser.add_argument("--subsets", type=int, default=3, help="spot tables per dataset")
+    parser.add_argument("--output-format", dest="output_formats", nargs="+", choices=list(RESULT_WRITERS),
+                        default=["xlsx"])
+    parser.add_argument("--track-store", dest="track_store", choices=["auto", "dense", "ragged"], default="auto")
+    parser.add_argument("--data", help="folder to keep the generated spot tables, default: temporary folder")
+    parser.add_argument("--output", help="csv file of the results")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as temporary_folder:
+        data_folder = args.data or temporary_folder
+        for spots in args.spots:
+            # a new process per benchmark, peak memory is not affected by previous benchmarks
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                stages = executor.submit(run_benchmark, spots, data_folder, args.frames, args.channels,
+                                         args.subsets, tuple(args.output_formats), args.track_store).result()
+            results += stages
+            print(pd.DataFrame(stages)[["spots", "stage", "seconds", "peak_rss_mb"]].to_string(index=False),
+                  flush=True)
+
+    table = pd.DataFrame(results)[["spots", "tracks", "frames", "channels", "stage", "seconds",
+                                   "start_rss_mb", "peak_rss_mb"]]
+    print(table.pivot(index="stage", columns="spots", values="seconds").reindex(BENCHMARK_STAGES).to_string())
+    if args.output:
+        table.to_csv(args.output, index=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+import numpy as np
+import pandas as pd
+from logger import logger
+from settings import DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE
+
+CACHE_FILE_EXTENSION = ".npz"
+DEFAULT_SESSION_CACHE_SIZE = 2 * 10**9  # bytes
+
+
+def get_file_identity(file:str)->str:
+    """
+    :return: path, size and modification time of file, changes when the file is changed
+    """
+    file_stat = os.stat(file)
+    return "|".join([os.path.abspath(file), str(file_stat.st_size), str(file_stat.st_mtime_ns)])
+
+
+class SpotTableCache():
+    """
+    On-disk cache of parsed spot tables, one .npz file (an array per column) per input file.
+    Entries are identified by path, size and modification time of the input file and the columns read,
+    so changed input files are parsed again. Least recently used entries are removed when the cache
+    grows beyond max_size (bytes).
+    """
+
+    def __init__(self, cache_dir:str=DEFAULT_CACHE_DIR, max_size:int=DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def get_cache_file(self, file:str, columns:list[str])->str:
+        identity = "|".join([get_file_identity(file), ",".join(sorted(columns))])
+        return os.path.join(self.cache_dir, hashlib.sha1(identity.encode()).hexdigest() + CACHE_FILE_EXTENSION)
+
+    def load(self, file:str, columns:list[str])->Optional[pd.DataFrame]:
+        """
+        :return: cached table of file, None if not cached (or cached for an older version of the file)
+        """
+        try:
+            cache_file = self.get_cache_file(file, columns)
+            with np.load(cache_file, allow_pickle=False) as arrays:
+                table = pd.DataFrame({column: arrays[column] for column in columns})
+            # mark as recently used
+            os.utime(cache_file)
+        except (OSError, KeyError, ValueError):
+            return None
+        logger.debug("loaded %s from cache %s", file, cache_file)
+        return table
+
+    def store(self, file:str, columns:list[str], table:pd.DataFrame):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            cache_file = self.get_cache_file(file, columns)
+            # write to a temporary file first, other processes might read the cache at the same time
+            file_descriptor, temp_file = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(file_descriptor, "wb") as cache_file_handle:
+                    np.savez(cache_file_handle, **{column: table[column].to_numpy() for column in columns})
+                os.replace(temp_file, cache_file)
+            finally:
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+        except OSError as err:
+            logger.warning(f"could not write {file} to cache: {err}")
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        removes least recently used entries until the cache is smaller than max_size
+        """
+        try:
+            entries = [entry for entry in os.scandir(self.cache_dir)
+                       if entry.is_file() and entry.name.endswith(CACHE_FILE_EXTENSION)]
+            entries = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries]
+        except OSError:
+            return
+        cache_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if cache_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+                logger.debug("removed %s from cache", path)
+            except OSError:
+                pass
+            cache_size -= size
+
+    def clear(self):
+        self.max_size, max_size = 0, self.max_size
+        self.evict()
+        self.max_size = max_size
+
+
+def get_nbytes(entry)->int:
+    """
+    :return: memory used by the arrays and indexes in entry (also in nested tuples, lists and dicts)
+    """
+    if isinstance(entry, np.ndarray):
+        return entry.nbytes
+    if isinstance(entry, pd.Index):
+        return entry.memory_usage()
+    if isinstance(entry, (tuple, list)):
+        return sum(get_nbytes(item) for item in entry)
+    if isinstance(entry, dict):
+        return sum(get_nbytes(item) for item in entry.values())
+    return 0
+
+
+def set_read_only(entry):
+    """
+    marks all arrays in entry as read only, cached arrays are shared by all users of the cache
+    """
+    if isinstance(entry, np.ndarray):
+        entry.flags.writeable = False
+    elif isinstance(entry, (tuple, list)):
+        for item in entry:
+            set_read_only(item)
+    elif isinstance(entry, dict):
+        for item in entry.values():
+            set_read_only(item)
+
+
+class SessionCache():
+    """
+    In-memory cache for one session (e.g. a GUI window), holds the pivoted time series of datasets,
+    so a changed threshold or minimum length only reruns the quality control, not the loading and pivoting.
+    Least recently used entries are removed when all entries together use more than max_size (bytes).
+    Cached arrays are read only.
+    """
+
+    def __init__(self, max_size:int=DEFAULT_SESSION_CACHE_SIZE):
+        self.max_size = max_size
+        # key: (entry, bytes), least recently used first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def size(self)->int:
+        return sum(nbytes for _, nbytes in self.entries.values())
+
+    def load(self, key:Hashable):
+        """
+        :return: cached entry, None if not cached
+        """
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def store(self, key:Hashable, entry):
+        nbytes = get_nbytes(entry)
+        if nbytes > self.max_size:
+            logger.debug("%.2f GB too large for session cache", nbytes / 10**9)
+            return
+        set_read_only(entry)
+        with self.lock:
+            self.entries[key] = (entry, nbytes)
+            self.entries.move_to_end(key)
+            self.evict()
+
+    def evict(self):
+        """
+        removes least recently used entries until the cache is smaller than max_size
+        """
+        cache_size = self.size
+        while cache_size > self.max_size:
+            _, (_, nbytes) = self.entries.popitem(last=False)
+            cache_size -= nbytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
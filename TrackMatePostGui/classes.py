@@ -1,6 +1,4 @@
-from dataclasses import dataclass
-
-from PyQt5.QtCore import Qt, QSize, QObject, pyqtSignal, QRunnable, pyqtSlot, QThreadPool
+from PyQt5.QtCore import Qt, QSize, QObject, pyqtSignal, QRunnable, pyqtSlot, QThreadPool, QTimer
 from PyQt5.QtGui import QPixmap
 from PyQt5.QtWidgets import (
     QApplication,
@@ -10,25 +8,14 @@ from PyQt5.QtWidgets import (
     QMainWindow,
     QSpinBox,
     QWidget, QDialog,
-    QVBoxLayout, QHBoxLayout, QPushButton, QFileDialog, QScrollArea, QProgressBar, QFrame, QMessageBox, QDoubleSpinBox
+    QVBoxLayout, QHBoxLayout, QPushButton, QFileDialog, QScrollArea, QProgressBar, QFrame, QMessageBox, QDoubleSpinBox,
+    QComboBox, QGroupBox
 )
 import traceback, sys
+from settings import Settings
 
-@dataclass
-class Settings():
-    min_len: int
-    tracking_interval: float
-    number_channels: int
-    channel_names: dict
-    tracking_channel: int
-    digits: int
-    delimiter: str
-    transform: bool
-    suffix: str
-
-    def get_tracking_marker_name(self):
-        return self.channel_names[self.tracking_channel]
-
+# ms after the last threshold change before the preview is updated, holding an arrow key updates it once
+PREVIEW_UPDATE_DELAY = 200
 
 
 class WorkerSignals(QObject):
@@ -40,12 +27,20 @@ class WorkerSignals(QObject):
     error
         tuple (exctype, value, traceback.format_exc() )
     progress
-        int indicating % progress
+        float, number of processed datasets including the processed part of running datasets
+
+    figure
+        results dict of a dataset, once its figure is rendered
+
+    finished
+        return value of the function, after all other signals of the worker
 
     '''
     error = pyqtSignal(tuple)
-    progress = pyqtSignal(int)
+    progress = pyqtSignal(float)
     result = pyqtSignal(object)
+    figure = pyqtSignal(object)
+    finished = pyqtSignal(object)
 
 class Worker(QRunnable):
     '''
@@ -73,6 +68,7 @@ class Worker(QRunnable):
         # Add the callback to our kwargs
         self.kwargs['progress_callback'] = self.signals.progress
         self.kwargs['result_callback'] = self.signals.result
+        self.kwargs['figure_callback'] = self.signals.figure
 
     @pyqtSlot()
     def run(self):
@@ -82,11 +78,13 @@ class Worker(QRunnable):
 
         # Retrieve args/kwargs here; and fire processing using them
         try:
-            self.fn(*self.args, **self.kwargs)
+            returned = self.fn(*self.args, **self.kwargs)
         except Exception:
             traceback.print_exc()
             exctype, value = sys.exc_info()[:2]
             self.signals.error.emit((exctype, value, traceback.format_exc()))
+        else:
+            self.signals.finished.emit(returned)
 
 
 class ScrollLabel(QScrollArea):
@@ -242,6 +240,24 @@ class AdvancedSettingsWindow(QDialog):
         self.tmj_threshold_layout.addWidget(self.input_tracking_marker_jump_threshold)
         self.layout.addLayout(self.tmj_threshold_layout)
 
+        # live preview of the quality control on one dataset, updated when a threshold changes
+        # (in a worker thread, one update at a time)
+        self.preview = None
+        self.preview_canvas = None
+        self.preview_running = False
+        self.preview_outdated = False
+        self.preview_threadpool = QThreadPool(self)
+        self.preview_threadpool.setMaxThreadCount(1)
+        self.preview_update_timer = QTimer(self)
+        self.preview_update_timer.setSingleShot(True)
+        self.preview_update_timer.setInterval(PREVIEW_UPDATE_DELAY)
+        self.preview_update_timer.timeout.connect(self.update_preview)
+        self.layout.addWidget(self.create_previewGroupBox())
+        for threshold_input in (self.input_size_jump_threshold,
+                                self.input_tracking_marker_division_peak_threshold,
+                                self.input_tracking_marker_jump_threshold):
+            threshold_input.valueChanged.connect(lambda value: self.preview_update_timer.start())
+
         self.button_layout = QHBoxLayout()
         self.submit_button = QPushButton('Apply', self)
         self.submit_button.clicked.connect(self.apply_settings)
@@ -252,10 +268,27 @@ class AdvancedSettingsWindow(QDialog):
         self.layout.addLayout(self.button_layout)
         self.setLayout(self.layout)
 
-    def cancel(self):
-        self.close()
-    def apply_settings(self):
-        setting_update = {
+    def create_previewGroupBox(self):
+        previewGroupBox = QGroupBox("Preview")
+        self.preview_layout = QVBoxLayout()
+
+        selection_layout = QHBoxLayout()
+        self.preview_dataset_selection = QComboBox()
+        self.preview_dataset_selection.addItems(sorted(self.main_window.dataset_list))
+        self.preview_button = QPushButton("Load dataset")
+        self.preview_button.clicked.connect(self.load_preview)
+        self.preview_button.setEnabled(bool(self.main_window.dataset_list))
+        selection_layout.addWidget(self.preview_dataset_selection)
+        selection_layout.addWidget(self.preview_button)
+        self.preview_layout.addLayout(selection_layout)
+
+        self.preview_label = QLabel("Load a dataset to see the effect of the thresholds")
+        self.preview_layout.addWidget(self.preview_label)
+        previewGroupBox.setLayout(self.preview_layout)
+        return previewGroupBox
+
+    def get_thresholds(self)->dict:
+        return {
             "size_jump_threshold":
                 self.input_size_jump_threshold.value(),
             "tracking_marker_jump_threshold" :
@@ -263,6 +296,112 @@ class AdvancedSettingsWindow(QDialog):
             "tracking_marker_division_peak_threshold" :
                 self.input_tracking_marker_division_peak_threshold.value(),
         }
+
+    def load_preview(self):
+        from cache import SpotTableCache
+        dataset = self.preview_dataset_selection.currentText()
+        main_window = self.main_window
+        # widgets are read here, the dataset is loaded in the preview thread (queued behind a running update)
+        # loaded once, the session cache of the main window also keeps it for the next run
+        worker = Worker(self.compute_load_preview, main_window.selected_folder, dataset,
+                        files=[main_window.selected_folder + "/" + file for file in main_window.file_list],
+                        settings=main_window.read_settings(),
+                        advanced_settings=dict(main_window.advanced_settings),
+                        spot_table_cache=SpotTableCache() if main_window.cache_checkbox.isChecked() else None,
+                        session_cache=main_window.get_session_cache())
+        worker.signals.result.connect(self.show_loaded_preview)
+        worker.signals.error.connect(lambda error: self.preview_load_failed(dataset, error))
+        self.preview_button.setEnabled(False)
+        self.preview_label.setText(f"Loading {dataset} ...")
+        self.preview_threadpool.start(worker)
+
+    def compute_load_preview(self, *args, progress_callback, result_callback, figure_callback, **kwargs):
+        # runs in the worker thread, pandas is only loaded with the preview module
+        from preview import QualityControlPreview
+        result_callback.emit(QualityControlPreview(*args, **kwargs))
+
+    def show_loaded_preview(self, preview):
+        self.preview_button.setEnabled(True)
+        self.preview = preview
+        self.update_preview()
+
+    def preview_load_failed(self, dataset:str, error:tuple):
+        self.preview_button.setEnabled(True)
+        self.preview = None
+        self.preview_label.setText(f"Could not load {dataset}: {error[1]}")
+
+    def update_preview(self):
+        if self.preview is None:
+            return
+        if self.preview_running:
+            # updated again with the latest thresholds when the running update is done
+            self.preview_outdated = True
+            return
+        self.preview_running = True
+        self.preview_outdated = False
+        worker = Worker(self.compute_preview, self.preview,
+                        dict(self.main_window.advanced_settings, **self.get_thresholds()))
+        worker.signals.result.connect(self.show_preview)
+        worker.signals.error.connect(self.preview_failed)
+        self.preview_threadpool.start(worker)
+
+    def compute_preview(self, preview, advanced_settings:dict, progress_callback, result_callback, figure_callback):
+        # runs in the worker thread
+        result_callback.emit((preview, preview.update(advanced_settings)))
+
+    def show_preview(self, preview_result:tuple):
+        self.preview_running = False
+        preview, results = preview_result
+        # not shown if another dataset was loaded or the thresholds changed meanwhile
+        if preview is self.preview and not self.preview_outdated:
+            self.preview_label.setText(
+                f'{preview.dataset_name}: {results["approved_cells"]}/{results["cells"]} cells approved, '
+                f'{results["flagged_cells"]} cells with potential tracking errors,\n'
+                f'{results["divisions"]} divisions, '
+                f'{results["close_divisions"]} cells with divisions less than 15 h apart')
+            self.plot_preview_traces(results)
+        if self.preview_outdated:
+            self.update_preview()
+
+    def preview_failed(self, error:tuple):
+        self.preview_running = False
+        self.preview_outdated = False
+        self.preview_label.setText(f"Could not update the preview: {error[1]}")
+
+    def plot_preview_traces(self, preview:dict):
+        # matplotlib is only loaded when a preview is shown
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
+        from figures import make_ax_circadian
+
+        if self.preview_canvas is None:
+            self.preview_canvas = FigureCanvasQTAgg(Figure(figsize=(10, 2.5)))
+            self.preview_canvas.setMinimumHeight(200)
+            self.preview_layout.addWidget(self.preview_canvas)
+        figure = self.preview_canvas.figure
+        figure.clear()
+        traces = preview["traces"]
+        axs = figure.subplots(1, max(len(traces.columns), 1), squeeze=False)[0]
+        for ax, cell in zip(axs, traces.columns):
+            # raw trace in grey, the approved part on top, divisions as red triangles
+            ax.plot(traces.index, traces[cell], c="lightgrey")
+            ax.plot(traces.index, preview["approved_traces"][cell], c="tab:blue")
+            division_frames = preview["division_frames"][cell]
+            ax.plot(division_frames, traces[cell].reindex(division_frames), "v", c="red")
+            ax.set_title(f"cell {cell}", fontsize=8)
+            make_ax_circadian(ax, len(traces.index), interval=preview["interval"])
+            # every 24 h, 12 h ticks are too dense for the small plots
+            for tick_label in ax.get_xticklabels()[1::2]:
+                tick_label.set_visible(False)
+            ax.xaxis.label.set_size(6)
+            ax.tick_params(labelsize=6)
+        figure.tight_layout()
+        self.preview_canvas.draw_idle()
+
+    def cancel(self):
+        self.close()
+    def apply_settings(self):
+        setting_update = self.get_thresholds()
         self.main_window.change_advanced_settings(setting_update)
         self.main_window.search_input_folder()
         self.close()
@@ -0,0 +1,259 @@
+"""
+command line interface to run TrackMatePostGui without a display (no Qt needed)
+
+    python cli.py run --input FOLDER --settings used_settings.json
+    python cli.py run --input FOLDER --channels CH1 CH2 CH3 --tracking-channel 3 --min-len 48
+    python cli.py sweep --input FOLDER --settings used_settings.json --size-jump-thresholds 0.2 0.3 --min-lens 24 48
+"""
+import argparse
+import logging
+import os
+import sys
+from typing import Optional
+
+from logger import logger
+from input_files import get_datasets_from_file_list, list_input_files
+from settings import (Settings, DEFAULT_ADVANCED_SETTINGS, DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE,
+                      HEATMAP_POOLING_OPTIONS, OUTPUT_FORMATS, load_settings_file)
+# runner, sweep, cache and writers import pandas, numpy and matplotlib, they are imported by the commands
+# (--help and argument errors do not wait for them)
+
+
+def build_settings(args:argparse.Namespace)->tuple[Settings, dict]:
+    """
+    settings are read from the settings file (if given) and overwritten by command line flags
+    """
+    from writers import check_output_formats
+    if args.settings:
+        settings, advanced_settings = load_settings_file(args.settings)
+    else:
+        if not args.channels:
+            raise ValueError("either --settings or --channels has to be provided")
+        settings = Settings(min_len=48,
+                            tracking_interval=60.0,
+                            number_channels=len(args.channels),
+                            channel_names={},
+                            tracking_channel=len(args.channels),
+                            digits=2,
+                            delimiter="_",
+                            transform=False,
+                            suffix="-spots.csv")
+        advanced_settings = dict(DEFAULT_ADVANCED_SETTINGS)
+
+    if args.channels:
+        settings.channel_names = {number: name for number, name in enumerate(args.channels, start=1)}
+        settings.number_channels = len(args.channels)
+    for setting_name in ("min_len", "tracking_interval", "tracking_channel", "digits", "delimiter",
+                         "transform", "suffix", "output_formats", "long_layout", "write_raw_all_cells",
+                         "render_figures"):
+        value = getattr(args, setting_name, None)
+        if value is not None:
+            setattr(settings, setting_name, value)
+    for setting_name in DEFAULT_ADVANCED_SETTINGS:
+        value = getattr(args, setting_name, None)
+        if value is not None:
+            advanced_settings[setting_name] = value
+
+    if settings.tracking_channel not in settings.channel_names:
+        raise ValueError(f"tracking channel {settings.tracking_channel} is not one of the channels "
+                         f"{list(settings.channel_names)}")
+    check_output_formats(settings.output_formats)
+    return settings, advanced_settings
+
+
+def print_result(results:dict):
+    result_text = F'processed {results["dataset"]}'
+    if not results["run_complete"]:
+        result_text += F': ERROR WHILE ANALYZING DATASET\n{results["error"] or "UNKNOWN ERROR"}'
+        logger.error(F'ERROR WHILE ANALYZING DATASET {results["dataset"]}:\n{results["error"]}')
+    else:
+        result_text += F': approved_cells: {results["approved_cells"]}/{results["all_cells"]}'
+        if results["failed_division_windows"]:
+            result_text += F', divisions not smoothened (out of bounds): {results["failed_division_windows"]}'
+    logger.info(result_text.replace('\n', ' '))
+    print(result_text, flush=True)
+
+
+def find_datasets(args:argparse.Namespace, settings:Settings)->tuple[str, list, list]:
+    """
+    :return: input folder, input files, datasets (only those of --dataset if given)
+    """
+    input_folder = os.path.abspath(args.input)
+    if not os.path.isdir(input_folder):
+        raise FileNotFoundError(f"input folder {input_folder} not found")
+
+    file_list = list_input_files(input_folder, settings.suffix)
+    datasets = get_datasets_from_file_list(file_list=file_list,
+                                           separator=settings.delimiter,
+                                           digits=settings.digits,
+                                           suffix=settings.suffix)
+    if args.dataset:
+        datasets = [dataset for dataset in datasets if dataset in args.dataset]
+    if not datasets:
+        raise FileNotFoundError("Found no Dataset to Process")
+    print(F'found {len(file_list)} files in {len(datasets)} datasets', flush=True)
+    return input_folder, file_list, datasets
+
+
+def get_spot_table_cache(args:argparse.Namespace)->Optional["SpotTableCache"]:
+    from cache import SpotTableCache
+    if args.no_cache:
+        return None
+    return SpotTableCache(cache_dir=args.cache_dir, max_size=int(args.cache_size * 10**9))
+
+
+def run(args:argparse.Namespace)->int:
+    import matplotlib
+    # no display on compute nodes, only render to files
+    matplotlib.use("Agg")
+    from runner import create_main_output_folder, run_datasets, write_settings_file
+
+    settings, advanced_settings = build_settings(args)
+    input_folder, file_list, datasets = find_datasets(args, settings)
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+        main_output_folder = args.output.rstrip("/") + "/"
+    else:
+        main_output_folder = create_main_output_folder(input_folder)
+    write_settings_file(settings, advanced_settings, input_folder, datasets, file_list, main_output_folder)
+
+    errors = []
+    def collect_result(results:dict):
+        if not results["run_complete"]:
+            errors.append(results["dataset"])
+        print_result(results)
+
+    run_datasets(input_folder=input_folder,
+                 datasets=datasets,
+                 files=[input_folder + "/" + file for file in file_list],
+                 settings=settings,
+                 advanced_settings=advanced_settings,
+                 main_output_folder=main_output_folder,
+                 result_callback=collect_result,
+                 workers=args.workers,
+                 spot_table_cache=get_spot_table_cache(args),
+                 profile=args.profile,
+                 )
+    print(F"Processing Finished, {len(errors)} errors occurred! results at {main_output_folder}")
+    return 1 if errors else 0
+
+
+def sweep(args:argparse.Namespace)->int:
+    import pandas as pd
+    from sweep import SWEEP_PARAMETERS, sweep_quality_control
+
+    settings, advanced_settings = build_settings(args)
+    input_folder, file_list, datasets = find_datasets(args, settings)
+    grid = {name: getattr(args, f"{name}_values") for name in SWEEP_PARAMETERS
+            if getattr(args, f"{name}_values") is not None}
+    spot_table_cache = get_spot_table_cache(args)
+    files = [input_folder + "/" + file for file in file_list]
+
+    tables = []
+    for dataset in datasets:
+        print(F'sweeping {dataset}', flush=True)
+        table = sweep_quality_control(input_folder, dataset, files, settings, advanced_settings, grid,
+                                      spot_table_cache=spot_table_cache)
+        table.insert(0, "dataset", dataset)
+        tables.append(table)
+    table = pd.concat(tables, ignore_index=True)
+
+    output_file = args.output or os.path.join(input_folder, "quality_control_sweep.csv")
+    table.to_csv(output_file, index=False)
+    print(table.to_string(index=False))
+    print(F"Sweep Finished, {len(table)} combinations written to {output_file}")
+    return 0
+
+
+def add_input_arguments(parser:argparse.ArgumentParser):
+    """
+    arguments of the input files and the analysis settings, shared by all commands
+    """
+    parser.add_argument("--input", required=True, help="folder with TrackMate spot tables")
+    parser.add_argument("--settings", help="settings file (json), e.g. used_settings.json of a previous run")
+    parser.add_argument("--dataset", nargs="+", help="only analyze these datasets")
+    parser.add_argument("--no-cache", dest="no_cache", action="store_true",
+                        help="always parse the csv files, do not use the cache of parsed input files")
+    parser.add_argument("--cache-dir", dest="cache_dir", default=DEFAULT_CACHE_DIR,
+                        help="folder for cached input files")
+    parser.add_argument("--cache-size", dest="cache_size", type=float, default=DEFAULT_CACHE_SIZE / 10**9,
+                        help="maximum size of the cache in GB, least recently used files are removed")
+    parser.add_argument("--channels", nargs="+", help="channel names, in channel order")
+    parser.add_argument("--tracking-channel", dest="tracking_channel", type=int,
+                        help="number of tracking channel (starting at 1), default: last channel")
+    parser.add_argument("--min-len", dest="min_len", type=int, help="minimum timepoints per track")
+    parser.add_argument("--interval", dest="tracking_interval", type=float, help="tracking interval (min)")
+    parser.add_argument("--digits", type=int, help="digits of replicate numbers")
+    parser.add_argument("--delimiter", help="delimiter before replicate numbers")
+    parser.add_argument("--suffix", help="file suffix, e.g. -spots.csv")
+    parser.add_argument("--transform", action="store_true", default=None, help="transform timepoints")
+    parser.add_argument("--no-transform", dest="transform", action="store_false", default=None)
+    parser.add_argument("--size-jump-threshold", dest="size_jump_threshold", type=float)
+    parser.add_argument("--tracking-marker-jump-threshold", dest="tracking_marker_jump_threshold", type=float)
+    parser.add_argument("--tracking-marker-division-peak-threshold",
+                        dest="tracking_marker_division_peak_threshold", type=float)
+    parser.add_argument("--track-store", dest="track_store", choices=["auto", "dense", "ragged"],
+                        help="time series as frames x tracks tables (dense) or only the frames of each track "
+                             "(ragged, less memory for short or staggered tracks), default: auto")
+
+
+def create_parser()->argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="TrackMate PostProcessor without GUI")
+    parser.add_argument("--logger", type=str, choices=["info", "debug"],
+                        default="info", help="Logging Mode")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="analyze all datasets of an input folder")
+    add_input_arguments(run_parser)
+    run_parser.add_argument("--output", help="output folder, default: new results folder in input folder")
+    run_parser.add_argument("--workers", type=int, default=1,
+                            help="number of datasets analyzed in parallel (separate processes)")
+    run_parser.add_argument("--output-format", dest="output_formats", nargs="+", choices=list(OUTPUT_FORMATS),
+                            help="result file formats, default: xlsx")
+    run_parser.add_argument("--long-layout", dest="long_layout", action="store_true", default=None,
+                            help="write time series as (TRACK_ID, FRAME, value) rows instead of a column per cell")
+    run_parser.add_argument("--no-raw-all-cells", dest="write_raw_all_cells", action="store_false", default=None,
+                            help="do not write the raw time series of all cells ({channel}_raw_all_cells)")
+    run_parser.add_argument("--no-figures", dest="render_figures", action="store_false", default=None,
+                            help="do not render the overview figure of each dataset")
+    run_parser.add_argument("--profile", action="store_true",
+                            help="write cProfile stats of each dataset ({dataset}_profile.prof in its output folder)")
+    run_parser.add_argument("--heatmap-pooling", dest="heatmap_pooling", choices=list(HEATMAP_POOLING_OPTIONS),
+                            help="combine neighbouring cells of overview heatmaps with more cells than pixel rows "
+                                 "by their mean or max, default: mean")
+    run_parser.set_defaults(func=run)
+
+    sweep_parser = subparsers.add_parser("sweep", help="numbers of approved cells, divisions and flags for "
+                                                       "combinations of thresholds and minimum lengths")
+    add_input_arguments(sweep_parser)
+    sweep_parser.add_argument("--output", help="csv file of the table, default: quality_control_sweep.csv "
+                                               "in the input folder")
+    sweep_parser.add_argument("--size-jump-thresholds", dest="size_jump_threshold_values", nargs="+", type=float)
+    sweep_parser.add_argument("--tracking-marker-jump-thresholds", dest="tracking_marker_jump_threshold_values",
+                              nargs="+", type=float)
+    sweep_parser.add_argument("--tracking-marker-division-peak-thresholds",
+                              dest="tracking_marker_division_peak_threshold_values", nargs="+", type=float)
+    sweep_parser.add_argument("--min-lens", dest="min_len_values", nargs="+", type=int,
+                              help="minimum timepoints per track, parameters without values are taken from the "
+                                   "settings (file or single value flags)")
+    sweep_parser.set_defaults(func=sweep)
+    return parser
+
+
+def main(argv=None)->int:
+    args = create_parser().parse_args(argv)
+    if args.logger == "debug":
+        logger.setLevel(logging.DEBUG)
+    else:
+        logger.setLevel(logging.INFO)
+    try:
+        return args.func(args)
+    except (ValueError, FileNotFoundError) as err:
+        logger.error(str(err))
+        print(F"Error: {err}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import os
+import numpy as np
+import pandas as pd
+from matplotlib import colormaps
+from matplotlib.colors import Normalize
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from settings import HEATMAP_POOLING_OPTIONS
+
+OVERVIEW_FIGURE_SIZE = (30, 5)
+# the figure is rendered once at OVERVIEW_FIGURE_DPI, the thumbnail shown in the GUI is scaled down from it
+OVERVIEW_FIGURE_DPI = 300
+THUMBNAIL_DPI = 50
+
+HEATMAP_COLORMAP = "viridis"
+HEATMAP_MIN, HEATMAP_MAX = 0.2, 2.6
+# heatmaps of more cells than pixels in the figure height are pooled to one row per pixel
+HEATMAP_MAX_ROWS = OVERVIEW_FIGURE_SIZE[1] * OVERVIEW_FIGURE_DPI
+
+
+def get_overview_figure_paths(output_folder:str, dataset_name:str)->tuple[str, str]:
+    """
+    :return: path of the thumbnail, path of the high resolution figure
+    """
+    return (os.path.join(output_folder, f'overview_accepted_cells_{dataset_name}.png'),
+            os.path.join(output_folder, f'overview_accepted_cells_{dataset_name}(high_res).png'))
+
+
+def sort_by_peak(time_series:np.ndarray)->np.ndarray:
+    """
+    :param time_series: frames x cells
+    :return: cells x frames, cells sorted by the frame of their maximum (NaN are skipped)
+    """
+    peak_rows = np.argmax(np.where(np.isnan(time_series), -np.inf, time_series), axis=0)
+    return time_series.T[np.argsort(peak_rows)]
+
+
+def pool_rows(values:np.ndarray, max_rows:int, pooling:str="mean")->np.ndarray:
+    """
+    :param pooling: "mean" or "max" of consecutive rows, NaN are skipped
+    :return: values with at most max_rows rows
+    """
+    if pooling not in HEATMAP_POOLING_OPTIONS:
+        raise ValueError(f"heatmap_pooling has to be one of {HEATMAP_POOLING_OPTIONS}, not {pooling}")
+    if len(values) <= max_rows:
+        return values
+    group_starts = np.arange(max_rows) * len(values) // max_rows
+    if pooling == "max":
+        return np.fmax.reduceat(values, group_starts, axis=0)
+    valid = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(valid, values, 0), group_starts, axis=0)
+    counts = np.add.reduceat(valid, group_starts, axis=0, dtype=np.int64)
+    with np.errstate(invalid="ignore"):
+        return sums / counts
+
+
+def get_overview_figure_data(dataset_name:str, signals_rel:dict[str, pd.DataFrame],
+                             signals_cleaned:dict[str, pd.DataFrame], main_channels:list[str],
+                             tracking_marker:str, frame_count:int, interval:float,
+                             heatmap_pooling:str="mean")->dict:
+    """
+    collects the arrays plotted in the overview figure, small enough to be sent to a render process
+    :param signals_rel: normalized, smoothened time series of the approved cells per color (frames x cells)
+    :param signals_cleaned: raw time series of the approved cells per color (frames x cells)
+    :param frame_count: number of frames of the x axis
+    :param interval: tracking interval in minutes
+    :param heatmap_pooling: "mean" or "max", how cells are combined if there are more cells than heatmap rows
+    """
+    channels = {}
+    for color in main_channels:
+        heatmap = sort_by_peak(signals_rel[color].to_numpy(dtype=np.float64))
+        channels[color] = {"heatmap": pool_rows(heatmap, HEATMAP_MAX_ROWS, heatmap_pooling),
+                           "cells": len(heatmap),
+                           "mean": signals_rel[color].mean(axis=1).to_numpy(),
+                           "median": signals_rel[color].median(axis=1).to_numpy(),
+                           "cell_means": signals_cleaned[color].mean().to_numpy()}
+    return {"dataset_name": dataset_name,
+            "channels": channels,
+            "cell_count": signals_rel[tracking_marker].count(axis=1).to_numpy(),
+            "frame_count": frame_count,
+            "interval": interval}
+
+
+def render_overview_figure(figure_data:dict, output_folder:str)->str:
+    """
+    renders the overview figure without pyplot (safe outside the main thread and in worker processes)
+    :param figure_data: from get_overview_figure_data
+    :return: path of the thumbnail
+    """
+    from PIL import Image
+
+    main_channels = list(figure_data["channels"])
+    nsubplots = 2 * len(main_channels) + 2
+
+    fig = Figure(figsize=OVERVIEW_FIGURE_SIZE)
+    FigureCanvasAgg(fig)
+    axs = fig.subplots(1, nsubplots)
+    for i, (color, channel_data) in enumerate(figure_data["channels"].items()):
+
+        #plot heatmap, colored in advance, rows are cells (or pooled cells)
+        ax = axs[2 * i]
+        ax.imshow(heatmap_to_rgba(channel_data["heatmap"]), interpolation='nearest', aspect="auto",
+                  extent=(-0.5, channel_data["heatmap"].shape[1] - 0.5, channel_data["cells"] - 0.5, -0.5))
+        ax.set_title(F"{color} Rel. Signals")
+        ax.set_ylabel("#cells")
+        ax.set_xlabel("[h]")
+
+        ax = axs[2 * i + 1]
+        ax.plot(channel_data["mean"], c="red", label="mean")
+        ax.plot(channel_data["median"], c="green", label="median")
+        ax.legend()
+        ax.set_title(F"{color} normalized")
+        ax.set_ylabel("Amplitude")
+        ax.set_xlabel("[h]")
+        ax.set_ylim([0.3, 2.5])
+
+    axs[nsubplots - 2].plot(figure_data["cell_count"])
+    axs[nsubplots - 2].set_title("Cell Count")
+    axs[nsubplots - 2].set_ylabel("# cells")
+    axs[nsubplots - 2].set_xlabel("[h]")
+
+    for i, channel_data in enumerate(figure_data["channels"].values()):
+        axs[nsubplots - 1].boxplot(channel_data["cell_means"], positions=[i + 1, ])
+    axs[nsubplots - 1].set_xticks(list(range(1, len(main_channels) + 1)))
+    axs[nsubplots - 1].set_xticklabels(main_channels)
+    axs[nsubplots - 1].set_title("Mean Signal")
+    axs[nsubplots - 1].set_ylabel("a.u.")
+    axs[nsubplots - 1].set_xlim(0.5, 0.5+len(main_channels))
+
+    for ax in fig.get_axes()[:-1]:
+        make_ax_circadian(ax, figure_data["frame_count"], interval=figure_data["interval"])
+    fig.suptitle(F'{figure_data["dataset_name"]}')
+
+    thumbnail_path, high_res_path = get_overview_figure_paths(output_folder, figure_data["dataset_name"])
+    fig.savefig(high_res_path, dpi=OVERVIEW_FIGURE_DPI)
+    with Image.open(high_res_path) as high_res:
+        scale = THUMBNAIL_DPI / OVERVIEW_FIGURE_DPI
+        thumbnail = high_res.resize((round(high_res.width * scale), round(high_res.height * scale)),
+                                    Image.LANCZOS)
+    thumbnail.save(thumbnail_path)
+    return thumbnail_path
+
+
+def heatmap_to_rgba(heatmap:np.ndarray)->np.ndarray:
+    """
+    :return: RGBA image (uint8), NaN are transparent
+    """
+    return colormaps[HEATMAP_COLORMAP](Normalize(HEATMAP_MIN, HEATMAP_MAX)(heatmap), bytes=True)
+
+
+def make_ax_circadian(ax, data_count:int, interval:float):
+    """
+    x axis in hours (ticks every 12 h) for time series plotted over frames, also used by the preview of the
+    advanced settings
+    :param data_count: number of frames
+    :param interval: tracking interval in minutes
+    """
+    ax.set_xlabel("[h]")
+    max_time = int(data_count*interval/60)
+    x_ticks = np.array(range(0,max_time,12), dtype=float)/(interval/60)
+    x_tick_labels = list(range(0,max_time,12))
+
+    ax.set_xticks(x_ticks)
+    ax.set_xticklabels(x_tick_labels)
+    ax.set_xlim(0,data_count)
+
+    ax.grid()
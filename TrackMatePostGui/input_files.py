@@ -0,0 +1,34 @@
+"""
+input files of a folder and the datasets they belong to, without pandas so the GUI can list them right away
+"""
+import os
+
+
+def get_datasets_from_file_list(file_list:list, separator:str, digits:int, suffix:str)->list[str]:
+    if not digits:
+        #each file is an individual dataset
+        return file_list
+    else:
+        #look for datasets (groups of files with same name pattern)
+        file_list = [file.split(suffix)[0] for file in file_list]
+
+        #check for number of digits
+        try:
+            for file in file_list:
+                int(file[-int(digits):])
+        except ValueError:
+            raise ValueError(f'problem with file {file}\n, wrong amount of digits ?')
+        file_list = [file[:-int(digits)] for file in file_list]
+
+        #check for separator
+        if separator:
+            for file in file_list:
+                if not file.endswith(separator):
+                    raise ValueError(f'problem with file {file}\n separator not found')
+            file_list = [separator.join(file.split(separator)[:-1]) for file in file_list]
+        return list(set(file_list))
+
+
+def list_input_files(input_folder:str, suffix:str)->list[str]:
+    files = [file for file in os.listdir(input_folder) if os.path.isfile(input_folder + "/" + file)]
+    return [file for file in files if file.endswith(suffix)]
@@ -1,13 +1,55 @@
+import atexit
+import functools
 import logging
 import os
+import getpass
+import multiprocessing
+import queue
 import socket
-from logging.handlers import RotatingFileHandler
+import threading
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+
+
+@functools.lru_cache(maxsize=None)
+def get_user()->str:
+    # os.getlogin() needs a controlling terminal, fails on compute nodes/cron jobs
+    try:
+        return os.getlogin()
+    except OSError:
+        try:
+            return getpass.getuser()
+        except Exception:
+            return "unknown"
+
+
+@functools.lru_cache(maxsize=None)
+def get_hostname()->str:
+    try:
+        return socket.gethostname()
+    except OSError:
+        return "unknown"
+
+
+def get_ip()->str:
+    try:
+        return socket.gethostbyname(get_hostname())
+    except OSError:
+        return "unknown"
 
 
 class ContextFilter(logging.Filter):
+    """
+    adds user and hostname to each record, resolved once
+    """
+    def __init__(self):
+        super().__init__()
+        self.user = get_user()
+        self.hostname = get_hostname()
+
     def filter(self, record):
-        record.user = os.getlogin()  # Get current OS username
-        record.hostname = socket.gethostname()  # Get hostname
+        record.user = self.user
+        record.hostname = self.hostname
         return True  # Must return True to allow logging
 
 class SafeRotatingFileHandler(RotatingFileHandler):
@@ -20,32 +62,78 @@ class SafeRotatingFileHandler(RotatingFileHandler):
             print(f'  {record.getMessage()}')
 
 
+def is_worker_process()->bool:
+    # processes started by multiprocessing (parallel datasets, figures, manager, see runner.py) import this
+    # module again, only the main process writes the log files. Their name is set before they import the main
+    # module (parent_process() is only set afterwards)
+    return multiprocessing.current_process().name != "MainProcess"
+
+
+def log_to_queue(worker_queue, level:int):
+    """
+    in worker processes: sends the records to the main process, which writes them to the log files
+    :param worker_queue: queue of listen_to_workers, e.g. passed as initargs of a ProcessPoolExecutor
+    :param level: level of the logger in the main process
+    """
+    logger.handlers.clear()
+    logger.addHandler(QueueHandler(worker_queue))
+    logger.setLevel(level)
+
+
+@contextmanager
+def listen_to_workers(worker_queue):
+    """
+    writes the records worker processes put into worker_queue (see log_to_queue) to the log files
+    while the context is active
+    :param worker_queue: e.g. multiprocessing.Manager().Queue()
+    """
+    listener = QueueListener(worker_queue, *log_handlers, respect_handler_level=True)
+    listener.start()
+    try:
+        yield worker_queue
+    finally:
+        listener.stop()
+
+
 #create a logger
 logger = logging.getLogger("TM_post_logger")
 logger.setLevel(logging.INFO)
 formatter = logging.Formatter("%(asctime)s - %(levelname)s - [User: %(user)s @ %(hostname)s] - %(message)s")
+logger.addFilter(ContextFilter())
 
 # create/access log files
 main_dir = os.path.dirname(os.path.abspath(__file__))
 log_dir = os.path.join(main_dir, "logs")
-os.makedirs(log_dir, exist_ok=True)
 main_log_file = os.path.join(log_dir,"main.log")
 error_log_file = os.path.join(log_dir,"errors.log")
+# file handlers of the main process, none in worker processes
+log_handlers = []
 
-# General log handler (appends)
-general_handler = SafeRotatingFileHandler(main_log_file, maxBytes=10**7, backupCount=2)
-general_handler.setLevel(logging.DEBUG)
-general_handler.setFormatter(formatter)
+if not is_worker_process():
+    os.makedirs(log_dir, exist_ok=True)
 
-# Error log handler (appends)
-error_handler = SafeRotatingFileHandler(error_log_file, maxBytes=10**7, backupCount=2)
-error_handler.setLevel(logging.ERROR)  # Only log error events
-error_handler.setFormatter(formatter)
+    # General log handler (appends)
+    general_handler = SafeRotatingFileHandler(main_log_file, maxBytes=10**7, backupCount=2, delay=True)
+    general_handler.setLevel(logging.DEBUG)
+    general_handler.setFormatter(formatter)
 
-# Add handlers to logger
-logger.addFilter(ContextFilter())
-logger.addHandler(general_handler)
-logger.addHandler(error_handler)
+    # Error log handler (appends)
+    error_handler = SafeRotatingFileHandler(error_log_file, maxBytes=10**7, backupCount=2, delay=True)
+    error_handler.setLevel(logging.ERROR)  # Only log error events
+    error_handler.setFormatter(formatter)
+    log_handlers = [general_handler, error_handler]
+
+    # records are put into a queue, the files are written by a background thread (file access does not block
+    # the analysis or the GUI), remaining records are written at exit
+    log_queue = queue.SimpleQueue()
+    log_listener = QueueListener(log_queue, *log_handlers, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+
+    # Add handlers to logger
+    logger.addHandler(QueueHandler(log_queue))
 
-logger.info(f"System started by {os.getlogin()} on {socket.gethostname()} "
-            f"with IP: {socket.gethostbyname(socket.gethostname())}")
\ No newline at end of file
+    logger.info("System started by %s on %s", get_user(), get_hostname())
+    # the IP is looked up in the background, the DNS lookup can stall on hosts without working DNS
+    threading.Thread(target=lambda: logger.info("IP of %s: %s", get_hostname(), get_ip()),
+                     name="log_ip", daemon=True).start()
\ No newline at end of file
@@ -1,8 +1,7 @@
 import logging
 import argparse
 import os.path
-import time, datetime
-from idlelib.help import HelpWindow
+import threading
 
 from PyQt5.QtWidgets import (QApplication,
 
@@ -14,17 +13,39 @@ from PyQt5.QtWidgets import (QApplication,
                              QMessageBox, QCheckBox, QButtonGroup, QGroupBox, QRadioButton
                              )
 import traceback, sys
-from methods import *
 from classes import *
 from logger import logger
+from settings import DEFAULT_ADVANCED_SETTINGS
+from progress import CancellationToken
+from input_files import get_datasets_from_file_list, list_input_files
+# runner, cache, writers and preview import pandas, numpy and matplotlib (seconds on network drives),
+# they are imported where used and preloaded in the background once the window is shown
+
+
+def preload_analysis_modules()->threading.Thread:
+    """
+    imports the analysis modules in a background thread, so the window opens without waiting for them
+    and they are ready when the first folder is chosen
+    :return: the started thread
+    """
+    def preload():
+        import runner
+        import preview
+        logger.debug("analysis modules loaded")
+
+    thread = threading.Thread(target=preload, name="preload", daemon=True)
+    thread.start()
+    return thread
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, profile:bool=False):
         super().__init__()
 
-        #variable to break execution
-        self.keep_running = True
+        #set to break execution, a new one for every run
+        self.cancellation_token = CancellationToken()
+        # cProfile stats per dataset (--profile)
+        self.profile = profile
 
         #multithreading
         self.threadpool = QThreadPool()
@@ -35,11 +56,10 @@ class MainWindow(QMainWindow):
         self.file_list = []
         self.dataset_list=[]
         self.input_file_suffix = ""
-        self.advanced_settings={
-            "size_jump_threshold"  : 0.2,
-            "tracking_marker_jump_threshold" : 0.18,
-            "tracking_marker_division_peak_threshold": 1.5,
-            }
+        self.advanced_settings=dict(DEFAULT_ADVANCED_SETTINGS)
+        # pivoted time series of analyzed datasets, a rerun with other thresholds skips loading them
+        # created with the first run or preview (see get_session_cache)
+        self.session_cache = None
 
     # set main layout
         self.setWindowTitle("TrackMate PostProcessor")
@@ -71,6 +91,17 @@ class MainWindow(QMainWindow):
         self.transform_checkbox = QCheckBox("Transform timepoints")
         layout.addWidget(self.transform_checkbox)
 
+    # number of datasets analyzed in parallel
+        layout.addLayout(self.create_layout_workers())
+
+    # keep parsed input files on disk, repeated runs skip reading the csv files
+        self.cache_checkbox = QCheckBox("Cache parsed input files")
+        self.cache_checkbox.setChecked(True)
+        layout.addWidget(self.cache_checkbox)
+
+    # result file formats
+        layout.addWidget(self.create_outputGroupBox())
+
     # advanced settings button
         layout.addWidget(self.create_push_button('Advanced settings', self.open_advanced_settings))
 
@@ -108,7 +139,8 @@ class MainWindow(QMainWindow):
         self.advanced_settings.update(settings_to_update)
 
     def stop_execution(self):
-        self.keep_running = False
+        # running datasets stop at their next stage or loop step
+        self.cancellation_token.cancel()
 
     def create_layout_folder_selection(self):
         layout_folder_selection = QHBoxLayout()
@@ -126,6 +158,8 @@ class MainWindow(QMainWindow):
             return
         else:
             self.selected_folder = new_folder
+            if self.session_cache is not None:
+                self.session_cache.clear()
             folder_label = ""
             for i in range(0,181,50):
                 try:
@@ -168,7 +202,7 @@ class MainWindow(QMainWindow):
                 #self.input_file_suffix_entry.setText(button.text())
         if self.use_other_suffix_radiobutton.isChecked():
             self.input_file_suffix = self.input_file_suffix_entry.text()
-        logger.debug(f"suffix {self.input_file_suffix}")
+        logger.debug("suffix %s", self.input_file_suffix)
         self.search_input_folder()
 
 
@@ -177,38 +211,18 @@ class MainWindow(QMainWindow):
         self.suffix_button_toggled()
 
 
-    def search_input_folder(self):
+    def get_session_cache(self):
+        if self.session_cache is None:
+            from cache import SessionCache
+            self.session_cache = SessionCache()
+        return self.session_cache
 
-        def get_datasets_from_file_list(file_list:list, separator:str, digits:int, suffix:str)->list[str]:
-            if not digits:
-                #each file is an individual dataset
-                return file_list
-            else:
-                #look for datasets (groups of files with same name pattern)
-                file_list = [file.split(suffix)[0] for file in file_list]
-
-                #check for number of digits
-                try:
-                    for file in file_list:
-                        int(file[-int(digits):])
-                except ValueError:
-                    raise ValueError(f'problem with file {file}\n, wrong amount of digits ?')
-                file_list = [file[:-int(digits)] for file in file_list]
-
-                #check for separator
-                if separator:
-                    for file in file_list:
-                        if not file.endswith(separator):
-                            raise ValueError(f'problem with file {file}\n separator not found')
-                    file_list = [separator.join(file.split(separator)[:-1]) for file in file_list]
-                return list(set(file_list))
-        #
+    def search_input_folder(self):
         if not os.path.exists(self.selected_folder):
             return
         #list search subfolders
         datasets = []
-        files = [file for file in os.listdir(self.selected_folder) if os.path.isfile(self.selected_folder +"/" + file)]
-        files = [file for file in files if file.endswith(self.input_file_suffix)]
+        files = list_input_files(self.selected_folder, self.input_file_suffix)
         if files:
             try:
                 datasets = get_datasets_from_file_list(file_list=files,
@@ -343,6 +357,46 @@ class MainWindow(QMainWindow):
 
         return layout_minlen_and_interval
 
+    def create_layout_workers(self):
+        layout_workers = QHBoxLayout()
+        self.spinbox_workers = QSpinBox()
+        self.spinbox_workers.setMinimum(1)
+        self.spinbox_workers.setMaximum(os.cpu_count() or 1)
+        self.spinbox_workers.setValue(1)
+        workers_label = QLabel("Datasets in parallel (processes)")
+
+        layout_workers.addWidget(workers_label)
+        layout_workers.addWidget(self.spinbox_workers)
+        return layout_workers
+
+    def create_outputGroupBox(self):
+        outputGroupBox = QGroupBox("Output Files")
+        self.output_format_checkboxes = {"xlsx": QCheckBox("xlsx"),
+                                         "csv": QCheckBox("csv.gz"),
+                                         "parquet": QCheckBox("parquet")}
+        self.output_format_checkboxes["xlsx"].setChecked(True)
+        self.long_layout_checkbox = QCheckBox("long layout")
+        self.long_layout_checkbox.setToolTip("time series as (TRACK_ID, FRAME, value) rows "
+                                             "instead of a column per cell")
+        self.raw_all_cells_checkbox = QCheckBox("raw tables of all cells")
+        self.raw_all_cells_checkbox.setChecked(True)
+        self.render_figures_checkbox = QCheckBox("overview figures")
+        self.render_figures_checkbox.setChecked(True)
+
+        output_layout = QHBoxLayout()
+        for checkbox in self.output_format_checkboxes.values():
+            output_layout.addWidget(checkbox)
+        output_layout.addWidget(self.long_layout_checkbox)
+        output_layout.addWidget(self.raw_all_cells_checkbox)
+        output_layout.addWidget(self.render_figures_checkbox)
+        outputGroupBox.setLayout(output_layout)
+        outputGroupBox.setFlat(True)
+        return outputGroupBox
+
+    def get_output_formats(self)->list[str]:
+        return [output_format for output_format, checkbox in self.output_format_checkboxes.items()
+                if checkbox.isChecked()]
+
     def create_push_button(self, label, button_func):
         button = QPushButton(label)
         button.clicked.connect(button_func)
@@ -355,15 +409,17 @@ class MainWindow(QMainWindow):
         return self.progress_bar
 
     def check_inputs(self):
+        from writers import check_output_formats
         if not self.dataset_list:
             raise FileNotFoundError("Found no Dataset to Process")
         try:
             float(self.input_interval.text())
         except:
             raise ValueError("Please provide valid Tracking Interval")
+        check_output_formats(self.get_output_formats())
 
     def execute(self):
-        self.keep_running = True
+        self.cancellation_token = CancellationToken()
         self.errors = 0
         self.error_report = ""
 
@@ -377,14 +433,18 @@ class MainWindow(QMainWindow):
         self.progress_window = ProgressWindow()
         self.progress_window.scroll_label.set_text("Started Processing...")
         self.progress_window.show()
-        worker = Worker(self.run_main)  # Any other args, kwargs are passed to the run function
+        # widgets are read here, run_main runs in the worker thread (kwargs are passed to the run function)
+        worker = Worker(self.run_main, settings=self.read_settings(), workers=self.spinbox_workers.value(),
+                        use_cache=self.cache_checkbox.isChecked())
         worker.signals.progress.connect(self.progress_fn)
         worker.signals.result.connect(self.result_fn)
+        worker.signals.figure.connect(self.figure_fn)
+        worker.signals.finished.connect(self.finished_fn)
 
         # Execute
         self.threadpool.start(worker)
 
-    def progress_fn(self, n:int):
+    def progress_fn(self, n:float):
 
         self.progress_window.progress_bar.setValue(int(100*n/len(self.dataset_list)))
         self.progress_bar.setValue(int(100*n/len(self.dataset_list)))
@@ -404,41 +464,28 @@ class MainWindow(QMainWindow):
                 logger.error("UNKNOWN ERROR")
         else:
             result_text+= F'  approved_cells: {results["approved_cells"]}/{results["all_cells"]}\n'
+            if results["failed_division_windows"]:
+                result_text += F'  divisions not smoothened (out of bounds): {results["failed_division_windows"]}\n'
 
         self.progress_window.scroll_label.add_text(result_text)
         logger.info(result_text.replace('\n', ' '))
 
-        if results["run_complete"]:
-            self.progress_window.set_fig(results["fig_path"])
-
-    def write_settings_file(self, settings, output_folder:str):
-        settings_file_path = os.path.join(output_folder, "used_settings.txt")
-        with open(settings_file_path, "w") as used_settings_file:
-            settings_text = (
-                f'input folder: {self.selected_folder}\n'
-                f'number of channels: {settings.number_channels}\n'
-                f'tracking channel: {settings.tracking_channel}')
-            for n in range(1,settings.number_channels+1):
-                settings_text += f"Name Channel {n}: {settings.channel_names[n]}\n"
-            settings_text += (
-                f'minimum time points: {settings.min_len}\n'
-                f'tracking interval: {settings.tracking_interval}\n'
-                f'number of digits: {settings.digits}\n'
-                f'delimiter: {settings.delimiter}\n'
-                f'transform timepoints: {settings.transform}'
-                f'file_suffix: {settings.suffix}')
-            for setting_name, value in self.advanced_settings.items():
-                settings_text += f"{setting_name}: {value}\n"
-            settings_text += "\nDATASETS:\n"
-            for dataset in self.dataset_list:
-                settings_text+=f'  {dataset}\n'
-
-            settings_text += "\nFILES:\n"
-            for file in self.file_list:
-                settings_text += f'  {file}\n'
-
-            used_settings_file.writelines(settings_text)
-            logger.info(f'settings stored at {settings_file_path}')
+    def figure_fn(self, results:dict):
+        self.progress_window.set_fig(results["fig_path"])
+
+    def finished_fn(self, completed:bool):
+        # after result_fn of all datasets (signals of the worker arrive in order)
+        if not completed:
+            self.progress_window.scroll_label.add_text("\nProcessing Stopped!".upper())
+            return
+
+        finish_text = F"\nProcessing Finished\n {self.errors} errors occurred!"
+        self.progress_window.scroll_label.add_text(finish_text)
+        logger.info(finish_text.replace('\n', ' '))
+
+        if self.error_report:
+            self.progress_window.scroll_label.add_text(F"Errors:\n {self.error_report}")
+            logger.error(F"Errors: {self.error_report}")
 
     def read_settings(self)->Settings:
         settings_dict=\
@@ -452,56 +499,50 @@ class MainWindow(QMainWindow):
                 "digits": self.subset_digits,
                 "delimiter": self.subset_separator,
                 "transform": self.transform_checkbox.isChecked(),
-                "suffix": self.input_file_suffix
-
+                "suffix": self.input_file_suffix,
+                "output_formats": self.get_output_formats(),
+                "long_layout": self.long_layout_checkbox.isChecked(),
+                "write_raw_all_cells": self.raw_all_cells_checkbox.isChecked(),
+                "render_figures": self.render_figures_checkbox.isChecked(),
             }
         settings = Settings(**settings_dict)
         return settings
 
 
-    def run_main(self, progress_callback, result_callback):
-        settings = self.read_settings()
+    def run_main(self, settings:Settings, workers:int, use_cache:bool,
+                 progress_callback, result_callback, figure_callback)->bool:
+        """
+        runs in the worker thread, the GUI is only updated through the signals of the worker
+        :param workers: number of datasets analyzed in parallel
+        :param use_cache: cache parsed input files (see cache.SpotTableCache)
+        :return: True if all datasets were processed, False if stopped
+        """
+        from cache import SpotTableCache
+        from runner import create_main_output_folder, run_datasets, write_settings_file
         datasets = self.dataset_list
         files = [self.selected_folder + "/" + file for file in self.file_list]
 
-        now = datetime.datetime.now()
-        main_output_folder = create_folder(self.selected_folder + "/" + f"grouped_results(post_script_output_"
-                                                                        f"{now:%y-%m-%d_%H-%M})/")
-
-        self.write_settings_file(settings, main_output_folder)
-
-        logger.info(f"Start processing {len(files)} files from {len(datasets)} datasets")
-        logger.info(f"data will be stored at {main_output_folder}")
-        logger.info(f"Settings are: {settings}")
-
-        for i, dataset in enumerate(sorted(datasets[:])):
-            # analyze dataset
-            if not self.keep_running:
-
-                time.sleep(3)
-                self.progress_window.scroll_label.add_text("\nProcessing Stopped!".upper())
-                logger.info("process aborted manually")
-
-                return
-            results = analyze_dataset(input_folder=self.selected_folder,
-                            dataset_name=dataset,
-                            files=files,
-                            settings = settings,
-                            main_output_folder=main_output_folder,
-                            advanced_settings = self.advanced_settings,
-
-                          )
-            progress_callback.emit(int(i+1))
-            result_callback.emit(results)
-        time.sleep(2)
-
-        finish_text = F"\nProcessing Finished\n {self.errors} errors occurred!"
-        self.progress_window.scroll_label.add_text(finish_text)
-        logger.info(finish_text.replace('\n', ' '))
-
-        if self.error_report:
-            self.progress_window.scroll_label.add_text(F"Errors:\n {self.error_report}")
-            logger.error(F"Errors: {self.error_report}")
+        main_output_folder = create_main_output_folder(self.selected_folder)
+
+        write_settings_file(settings, self.advanced_settings, self.selected_folder,
+                            datasets, self.file_list, main_output_folder)
+
+        completed = run_datasets(input_folder=self.selected_folder,
+                                 datasets=datasets,
+                                 files=files,
+                                 settings=settings,
+                                 advanced_settings=self.advanced_settings,
+                                 main_output_folder=main_output_folder,
+                                 progress_callback=progress_callback.emit,
+                                 result_callback=result_callback.emit,
+                                 figure_callback=figure_callback.emit,
+                                 cancellation_token=self.cancellation_token,
+                                 workers=workers,
+                                 spot_table_cache=SpotTableCache() if use_cache else None,
+                                 session_cache=self.get_session_cache(),
+                                 profile=self.profile,
+                                 )
+        return completed
 
     def show_error(self, text:str):
         msg = QMessageBox(parent=self)
@@ -511,24 +552,29 @@ class MainWindow(QMainWindow):
         msg.setWindowTitle("Error")
         msg.exec_()
 
-parser = argparse.ArgumentParser()
-parser.add_argument("--logger", type=str, choices= ["info", "debug"],
-                    default="info", help="Logging Mode")
-args = parser.parse_args()
-
-
-if args.logger=="debug":
-    logger.setLevel(logging.DEBUG)
-else:
-    logger.setLevel(logging.INFO)
-
 BASEDIR = os.path.dirname(os.path.abspath(__file__))
 
-app = QApplication(sys.argv)
-try:
-    window = MainWindow()
-    window.show()
-    app.exec()
-except Exception as err:
-    traceback.print_exc()
-    raise Exception from err
+# guard needed, worker processes for parallel datasets import this module
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logger", type=str, choices= ["info", "debug"],
+                        default="info", help="Logging Mode")
+    parser.add_argument("--profile", action="store_true",
+                        help="write cProfile stats of each dataset ({dataset}_profile.prof in its output folder)")
+    args = parser.parse_args()
+
+
+    if args.logger=="debug":
+        logger.setLevel(logging.DEBUG)
+    else:
+        logger.setLevel(logging.INFO)
+
+    app = QApplication(sys.argv)
+    try:
+        window = MainWindow(profile=args.profile)
+        window.show()
+        preload_analysis_modules()
+        app.exec()
+    except Exception as err:
+        traceback.print_exc()
+        raise Exception from err
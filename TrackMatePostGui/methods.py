@@ -1,26 +1,54 @@
-import re
+import threading
 import traceback
-from typing import Optional
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Union
 import pandas as pd
 import numpy as np
 import os
-from matplotlib import pyplot as plt
 import logging
 from logger import logger
-from classes import Settings
+from settings import Settings
+from cache import SpotTableCache, SessionCache, get_file_identity
+from tracks import TrackStore, ragged_pivot_spot_table, get_fill_ratio
+from writers import write_result_tables
+from figures import get_overview_figure_data
+from profiling import DatasetReport, profile_to
+from progress import AnalysisCancelled, CancellationToken, StageProgress
+
+# progress of a dataset (0 to 1) at the end of each stage of analyze_dataset, the export takes the rest
+LOAD_PROGRESS_END = 0.4
+QUALITY_CONTROL_PROGRESS_END = 0.6
+SMOOTH_PROGRESS_END = 0.65
+EXPORT_PROGRESS_START = 0.7
 
 def analyze_dataset(input_folder:str, dataset_name:str, files:list,
                     settings:Settings,
                     main_output_folder:str, advanced_settings:dict,
+                    spot_table_cache:Optional[SpotTableCache]=None,
+                    write_output:bool=True,
+                    session_cache:Optional[SessionCache]=None,
+                    profile:bool=False,
+                    cancellation_token:Optional[CancellationToken]=None,
+                    progress_callback:Optional[Callable[[float], None]]=None,
                     )->dict:
+    """
+    :param session_cache: in-memory cache of the pivoted time series, reused when only thresholds or min_len change
+    :param write_output: write the result tables, if False they are returned as results["result_tables"]
+                         to be written with writers.write_result_tables (e.g. while the next dataset is analyzed)
+    :param profile: write cProfile stats of the analysis to {dataset_name}_profile.prof in the output folder
+    :param cancellation_token: checked between stages and inside long loops (loading, export),
+                               a cancelled run returns with results["cancelled"]
+    :param progress_callback: called with the fraction of the dataset done (0 to 1), if write_output is False the
+                              analysis ends at EXPORT_PROGRESS_START
+    :return: results, with the data of the overview figure as results["figure_data"] if settings.render_figures,
+             see figures.render_overview_figure; time and memory per stage and counters as results["report"]
+             (profiling.DatasetReport)
+    """
     logger.info(f"analysing dataset {dataset_name} from {input_folder}")
 
     min_len = settings.min_len
     tracking_interval = settings.tracking_interval
-    size_jump_threshold = advanced_settings["size_jump_threshold"]
-    tracking_marker_jump_threshold= advanced_settings["tracking_marker_jump_threshold"]
-    tracking_marker_peak_threshold=advanced_settings["tracking_marker_division_peak_threshold"]
-    suffix = settings.suffix
 
     if not settings.digits:
         settings.delimiter = ""
@@ -28,489 +56,997 @@ def analyze_dataset(input_folder:str, dataset_name:str, files:list,
     tracking_marker = settings.get_tracking_marker_name()
     main_channels = [color for color in settings.channel_names.values() if color != tracking_marker]
     channels_to_color = settings.channel_names
-   
-    subsets = [file.split(suffix)[0][-settings.digits:] for file in files if dataset_name in file]
 
     output_folder = create_folder(main_output_folder + dataset_name + "/")
 
+    report = DatasetReport(dataset_name)
+    progress = StageProgress(cancellation_token, progress_callback)
     results = {"dataset": dataset_name,
                "error": None,
+               "cancelled": False,
                "output_folder": output_folder,
-               "run_complete": False}
-
-    logger.debug(f"analysing dataset {dataset_name}")
+               "run_complete": False,
+               # set when the overview figure is rendered
+               "fig_path": None,
+               # also for failed runs, the stages finished before the error
+               "report": report}
 
-    try:
-        # fill input list with subset number and files
-        input_file_list = []
-        #for a single file in a subset
-        if len(subsets)==1 and (not settings.digits):
-            input_file_list = [("", subsets[0]+suffix)]
-        #for multiple files per subset
-        else:
-            for subset in subsets:
-                input_file_list.append((subset, f'{input_folder}/{dataset_name}{settings.delimiter}{subset}{suffix}'))
-
-        input_tables_cells:dict[str:pd.DataFrame] = {} # will hold raw data_frames per subset
-        input_files_used = []
-
-        for subset, file in input_file_list:
-
-            # loading cell data
-            if not os.path.exists(file):
-                logger.warning(F"file: {file} not found")
-                continue
-            try:
-                logger.debug(f"processing file {file}")
-                #read subset csv
-                input_table = pd.read_csv(file, low_memory=False).iloc[3:] #first lines are redundant
-                input_files_used.append((subset, file))
+    logger.debug("analysing dataset %s", dataset_name)
 
-                #store subset-data in 'input_table_cells'
-                input_tables_cells[subset] = input_table.dropna(subset=["TRACK_ID"])
-
-                #add subset name to TRACK_IDs
-                input_tables_cells[subset].loc[:, "TRACK_ID"] = (
-                    input_tables_cells[subset]["TRACK_ID"].astype(int).astype(
-                    str).apply(add_subset_number, args=(subset,)))
-
-            except:
-                logger.warning(f'subset {subset} could not be loaded from {input_folder}')
-                continue
-
-        #combine DataFrames of all subsets of a dataset into a single DataFrame
+    with profile_to(os.path.join(output_folder, f"{dataset_name}_profile.prof") if profile else None):
         try:
-            if len(input_tables_cells.values()) == 1:
-                input_data_frame = list(input_tables_cells.values())[0]
-            else:
-                input_data_frame = pd.concat(input_tables_cells.values())
-
-        except:
-            logger.error("Could not load any data set")
-            raise ValueError('Could not load any data set')
-
-        time_transformer = 1
-        if settings.transform:
-            logger.debug(f'tracking intefval: {tracking_interval}')
-            if tracking_interval > 35:
-                logger.warning("time transformation not used, only valid for tracking intervals < 35 min")
-                settings.transform = False
+            # pivoted time series of all tracks, from the input files or the session cache
+            ragged, pivoted = load_pivoted_time_series(input_folder, dataset_name, files, settings,
+                                                       advanced_settings, spot_table_cache=spot_table_cache,
+                                                       session_cache=session_cache, report=report,
+                                                       progress=progress.part(0, LOAD_PROGRESS_END))
+
+            time_transformer = get_time_transformer(settings)
+
+            # Extract object size timeseries per track as a DataFrame and
+            # fluorescence signal timeseries as a dict with color as keys and DataFrame as values
+            # (or as TrackStores, see above)
+            with report.stage("time_series"):
+                object_sizes, signals_raw = time_series_from_pivoted(pivoted, channels_to_color, min_len,
+                                                                     ragged=ragged)
+            del pivoted
+
+            # detect divisions and tracking errors, the first color is filtered (see quality_control)
+            first_color = list(signals_raw)[0]
+            with report.stage("prepare_quality_control"):
+                quality_control_input = prepare_quality_control(object_sizes, signals_raw[tracking_marker],
+                                                                time_transformer)
+                del object_sizes
+            # stages jumps, peaks, divisions and filter
+            quality_control_results = quality_control(quality_control_input, signals_raw[first_color],
+                                                      advanced_settings, min_len, tracking_interval,
+                                                      time_transformer, report=report)
+            divisions = quality_control_results["divisions"]
+            with report.stage("divisions_per_cell"):
+                cell_divisions = mask_to_dict(divisions)
+                flags_per_cell = mask_to_dict(quality_control_results["flags"])
+            progress.update(QUALITY_CONTROL_PROGRESS_END)
+            report.count("divisions", sum(map(len, cell_divisions.values())))
+            report.count("flags", sum(map(len, flags_per_cell.values())))
+            report.count("flagged_cells", sum(1 for cell_flags in flags_per_cell.values() if cell_flags))
+            report.count("close_divisions", quality_control_results["close_divisions"].sum())
+            # per cell output only with --logger debug, not built otherwise
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("detected %d divisions in %d cells", report.counters["divisions"], len(cell_divisions))
+                logger.debug("tracking intefval: %s", tracking_interval)
+                test_surrunding_timepoints = [20 + offset for offset in
+                                              get_window_offsets(0, 2, tracking_interval,
+                                                                 time_transformer=time_transformer)]
+                logger.debug("a division at tp 20 spans %s", test_surrunding_timepoints)
+                for cell, cell_division_frames in cell_divisions.items():
+                    logger.debug("divisions of cell %s are %s, flags %s",
+                                 cell, cell_division_frames, flags_per_cell[cell])
+
+            ## signals_cleaned only contain error-free time-series
+            ## signals_cleaned_rel are devided by mean of time-series
+            with report.stage("normalize"):
+                signals_cleaned = {first_color: quality_control_results["filtered"]}
+                signals_cleaned_rel = {}
+                for color, raw_signals in signals_raw.items():
+                    if color != first_color:
+                        # select the cells kept in filter_cells and copy the 'na's from the first color,
+                        # this crops the timeseries to not contain flags as done by filter cells
+                        signals_cleaned[color] = apply_filter(raw_signals, signals_cleaned[first_color])
+                    # calculate relative values nromalized to mean of each time series
+                    signals_cleaned_rel[color] = relative_to_mean(signals_cleaned[color])
+
+            #generate list of cells
+            all_cells = list(signals_raw[tracking_marker].columns)
+            approved_cells = list(signals_cleaned[tracking_marker].columns)
+            report.count("cells", len(all_cells))
+            report.count("approved_cells", len(approved_cells))
+
+            # smoothen out cell division time points, the windows are the same for all channels
+            with report.stage("smooth"):
+                division_windows, failed_division_windows = get_division_interpolation_windows(
+                    divisions, signals_cleaned[first_color], tracking_interval)
+                if failed_division_windows:
+                    logger.warning(f'{dataset_name}: {len(failed_division_windows)} divisions not smoothened, '
+                                   f'time points around the division missing (cell, frame): '
+                                   f'{failed_division_windows}')
+                signals_smooth_clean_rel, signals_smooth_clean = {}, {}
+                for color in signals_cleaned:
+                    # approved cells as DataFrames from here on, for the figure and export
+                    signals_smooth_clean_rel[color] = to_dense(smoothen_out_divisions(signals_cleaned_rel[color],
+                                                                                      division_windows))
+                    signals_smooth_clean[color] = to_dense(smoothen_out_divisions(signals_cleaned[color],
+                                                                                  division_windows))
+                    signals_cleaned[color] = to_dense(signals_cleaned[color])
+            report.count("failed_division_windows", len(failed_division_windows))
+            progress.update(SMOOTH_PROGRESS_END)
+
+            # the overview figure is rendered separately (see figures.py),
+            # the numbers are reported without waiting for it
+            if settings.render_figures:
+                with report.stage("figure_data"):
+                    results["figure_data"] = get_overview_figure_data(
+                        dataset_name, signals_smooth_clean_rel, signals_cleaned, main_channels, tracking_marker,
+                        frame_count=signals_raw[tracking_marker].shape[0], interval=tracking_interval,
+                        heatmap_pooling=advanced_settings.get("heatmap_pooling", "mean"))
+
+            # Collect all result tables, written as sheets of a workbook and/or separate files (see writers.py)
+            with report.stage("result_tables"):
+                overview = [["cells", len(all_cells)],
+                            ["approved_cells", len(approved_cells)],
+                            ["minimum length", min_len]] + \
+                           [[F'mean signal {color}', signals_cleaned[color].mean().mean()]
+                            for color in channels_to_color.values()]
+
+
+                cell_divisions_flags = []
+                approved_cells_set = set(approved_cells)
+                for cell in all_cells:
+                    cell_divisions_flags.append({"cell_number": cell,
+                                                 "divisions": cell_divisions[cell],
+                                                 "flags": flags_per_cell[cell],
+                                                 "approved": cell in approved_cells_set,
+                                                 })
+
+                result_tables = {"overview": pd.DataFrame(overview),
+                                 "div_flags": pd.DataFrame(cell_divisions_flags)}
+                for color in channels_to_color.values():
+                    if settings.write_raw_all_cells:
+                        result_tables[F'{color}_raw_all_cells'] = signals_raw[color]
+                    result_tables[F'{color}_raw_acpt_cells'] = signals_cleaned[color]
+                    result_tables[F'{color}_raw_acpt_cells_smoothDiv'] = signals_smooth_clean[color]
+                    result_tables[F'{color}_norm_acpt_cells_smoothDiv'] = signals_smooth_clean_rel[color]
+            progress.update(EXPORT_PROGRESS_START)
+
+            if write_output:
+                with report.stage("export"):
+                    write_result_tables(result_tables, output_folder, dataset_name,
+                                        output_formats=settings.output_formats, long_layout=settings.long_layout,
+                                        progress=progress.part(EXPORT_PROGRESS_START, 1))
             else:
-                time_transformer = round(60 / tracking_interval)
-                logger.info(f"time transformation: only using every {time_transformer}. timepoint")
+                results["result_tables"] = result_tables
 
+        except AnalysisCancelled:
+            logger.info(f"analysis of {dataset_name} stopped")
+            results["cancelled"] = True
+            return results
+        except Exception:
+            results["error"] = traceback.format_exc()
+            return results
 
+    results["output_folder"]=output_folder
+    results["run_complete"]=True
+    results["all_cells"]=len(all_cells)
+    results["approved_cells"]= len(approved_cells)
+    results["failed_division_windows"]= len(failed_division_windows)
 
-        # Tables with values
-        # Extract fluorescence signal timeseries as a dict with color as keys and DataFrame as values
-        signals_raw:dict[str:pd.DataFrame] = extract_raw_time_series(input_data_frame, channels_to_color, min_len)
+    return results
 
-        # Extract object size timeseries per track as a DataFrame
-        object_sizes:pd.DataFrame = extract_size_time_series(input_data_frame, min_len).iloc[0::time_transformer]
+def load_pivoted_time_series(input_folder:str, dataset_name:str, files:list, settings:Settings,
+                             advanced_settings:dict, spot_table_cache:Optional[SpotTableCache]=None,
+                             session_cache:Optional[SessionCache]=None,
+                             report:Optional[DatasetReport]=None,
+                             progress:Optional[StageProgress]=None)->tuple[bool, tuple]:
+    """
+    reads the spot tables of all subsets of a dataset and pivots them (see pivot_time_series)
+    :param session_cache: pivoted time series are taken from and stored in this cache
+    :param report: the "load" and "pivot" stages and the numbers of rows read and tracks pivoted are added to it
+    :param progress: updated per file loaded and after pivoting, checks for cancellation
+    :return: True for the ragged layout (TrackStores), pivoted time series
+    """
+    channels_to_color = settings.channel_names
+    suffix = settings.suffix
+    delimiter = settings.delimiter if settings.digits else ""
+    subsets = [file.split(suffix)[0][-settings.digits:] for file in files if dataset_name in file]
 
+    # fill input list with subset number and files
+    input_file_list = []
+    #for a single file in a subset
+    if len(subsets)==1 and (not settings.digits):
+        input_file_list = [("", subsets[0]+suffix)]
+    #for multiple files per subset
+    else:
+        for subset in subsets:
+            input_file_list.append((subset, f'{input_folder}/{dataset_name}{delimiter}{subset}{suffix}'))
+
+    # the pivoted time series only depend on the input files, the channels and the track store
+    track_store = advanced_settings.get("track_store", "auto")
+    pivot_key = get_pivot_cache_key(input_file_list, list(channels_to_color.keys()), track_store)
+    cached_pivot = session_cache.load(pivot_key) if session_cache else None
+    report = report or DatasetReport(dataset_name)
+    progress = progress or StageProgress()
+    if cached_pivot is not None:
+        logger.info(f"{dataset_name}: using pivoted time series from session cache")
+        ragged, pivoted = cached_pivot
+        report.count("rows_read", 0)
+    else:
+        # read all subset files concurrently, holds raw data_frames per subset
+        with report.stage("load"):
+            input_tables_cells, input_files_used = load_subset_tables(input_file_list,
+                                                                      channels=list(channels_to_color.keys()),
+                                                                      spot_table_cache=spot_table_cache,
+                                                                      progress=progress.part(0, 0.8))
+
+            #combine DataFrames of all subsets of a dataset into a single DataFrame
+            try:
+                if len(input_tables_cells.values()) == 1:
+                    input_data_frame = list(input_tables_cells.values())[0]
+                else:
+                    input_data_frame = pd.concat(input_tables_cells.values())
+
+            except Exception:
+                logger.error("Could not load any data set")
+                raise ValueError('Could not load any data set')
+        report.count("files_read", len(input_files_used))
+        report.count("rows_read", len(input_data_frame))
+
+        # Tables with values, from a single pivot of the input table
+        # (or ragged if most of the frames x tracks tables would be empty, all steps work on both)
+        with report.stage("pivot"):
+            ragged = use_ragged_track_store(input_data_frame, track_store)
+            logger.debug("storing time series as %s", "TrackStores" if ragged else "DataFrames")
+            pivoted = pivot_time_series(input_data_frame, channels_to_color, ragged=ragged)
+            del input_data_frame, input_tables_cells
+        if session_cache:
+            session_cache.store(pivot_key, (ragged, pivoted))
+    progress.update(1)
+    # the TRACK_IDs are the last element of both layouts
+    report.count("tracks_pivoted", len(pivoted[-1]))
+    return ragged, pivoted
+
+def get_time_transformer(settings:Settings)->int:
+    """
+    :return: frames between the time points used for quality control (1 without time transformation),
+             settings.transform is switched off if the tracking interval is too long for it
+    """
+    if not settings.transform:
+        return 1
+    logger.debug("tracking intefval: %s", settings.tracking_interval)
+    if settings.tracking_interval > 35:
+        logger.warning("time transformation not used, only valid for tracking intervals < 35 min")
+        settings.transform = False
+        return 1
+    time_transformer = round(60 / settings.tracking_interval)
+    logger.info(f"time transformation: only using every {time_transformer}. timepoint")
+    return time_transformer
+
+def prepare_quality_control(object_sizes:Union[pd.DataFrame, TrackStore],
+                            tracking_marker_signals:Union[pd.DataFrame, TrackStore],
+                            time_transformer:int)->dict:
+    """
+    steps of the quality control that do not depend on the thresholds, can be reused for other thresholds
+    :return: dict with relative changes to the previous time point of object size ("size_changes") and
+             tracking marker ("tracking_marker_changes"), residuals of the tracking marker to its rolling mean
+             ("tracking_marker_peak_residuals", see get_peak_residuals), at the time points used (time_transformer)
+    """
+    tracking_marker_signals = subsample_time_points(tracking_marker_signals, time_transformer)
+    return {"size_changes": difference_to_prev(subsample_time_points(object_sizes, time_transformer)),
+            "tracking_marker_changes": difference_to_prev(tracking_marker_signals),
+            "tracking_marker_peak_residuals": get_peak_residuals(tracking_marker_signals)}
+
+# hours around a division (start, end) in which jumps are expected and not flagged
+SIZE_JUMP_DIVISION_WINDOW = (0, 2)
+TRACKING_MARKER_JUMP_DIVISION_WINDOW = (-2, 2)
+
+def get_divisions(tracking_marker_peaks:Union[pd.DataFrame, TrackStore], size_jumps:Union[pd.DataFrame, TrackStore],
+                  tracking_interval:float, time_transformer:int)->Union[pd.DataFrame, TrackStore]:
+    """
+    Define cell divisions: Peak in iRFP signal AND drop subsequent in cell size
+    (first tp if there are consecutive peaks, size drop at or within 2 hours after the peak)
+    :return: boolean DataFrame, True at divisions
+    """
+    if time_transformer == 1:
+        division_window = int(round(2/(tracking_interval/60)))
+    else:
+        division_window = 2*time_transformer
+    return detect_divisions(tracking_marker_peaks, size_jumps, time_step=time_transformer, window=division_window)
+
+def quality_control(quality_control_input:dict, signals:Union[pd.DataFrame, TrackStore], advanced_settings:dict,
+                    min_len:int, tracking_interval:float, time_transformer:int,
+                    report:Optional[DatasetReport]=None)->dict:
+    """
+    detects divisions and potential tracking errors (flags), then filters signals
+    :param quality_control_input: from prepare_quality_control
+    :param signals: time series to filter
+    :param advanced_settings: thresholds
+    :param report: the stages "jumps", "peaks", "divisions" and "filter" are added to it
+    :return: dict with "divisions" and "flags" (boolean, frames x tracks), "close_divisions" (boolean per track),
+             "filtered" (signals of the approved cells, only their longest error free part)
+    """
+    stage = report.stage if report is not None else lambda name: nullcontext()
+
+    with stage("jumps"):
         # From object size, calculate relative size changes compared to previous time point
         # then mark size jumps over the size_jump_threshold (either up = 1, or down = -1) (division or mis-tracking)
-        size_jumps:pd.DataFrame = (object_sizes
-                                         .apply(difference_to_prev)
-                                         .apply(mark_jumps, args=(size_jump_threshold,), axis=0)
-                                         )
+        size_jumps = mark_jumps(quality_control_input["size_changes"], advanced_settings["size_jump_threshold"])
         # detect jumps in tracking marker intensity above tracking_marker_jump_threshold (mis-tracking)
-        tracking_marker_jumps = (signals_raw[tracking_marker].iloc[0::time_transformer]
-                                     .apply(difference_to_prev)
-                                     .apply(mark_jumps,args=(tracking_marker_jump_threshold,), axis=0)
-                                     )
-
-
-        def get_peaks(timeseries:pd.Series, threshold:float, n_rolling:int=7)->pd.Series:
-            smooth = timeseries.rolling(window=n_rolling, center=True).mean()
-            diffs_to_smooth = timeseries-smooth
-            mean = diffs_to_smooth.mean()
-            std = diffs_to_smooth.std()
-            if threshold >= 0:
-                peaks = diffs_to_smooth.apply(lambda x: 1 if x > mean + (threshold * std) else 0)
-            else:
-                peaks = diffs_to_smooth.apply(lambda x: 1 if x < mean + (threshold * std) else 0)
-            return peaks
+        tracking_marker_jumps = mark_jumps(quality_control_input["tracking_marker_changes"],
+                                           advanced_settings["tracking_marker_jump_threshold"])
 
+    with stage("peaks"):
         #detect peaks in tracking marker above tracking_marker_peak_threshold (mis-tracking or division)
-        tracking_marker_peaks = signals_raw[tracking_marker].iloc[0::time_transformer].apply(
-            get_peaks,
-            args=(tracking_marker_peak_threshold,))
-
-        # Define cell divisions: Peak in iRFP signal AND drop subsequent in cell size
-        cell_divisions = {}
-
-        for cell in signals_raw[tracking_marker]:
-            cell_divisions[cell] = []
-            # collect all tracking marker peak times (first tp if there are consecutives)
-            peak_times = list(tracking_marker_peaks[cell][tracking_marker_peaks[cell] == 1].index)
-            logger.debug(f'trackmarker peak times of cell {cell} are {peak_times}')
-            peak_times_single = [time for time in peak_times if time - 1*time_transformer not in peak_times]
-            # look up if peak time is parallels or preceeds a decline in size, if yes count as cell division
-            for peak_time in peak_times_single:
-                if not settings.transform:
-                    if -1 in list(size_jumps[cell].loc[peak_time:peak_time + int(round(2/(tracking_interval/60)))]):
-                        cell_divisions[cell].append(peak_time)
-                else:
-                    if -1 in list(
-                            size_jumps[cell].loc[peak_time:peak_time + 2*time_transformer]):
-                        cell_divisions[cell].append(peak_time)
-
-
-        # helper function to list surrounding timepoints of a defined interval before and after
-        def get_surrounding_timepoints(list_of_tps:list,
-                                       rel_start:float,
-                                       rel_end:float,
-                                       tracking_interval:float,
-                                       time_transformer = 1
-                                       )->list[int]:
-            """
-            :param list_of_tps: list[int]
-            :param rel_start: float in hours
-            :param rel_end: float in hours
-            :param tracking_interval: float in minutes
-            :return: list[int] a list of timepoints
-            """
-            if time_transformer == 1:
-                rel_start = int(round(rel_start / (tracking_interval / 60)))
-                rel_end = int(round(rel_end / (tracking_interval / 60)))
+        tracking_marker_peaks = mark_peaks(*quality_control_input["tracking_marker_peak_residuals"],
+                                           threshold=advanced_settings["tracking_marker_division_peak_threshold"])
 
-            else:
-                rel_start = rel_start * time_transformer
-                rel_end = rel_end * time_transformer
-
-            extended_list = []
-            for tp in list_of_tps:
-                extended_list += list(range(tp + rel_start, tp + rel_end + 1, time_transformer))
-            return list(set([x for x in extended_list if x > 0]))
-
-        logger.debug(f'tracking intefval: {tracking_interval}')
-        test_surrunding_timepoints = get_surrounding_timepoints([20], 0,2,
-                                                                             tracking_interval,
-                                                                             time_transformer=time_transformer)
-        logger.debug(f"a division at tp 20 spans {test_surrunding_timepoints}")
+    with stage("divisions"):
+        divisions = get_divisions(tracking_marker_peaks, size_jumps, tracking_interval, time_transformer)
 
         # List size jumps that are not connected with divisions. Most cases either mis-tracking or edge-effects
-        non_division_size_jumps = {}
-
-        for cell in size_jumps:
-            non_division_size_jumps[cell] = []
-            #list size jumps times
-            size_jump_times = list(size_jumps[cell][size_jumps[cell] != 0].index)
-            logger.debug(f'size jumps of cell {cell} are {size_jump_times}')
-            #if size jumps do not happen at or within 2 hours after division, list as non-division size jump
-            for size_jump_time in size_jump_times:
-                if not size_jump_time in get_surrounding_timepoints(cell_divisions[cell], 0,
-                                                                    2, tracking_interval,
-                                                                    time_transformer=time_transformer):
-                    non_division_size_jumps[cell].append(size_jump_time)
+        # (size jumps that do not happen at or within 2 hours after division)
+        size_division_windows = get_division_windows(reindex_tracks(divisions, size_jumps, fill_value=False),
+                                                     *SIZE_JUMP_DIVISION_WINDOW, tracking_interval,
+                                                     time_transformer=time_transformer)
+        non_division_size_jumps = (size_jumps != 0) & ~size_division_windows
 
         # List tracking marker jumps not related to cell division, most cases mis-tracking
-        non_division_tracking_marker_jumps = {}
-        for cell in tracking_marker_jumps:
-            non_division_tracking_marker_jumps[cell] = []
-            # list tracking_marker intensity jumps times
-            tracking_marker_jump_times = list(tracking_marker_jumps[cell][tracking_marker_jumps[cell] != 0].index)
-            logger.debug(f'trackmarker jumps of cell {cell} are {tracking_marker_jump_times}')
-            # if jumps not within 2 hours of division, list as non-division tracking_marker_jump
-            for tracking_marker_jump_time in tracking_marker_jump_times:
-                if not tracking_marker_jump_time in get_surrounding_timepoints(cell_divisions[cell],-2,
-                                                                    2, tracking_interval,
-                                                                    time_transformer=time_transformer):
-                    non_division_tracking_marker_jumps[cell].append(tracking_marker_jump_time)
+        # (jumps not within 2 hours of division)
+        tracking_marker_division_windows = get_division_windows(
+            reindex_tracks(divisions, tracking_marker_jumps, fill_value=False),
+            *TRACKING_MARKER_JUMP_DIVISION_WINDOW, tracking_interval, time_transformer=time_transformer)
+        non_division_tracking_marker_jumps = (tracking_marker_jumps != 0) & ~tracking_marker_division_windows
 
         # identify cells with too close devisions (>1 in 15h), probably something went wrong
+        close_divisions:pd.Series = get_close_divisions(divisions, interval=tracking_interval)
 
-        def get_close_divisions(divisions:dict[str:list[int]], interval:float)->list[str]:
-            cells_with_close_divisions = []
-            for cell, div_time_list in divisions.items():
-                if len(div_time_list) > 1:
-                    for position, div_time in enumerate(div_time_list[:-1]):
-                        if (div_time_list[position + 1] - div_time_list[position]) < (15/(interval/60)):
-
-                            cells_with_close_divisions.append(cell)
-                            break
-            return cells_with_close_divisions
-
-        close_divisions = (get_close_divisions(cell_divisions, interval=tracking_interval))
+        # for all cells combine non_division_size_jumps and non_division_irfp_jumps to 'flags'
+        flags = non_division_size_jumps | reindex_tracks(non_division_tracking_marker_jumps, non_division_size_jumps,
+                                                         fill_value=False)
 
+    with stage("filter"):
         #sort out all potential tracking errors:
         ## if track contains potential errors, keep longest error free track if > pre-defined min_len
-        ## signals_cleaned only contain error-free time-series
-        ## signals_cleaned_rel are devided by mean of time-series
-
-        signals_cleaned = {}
-        signals_cleaned_rel = {}
-
-        # for all cells combine non_division_size_jumps and non_division_irfp_jumps to 'flags'
-        flags_per_cell = {cell: list(set(non_division_size_jumps[cell]
-                                         + non_division_tracking_marker_jumps[cell]))
-                          for cell in non_division_size_jumps.keys()}
-
-        # keep only error free long enough time series
-        for color_count, (color, raw_signals) in enumerate(signals_raw.items()):
-            # for the first iteration/color, filter cells and timeseries using filter_cells methods
-            if color_count == 0:
-                # remember which color was processed with filter_cells for later reference
-                first_color = color
-                signals_cleaned[color] = filter_cells(raw_signals,
-                                                      flags_per_cell=flags_per_cell,
-                                                      close_divisions=close_divisions,
-                                                      min_len=min_len)
-            # than apply the filtering result to the other colors
-            else:
-                # select the cells kept in filter_cells
-                raw_signals_good_cells = raw_signals[signals_cleaned[first_color].columns]
-                # copy the 'na's from first iteration,
-                # this crops the timeseries to not contain flags as done by filter cells
-                raw_signals_good_cells_cropped = raw_signals_good_cells.mask(signals_cleaned[first_color].isna())
-                # safe results
-                signals_cleaned[color] = raw_signals_good_cells_cropped
-            # calculate relative values nromalized to mean of each time series
-            signals_cleaned_rel[color] = signals_cleaned[color] / np.mean(signals_cleaned[color], axis=0)
-
-        #generate list of cells
-        all_cells = [cell for cell in signals_raw[tracking_marker]]
-        approved_cells = [cell for cell in signals_cleaned[tracking_marker]]
-
-        # smoothen out cell division time points #MISSING: tracking interval...
-        signals_smooth_clean_rel, signals_smooth_clean = {}, {}
-        for color, raw_signals in signals_cleaned_rel.items():
-            signals_smooth_clean_rel[color] = smoothen_out_divisions(signals_cleaned_rel[color], cell_divisions, tracking_interval)
-        for color, raw_signals in signals_cleaned.items():
-            signals_smooth_clean[color] = smoothen_out_divisions(signals_cleaned[color], cell_divisions, tracking_interval)
-
-        nsubplots = 2 * len(main_channels) + 2
-
-        fig, axs = plt.subplots(1, nsubplots, figsize=(30, 5))
-        for i, color in enumerate(main_channels):
-
-            #plot heatmap
-            ax = axs[2 * i]
-            df = signals_smooth_clean_rel[color].T
-
-            df["tmax"] = df.iloc[:,:].idxmax(axis=1)
-            sort = df.sort_values(by="tmax", axis=0).drop("tmax", axis=1)
-
-            ax.imshow(sort, cmap="viridis", interpolation='nearest', vmin=(0.2), vmax=(2.6), aspect="auto")
-            ax.set_title(F"{color} Rel. Signals")
-            ax.set_ylabel("#cells")
-            ax.set_xlabel("[h]")
-
-            ax = axs[2 * i + 1]
-            ax.plot(signals_smooth_clean_rel[color].mean(axis=1), c="red", label="mean")
-            ax.plot(signals_smooth_clean_rel[color].median(axis=1), c="green", label="median")
-            ax.legend()
-            ax.set_title(F"{color} normalized")
-            ax.set_ylabel("Amplitude")
-            ax.set_xlabel("[h]")
-            ax.set_ylim([0.3, 2.5])
-
-        axs[nsubplots - 2].plot(signals_smooth_clean_rel[tracking_marker].count(axis=1))
-        axs[nsubplots - 2].set_title("Cell Count")
-        axs[nsubplots - 2].set_ylabel("# cells")
-        axs[nsubplots - 2].set_xlabel("[h]")
-
-        for i, color in enumerate(main_channels):
-            axs[nsubplots - 1].boxplot(signals_cleaned[color].mean(), positions=[i + 1, ]),
-        axs[nsubplots - 1].set_xticks(list(range(1, len(main_channels) + 1)))
-        axs[nsubplots - 1].set_xticklabels(main_channels)
-        axs[nsubplots - 1].set_title("Mean Signal")
-        axs[nsubplots - 1].set_ylabel("a.u.")
-        axs[nsubplots - 1].set_xlim(0.5, 0.5+len(main_channels))
-
-        for ax in fig.get_axes()[:-1]:
-            make_ax_circadian(ax, signals_raw[tracking_marker], interval=tracking_interval)
-        #plt.show()
-        fig.suptitle(F'{dataset_name}')
-        fig.savefig(output_folder + f'overview_accepted_cells_{dataset_name}.png', dpi=50)
-        fig.savefig(output_folder + f'overview_accepted_cells_{dataset_name}(high_res).png', dpi=300)
-        plt.close(fig)
-
-        # Create a Pandas Excel writer using XlsxWriter as the engine.
-        writer = pd.ExcelWriter(output_folder + f'post_script_output_{dataset_name}.xlsx')
-
-        # Write each dataframe to a different worksheet.
-
-        overview = [["cells", len(all_cells)],
-                    ["approved_cells", len(approved_cells)],
-                    ["minimum length", min_len]] + \
-                   [[F'mean signal {color}', signals_cleaned[color].mean().mean()] for color in channels_to_color.values()]
-
-
-        cell_divisions_flags = []
-        for cell in signals_raw[tracking_marker]:
-            cell_divisions_flags.append({"cell_number": cell,
-                                         "divisions": cell_divisions[cell],
-                                         "flags": list(set(non_division_size_jumps[cell] +
-                                                           non_division_tracking_marker_jumps[cell])),
-                                         "approved": cell in approved_cells,
-                                         })
-
-        pd.DataFrame(overview).to_excel(writer, sheet_name='overview')
-        pd.DataFrame(cell_divisions_flags).to_excel(writer, sheet_name='div_flags')
-        for color in channels_to_color.values():
-            signals_raw[color].to_excel(writer, sheet_name=F'{color}_raw_all_cells')
-            signals_cleaned[color].to_excel(writer, sheet_name=F'{color}_raw_acpt_cells')
-            signals_smooth_clean[color].to_excel(writer, sheet_name=F'{color}_raw_acpt_cells_smoothDiv')
-            signals_smooth_clean_rel[color].to_excel(writer, sheet_name=F'{color}_norm_acpt_cells_smoothDiv')
-
-        writer.close()
-
-    except Exception:
-        results["error"] = traceback.format_exc()
-        return results
-
-    results["output_folder"]=output_folder
-    results["run_complete"]=True
-    results["all_cells"]=len(all_cells)
-    results["approved_cells"]= len(approved_cells)
-    results["fig_path"]= output_folder + f'overview_accepted_cells_{dataset_name}.png'
-
-    return results
+        filtered = filter_cells(signals, flags=flags, close_divisions=close_divisions, min_len=min_len)
+    return {"divisions": divisions,
+            "flags": flags,
+            "close_divisions": close_divisions,
+            "filtered": filtered}
 
 def create_folder(path):
     if not os.path.exists(path):
         os.mkdir(path)
     return path
 
-def filter_cells(dataframe:pd.DataFrame, flags_per_cell:dict, close_divisions:dict, min_len:int)->pd.DataFrame:
-    cells_to_drop = []
-    #make a copy
-    filtered_df = dataframe.copy(deep=True)
-    #iterate through cells in flaglist
-
-    for cell, flag_list in flags_per_cell.items():
-        #cells with close divisions are added to drop list
-        if cell in close_divisions:
-            cells_to_drop.append(cell)
-            continue
-        #if there is no flag keep the cell (nothing to be done)
-        elif not flag_list:
-            continue
-
-        # get the time series for the cell
-        cell_time_series = dataframe[cell].dropna()
-        #search for longset interval without flags
-        #make list of start time, flags, end time
-        start_flag_end = np.array(sorted([int(cell_time_series.index[0]) - 1]
-                              + flag_list
-                              + [int(cell_time_series.index[-1]) + 1]))
-        #calculate length of intervals
-        interval_lengths = np.diff(start_flag_end)
-        #determine index of longest interval
-        idx_longest_interval = np.argmax(interval_lengths)
-        #get start and end time of this interval
-        start_longest_interval = start_flag_end[idx_longest_interval]
-        end_longest_interval = start_flag_end[idx_longest_interval + 1]
-        #crop time series to longest interval
-        cell_time_series = cell_time_series.loc[start_longest_interval:end_longest_interval]
-
-        #if remaining time series too short than add to drop list
-        if cell_time_series.shape[0] < min_len:
-            cells_to_drop.append(cell)
-        else:
-            #keep the cropped time series if long enough
-            filtered_df[cell] = cell_time_series
-
-
-    #drop cells from drop list
-    filtered_df = filtered_df.drop(list(set(cells_to_drop)), axis=1)
-
-    return filtered_df
+def get_close_divisions(divisions:pd.DataFrame, interval:float)->pd.Series:
+    """
+    :param divisions: boolean DataFrame, True at divisions
+    :param interval: tracking interval in minutes
+    :return: boolean Series, True for cells with two divisions less than 15 h apart
+    """
+    if isinstance(divisions, TrackStore):
+        return get_close_divisions_ragged(divisions, interval)
+    frames = divisions.index.to_numpy()
+    is_division = divisions.to_numpy(dtype=bool)
+    division_frames = np.where(is_division, frames[:, np.newaxis].astype(np.float64), np.nan)
+    # frame of the last division before each time point
+    previous_division = pd.DataFrame(division_frames).ffill().shift(1).to_numpy()
+    too_close = is_division & ((frames[:, np.newaxis] - previous_division) < (15/(interval/60)))
+    return pd.Series(too_close.any(axis=0), index=divisions.columns)
+
+def get_close_divisions_ragged(divisions:TrackStore, interval:float)->pd.Series:
+    division_points = np.nonzero(divisions.values)[0]
+    tracks = divisions.point_tracks()[division_points]
+    frames = divisions.point_frames()[division_points]
+    # division points are sorted by track and frame, compare each division to the previous one of the track
+    too_close = (tracks[1:] == tracks[:-1]) & ((frames[1:] - frames[:-1]) < (15/(interval/60)))
+    close_divisions = np.zeros(len(divisions.track_ids), dtype=bool)
+    close_divisions[tracks[1:][too_close]] = True
+    return pd.Series(close_divisions, index=divisions.track_ids)
+
+def filter_cells(dataframe:pd.DataFrame, flags:pd.DataFrame, close_divisions:pd.Series, min_len:int)->pd.DataFrame:
+    """
+    drops cells with close divisions, crops flagged cells to the longest interval between flags
+    (or start/end of the time series), drops them if the remaining time series is shorter than min_len
+    :param flags: boolean DataFrame, True at flags
+    :param close_divisions: boolean Series, True for cells with close divisions
+    :return: DataFrame with the remaining cells
+    """
+    if isinstance(dataframe, TrackStore):
+        return filter_cells_ragged(dataframe, flags, close_divisions, min_len)
+    frames = dataframe.index.to_numpy()
+    values = dataframe.to_numpy(dtype=np.float64, copy=True)
+    is_close = close_divisions.reindex(dataframe.columns, fill_value=False).to_numpy(dtype=bool)
+    flag_mask = flags.reindex(columns=dataframe.columns, fill_value=False).to_numpy(dtype=bool)
+
+    #only cells with flags have to be cropped, cells without flags are kept as they are
+    flagged = flag_mask.any(axis=0) & ~is_close
+    flagged_values = values[:, flagged]
+    is_valid = ~np.isnan(flagged_values)
+
+    #make list of start time, flags, end time per cell: sorted flag frames, padded with inf
+    first_valid = frames[np.argmax(is_valid, axis=0)]
+    last_valid = frames[len(frames) - 1 - np.argmax(is_valid[::-1], axis=0)]
+    flag_frames = np.where(flag_mask[:, flagged], flags.index.to_numpy()[:, np.newaxis].astype(np.float64), np.inf)
+    start_flag_end = np.sort(np.vstack([first_valid - 1, flag_frames, last_valid + 1]), axis=0)
+
+    #calculate length of intervals, search for longest interval without flags (first one if equal)
+    with np.errstate(invalid="ignore"):
+        interval_lengths = np.diff(start_flag_end, axis=0)
+    interval_lengths[~np.isfinite(interval_lengths)] = -np.inf
+    idx_longest_interval = np.argmax(interval_lengths, axis=0)
+    cell_idx = np.arange(start_flag_end.shape[1])
+    start_longest_interval = start_flag_end[idx_longest_interval, cell_idx]
+    end_longest_interval = start_flag_end[idx_longest_interval + 1, cell_idx]
+
+    #crop time series to longest interval
+    in_longest_interval = ((frames[:, np.newaxis] >= start_longest_interval)
+                           & (frames[:, np.newaxis] <= end_longest_interval))
+    values[:, flagged] = np.where(in_longest_interval, flagged_values, np.nan)
+
+    #if remaining time series too short than drop the cell
+    too_short = np.zeros(len(dataframe.columns), dtype=bool)
+    too_short[flagged] = np.count_nonzero(in_longest_interval & is_valid, axis=0) < min_len
+    keep = ~(is_close | too_short)
+
+    return pd.DataFrame(values[:, keep], index=dataframe.index, columns=dataframe.columns[keep])
+
+def filter_cells_ragged(time_series:TrackStore, flags:TrackStore, close_divisions:pd.Series, min_len:int)->TrackStore:
+    n_tracks = len(time_series.track_ids)
+    is_close = close_divisions.reindex(time_series.columns, fill_value=False).to_numpy(dtype=bool)
+
+    #flag frames of the cells in time_series
+    flag_points = np.nonzero(flags.values)[0]
+    flag_tracks = time_series.track_ids.get_indexer(flags.track_ids[flags.point_tracks()[flag_points]])
+    flag_frames = flags.point_frames()[flag_points]
+    flag_frames, flag_tracks = flag_frames[flag_tracks != -1], flag_tracks[flag_tracks != -1]
+
+    #only cells with flags have to be cropped, cells without flags are kept as they are
+    flagged = np.zeros(n_tracks, dtype=bool)
+    flagged[flag_tracks] = True
+    flagged &= ~is_close
+    flag_frames, flag_tracks = flag_frames[flagged[flag_tracks]], flag_tracks[flagged[flag_tracks]]
+
+    tracks = time_series.point_tracks()
+    frames = time_series.point_frames()
+    is_valid = ~np.isnan(time_series.values)
+    first_valid = np.full(n_tracks, np.inf)
+    np.minimum.at(first_valid, tracks[is_valid], frames[is_valid])
+    last_valid = np.full(n_tracks, -np.inf)
+    np.maximum.at(last_valid, tracks[is_valid], frames[is_valid])
+
+    #make list of start time, flags, end time per cell, sorted by cell and frame
+    flagged_tracks = np.nonzero(flagged)[0]
+    boundary_tracks = np.concatenate([flagged_tracks, flag_tracks, flagged_tracks])
+    boundary_frames = np.concatenate([first_valid[flagged] - 1, flag_frames, last_valid[flagged] + 1])
+    order = np.lexsort((boundary_frames, boundary_tracks))
+    boundary_tracks, boundary_frames = boundary_tracks[order], boundary_frames[order]
+
+    #calculate length of intervals, search for longest interval without flags (first one if equal)
+    interval_lengths = np.diff(boundary_frames)
+    interval_tracks = boundary_tracks[:-1]
+    interval_lengths[boundary_tracks[1:] != interval_tracks] = -np.inf
+    longest = np.full(n_tracks, -np.inf)
+    np.maximum.at(longest, interval_tracks, interval_lengths)
+    candidates = np.nonzero(interval_lengths == longest[interval_tracks])[0]
+    _, first_candidate = np.unique(interval_tracks[candidates], return_index=True)
+    idx_longest_interval = candidates[first_candidate]
+    start_longest_interval = np.full(n_tracks, -np.inf)
+    end_longest_interval = np.full(n_tracks, np.inf)
+    start_longest_interval[interval_tracks[idx_longest_interval]] = boundary_frames[idx_longest_interval]
+    end_longest_interval[interval_tracks[idx_longest_interval]] = boundary_frames[idx_longest_interval + 1]
+
+    #crop time series to longest interval
+    in_longest_interval = ((frames >= start_longest_interval[tracks]) & (frames <= end_longest_interval[tracks]))
+    values = np.where(in_longest_interval, time_series.values, np.nan)
+
+    #if remaining time series too short than drop the cell
+    counts = np.bincount(tracks, weights=in_longest_interval & is_valid, minlength=n_tracks)
+    too_short = flagged & (counts < min_len)
+    keep = ~(is_close | too_short)
+
+    return time_series.with_values(values).select(keep)
+
+def apply_filter(time_series:Union[pd.DataFrame, TrackStore], filtered:Union[pd.DataFrame, TrackStore]
+                 )->Union[pd.DataFrame, TrackStore]:
+    """
+    selects the cells of filtered and removes the time points where filtered has no values
+    :param filtered: result of filter_cells for another channel
+    """
+    if isinstance(time_series, TrackStore):
+        time_series = time_series.select_tracks(filtered.columns)
+        return time_series.with_values(np.where(np.isnan(filtered.values), np.nan, time_series.values))
+    return time_series[filtered.columns].mask(filtered.isna())
+
+def relative_to_mean(time_series:Union[pd.DataFrame, TrackStore])->Union[pd.DataFrame, TrackStore]:
+    # values divided by the mean of each time series
+    if isinstance(time_series, TrackStore):
+        return time_series / time_series.mean()[time_series.point_tracks()]
+    return time_series / np.mean(time_series, axis=0)
 
 # smoothen out cell division time points
-def smoothen_out_divisions(dataset:pd.DataFrame,
-                               cell_divisions:dict[str:list[int]],
-                               tracking_interval:float
-                               )->pd.DataFrame:
-    df = dataset.copy(deep=True)
-    #how many time points to extrapolate
-    width = int(2/(tracking_interval/60))
-    if width <2:
-        width = 2
-    before = (int(width-2)/2)
-    after = width-before
-
-    for cell, division_list in cell_divisions.items():
-        try:
-            for div_t in division_list:
-                df.loc[div_t-before:div_t+(after-1), cell] = np.linspace(df[cell].loc[div_t-before-1],
-                                                                         df[cell].loc[div_t+after],
-                                                                         width+2)[1:-1]
-        except:
-            continue
-    return df
-
-
-def make_ax_circadian(ax, irfp_signals, interval):
-    ax.set_xlabel("[h]")
-    data_count = irfp_signals.shape[0]
-    max_time = int(data_count*interval/60)
-    x_ticks = np.array(range(0,max_time,12), dtype=float)/(interval/60)
-    x_tick_labels = list(range(0,max_time,12))
-
-    ax.set_xticks(x_ticks)
-    ax.set_xticklabels(x_tick_labels)
-    ax.set_xlim(0,data_count)
-
-    ax.grid()
-
-
-def difference_to_prev(time_series:pd.Series)->pd.Series:
+def get_division_interpolation_windows(divisions:Union[pd.DataFrame, TrackStore],
+                                       dataset:Union[pd.DataFrame, TrackStore],
+                                       tracking_interval:float)->tuple[np.ndarray, list[tuple[str, int]]]:
+    """
+    finds the time points to interpolate around each division (2 hours) of the cells in dataset,
+    tables with the same index and columns (or layout) as dataset can be smoothened with the same windows
+    :param divisions: boolean DataFrame, True at divisions
+    :return: positions in the flattened values per window (first and last are the interpolation end points,
+             -1 outside of the stored part of a track), (cell, frame) of divisions whose window is out of bounds
+             or has gaps
+    """
+    # how many time points to interpolate
+    width = max(int(2/(tracking_interval/60)), 2)
+    before = (width - 2) // 2
+    after = width - before
+    offsets = np.arange(-before - 1, after + 1)
+
+    if isinstance(divisions, TrackStore):
+        division_points = np.nonzero(divisions.values)[0]
+        columns = dataset.columns.get_indexer(divisions.track_ids[divisions.point_tracks()[division_points]])
+        division_frames = divisions.point_frames()[division_points][columns != -1]
+        columns = columns[columns != -1]
+        frames = dataset.frames
+    else:
+        divisions = divisions.reindex(columns=dataset.columns, fill_value=False)
+        frame_idx, columns = np.nonzero(divisions.to_numpy())
+        division_frames = divisions.index.to_numpy()[frame_idx]
+        frames = dataset.index
+    window_rows = frames.get_indexer((division_frames[:, np.newaxis] + offsets).ravel()
+                                     ).reshape(len(division_frames), len(offsets))
+    in_bounds = (window_rows != -1).all(axis=1)
+    failed = [(dataset.columns[column], int(frame))
+              for column, frame in zip(columns[~in_bounds], division_frames[~in_bounds])]
+    window_rows, columns = window_rows[in_bounds], columns[in_bounds][:, np.newaxis]
+
+    if isinstance(dataset, TrackStore):
+        start_rows = dataset.start_rows[columns]
+        in_track = (window_rows >= start_rows) & (window_rows < start_rows + dataset.lengths[columns])
+        return np.where(in_track, dataset.offsets[:-1][columns] + window_rows - start_rows, -1), failed
+    return window_rows * len(dataset.columns) + columns, failed
+
+def smoothen_out_divisions(dataset:Union[pd.DataFrame, TrackStore], window_positions:np.ndarray
+                           )->Union[pd.DataFrame, TrackStore]:
+    """
+    replaces the time points around divisions by a linear interpolation between the window end points
+    :param window_positions: from get_division_interpolation_windows
+    """
+    if isinstance(dataset, TrackStore):
+        values = dataset.values.astype(np.float64, copy=True)
+    else:
+        values = np.array(dataset.to_numpy(dtype=np.float64), order="C")
+    flat_values = values.reshape(-1)
+    in_track = window_positions != -1
+    start = np.where(in_track[:, 0], flat_values[window_positions[:, 0]], np.nan)[:, np.newaxis]
+    stop = np.where(in_track[:, -1], flat_values[window_positions[:, -1]], np.nan)[:, np.newaxis]
+    # same values as np.linspace(start, stop, width + 2)[1:-1] per window
+    steps = np.arange(1, window_positions.shape[1] - 1)
+    interpolated = steps * ((stop - start) / (window_positions.shape[1] - 1)) + start
+    flat_values[window_positions[:, 1:-1][in_track[:, 1:-1]]] = interpolated[in_track[:, 1:-1]]
+    if isinstance(dataset, TrackStore):
+        return dataset.with_values(values)
+    return pd.DataFrame(values, index=dataset.index, columns=dataset.columns)
+
+def difference_to_prev(time_series:Union[pd.Series, pd.DataFrame, TrackStore]
+                       )->Union[pd.Series, pd.DataFrame, TrackStore]:
+    # relative change to previous time point, for a single or all time series (columns) at once
+    if isinstance(time_series, TrackStore):
+        previous = np.empty_like(time_series.values)
+        previous[1:] = time_series.values[:-1]
+        # first time point of each track has no previous time point
+        previous[time_series.offsets[:-1][time_series.lengths > 0]] = np.nan
+        return time_series.with_values((time_series.values - previous)/time_series.values)
     return time_series.diff()/time_series
 
 
-def max_min_null(value:float, max_cutoff:float, min_cutoff:Optional[float]=None)->int:
+def mark_jumps_array(values:np.ndarray, max_cutoff:float, min_cutoff:Optional[float]=None)->np.ndarray:
+    """
+    1 for values >= max_cutoff, -1 for values <= min_cutoff, else 0 (also NaN)
+    :param min_cutoff: default -max_cutoff
+    :return: int8 array of same shape
+    """
     if not min_cutoff:
         min_cutoff= -1 * max_cutoff
-    if value >= max_cutoff:
-        return 1
-    elif value <=min_cutoff:
-        return -1
+    jumps = np.zeros(values.shape, dtype=np.int8)
+    jumps[values <= min_cutoff] = -1
+    # max_cutoff wins where both apply
+    jumps[values >= max_cutoff] = 1
+    return jumps
+
+def mark_jumps(time_series:Union[pd.Series, pd.DataFrame, TrackStore], cutoff:float,
+               min_cutoff:Optional[float]=None)->Union[pd.Series, pd.DataFrame, TrackStore]:
+    if isinstance(time_series, TrackStore):
+        return time_series.with_values(mark_jumps_array(time_series.values, cutoff, min_cutoff))
+    jumps = mark_jumps_array(time_series.to_numpy(), cutoff, min_cutoff)
+    if isinstance(time_series, pd.Series):
+        return pd.Series(jumps, index=time_series.index, name=time_series.name)
+    return pd.DataFrame(jumps, index=time_series.index, columns=time_series.columns)
+
+def get_peak_residuals(time_series:Union[pd.DataFrame, TrackStore], n_rolling:int=7
+                       )->tuple[Union[pd.DataFrame, TrackStore], Union[pd.Series, np.ndarray],
+                                Union[pd.Series, np.ndarray]]:
+    """
+    differences of all time series (columns) to their centered rolling mean
+    :return: differences, mean and std of differences per time series
+    """
+    if isinstance(time_series, TrackStore):
+        return get_peak_residuals_ragged(time_series, n_rolling)
+    smooth = time_series.rolling(window=n_rolling, center=True).mean()
+    diffs_to_smooth = time_series-smooth
+    return diffs_to_smooth, diffs_to_smooth.mean(), diffs_to_smooth.std()
+
+def get_peak_residuals_ragged(time_series:TrackStore, n_rolling:int=7)->tuple[TrackStore, np.ndarray, np.ndarray]:
+    values = time_series.values
+    # time points before and after the center of the window, as for pandas rolling(center=True)
+    after = (n_rolling - 1) // 2
+    before = n_rolling - 1 - after
+    smooth = np.full(len(values), np.nan)
+    if len(values) >= n_rolling:
+        # windows with a NaN or reaching over the start/end of the track have no mean
+        position_in_track = np.arange(len(values)) - np.repeat(time_series.offsets[:-1], time_series.lengths)
+        in_track = ((position_in_track >= before)
+                    & (position_in_track + after < np.repeat(time_series.lengths, time_series.lengths)))
+        window_sums = np.lib.stride_tricks.sliding_window_view(values, n_rolling).sum(axis=1)
+        smooth[in_track] = window_sums[np.nonzero(in_track)[0] - before] / n_rolling
+    diffs_to_smooth = time_series.with_values(values - smooth)
+    return diffs_to_smooth, diffs_to_smooth.mean(), diffs_to_smooth.std()
+
+def mark_peaks(diffs_to_smooth:Union[pd.DataFrame, TrackStore], mean:Union[pd.Series, np.ndarray],
+               std:Union[pd.Series, np.ndarray], threshold:float)->Union[pd.DataFrame, TrackStore]:
+    """
+    1 where the difference to the rolling mean is above mean + threshold*std (below for negative threshold), else 0
+    """
+    cutoff = np.asarray(mean + (threshold * std))
+    if isinstance(diffs_to_smooth, TrackStore):
+        cutoff = cutoff[diffs_to_smooth.point_tracks()]
+        diffs = diffs_to_smooth.values
     else:
-        return 0
-
-def mark_jumps(time_series:pd.Series, cutoff:float)->pd.Series:
-    return time_series.apply(max_min_null, args =(cutoff,))
+        diffs = diffs_to_smooth.to_numpy()
+    if threshold >= 0:
+        peaks = diffs > cutoff
+    else:
+        peaks = diffs < cutoff
+    if isinstance(diffs_to_smooth, TrackStore):
+        return diffs_to_smooth.with_values(peaks.astype(np.int8))
+    return pd.DataFrame(peaks.astype(np.int8), index=diffs_to_smooth.index, columns=diffs_to_smooth.columns)
+
+def get_peaks(time_series:Union[pd.DataFrame, TrackStore], threshold:float, n_rolling:int=7
+              )->Union[pd.DataFrame, TrackStore]:
+    # peaks of all time series (columns) at once
+    return mark_peaks(*get_peak_residuals(time_series, n_rolling), threshold=threshold)
+
+def detect_divisions(peaks:Union[pd.DataFrame, TrackStore], size_jumps:Union[pd.DataFrame, TrackStore],
+                     time_step:int, window:int)->Union[pd.DataFrame, TrackStore]:
+    """
+    cell divisions are the first time point of consecutive tracking marker peaks,
+    if the size drops (size jump = -1) at this time point or up to window frames later
+    :param peaks: 1 at tracking marker peaks, frames as index, tracks as columns
+    :param size_jumps: jumps in object size (1, 0, -1), same index as peaks
+    :param time_step: frames between consecutive time points (time_transformer)
+    :param window: frames after a peak to look for a size drop
+    :return: boolean DataFrame, True at divisions
+    """
+    if isinstance(peaks, TrackStore):
+        return detect_divisions_ragged(peaks, size_jumps, time_step, window)
+    is_peak = peaks.to_numpy() == 1
+    # peaks without a peak at the previous time point
+    previous_is_peak = peaks.reindex(peaks.index - time_step, fill_value=0).to_numpy() == 1
+    first_peaks = is_peak & ~previous_is_peak
+
+    # size drops between each time point and time point + window, from cumulative sums of size drops
+    size_drops = size_jumps.reindex(index=peaks.index, columns=peaks.columns, fill_value=0).to_numpy() == -1
+    cumulative_drops = np.zeros((size_drops.shape[0] + 1, size_drops.shape[1]), dtype=np.int64)
+    np.cumsum(size_drops, axis=0, out=cumulative_drops[1:])
+    frames = peaks.index.to_numpy()
+    window_ends = np.searchsorted(frames, frames + window, side="right")
+    drop_in_window = cumulative_drops[window_ends] > cumulative_drops[:-1]
+
+    return pd.DataFrame(first_peaks & drop_in_window, index=peaks.index, columns=peaks.columns)
+
+def detect_divisions_ragged(peaks:TrackStore, size_jumps:TrackStore, time_step:int, window:int)->TrackStore:
+    first_peaks = (peaks.values == 1) & (peaks.shift_frames(time_step, fill_value=0).values != 1)
+
+    # size drops between each time point and time point + window (or the end of the track)
+    size_drops = size_jumps.reindex_like(peaks, fill_value=0).values == -1
+    cumulative_drops = np.zeros(len(size_drops) + 1, dtype=np.int64)
+    np.cumsum(size_drops, out=cumulative_drops[1:])
+    tracks = peaks.point_tracks()
+    track_end_rows = (peaks.start_rows + peaks.lengths)[tracks]
+    window_end_rows = np.minimum(np.searchsorted(peaks.frames.to_numpy(), peaks.point_frames() + window, side="right"),
+                                 track_end_rows)
+    window_ends = peaks.offsets[:-1][tracks] + window_end_rows - peaks.start_rows[tracks]
+    drop_in_window = cumulative_drops[window_ends] > cumulative_drops[:-1]
+
+    return peaks.with_values(first_peaks & drop_in_window)
+
+def mask_to_dict(mask:Union[pd.DataFrame, TrackStore])->dict[str:list[int]]:
+    """
+    :param mask: boolean DataFrame, e.g. True at divisions
+    :return: dict with sorted list of frames where mask is True per cell
+    """
+    if isinstance(mask, TrackStore):
+        # values are sorted by cell, then frame
+        points = np.nonzero(mask.values)[0]
+        frames = np.split(mask.point_frames()[points],
+                          np.cumsum(np.bincount(mask.point_tracks()[points], minlength=len(mask.track_ids)))[:-1])
+        return {cell: cell_frames.tolist() for cell, cell_frames in zip(mask.track_ids, frames)}
+    # non-zero entries of the transposed mask are sorted by cell, then frame
+    track_idx, frame_idx = np.nonzero(mask.to_numpy().T)
+    frames = np.split(mask.index.to_numpy()[frame_idx],
+                      np.cumsum(np.bincount(track_idx, minlength=mask.shape[1]))[:-1])
+    return {cell: cell_frames.tolist() for cell, cell_frames in zip(mask.columns, frames)}
+
+def get_window_offsets(rel_start:float, rel_end:float, tracking_interval:float, time_transformer:int=1)->range:
+    """
+    :param rel_start: float in hours
+    :param rel_end: float in hours
+    :param tracking_interval: float in minutes
+    :return: offsets in frames of all time points within the interval
+    """
+    if time_transformer == 1:
+        rel_start = int(round(rel_start / (tracking_interval / 60)))
+        rel_end = int(round(rel_end / (tracking_interval / 60)))
+    else:
+        rel_start = rel_start * time_transformer
+        rel_end = rel_end * time_transformer
+    return range(rel_start, rel_end + 1, time_transformer)
+
+def get_division_windows(divisions:Union[pd.DataFrame, TrackStore],
+                         rel_start:float,
+                         rel_end:float,
+                         tracking_interval:float,
+                         time_transformer:int=1,
+                         )->Union[pd.DataFrame, TrackStore]:
+    """
+    marks all time points from rel_start to rel_end (hours) around divisions, time point 0 is never marked
+    :param divisions: boolean DataFrame, True at divisions
+    :return: boolean DataFrame, same shape as divisions
+    """
+    if isinstance(divisions, TrackStore):
+        windows = np.zeros(len(divisions.values), dtype=bool)
+        for offset in get_window_offsets(rel_start, rel_end, tracking_interval, time_transformer):
+            windows |= divisions.shift_frames(offset, fill_value=False).values
+        windows[divisions.point_frames() <= 0] = False
+        return divisions.with_values(windows)
+    windows = np.zeros(divisions.shape, dtype=bool)
+    for offset in get_window_offsets(rel_start, rel_end, tracking_interval, time_transformer):
+        # time point is in a window if there is a division offset frames before
+        windows |= divisions.reindex(divisions.index - offset, fill_value=False).to_numpy(dtype=bool)
+    windows[divisions.index.to_numpy() <= 0] = False
+    return pd.DataFrame(windows, index=divisions.index, columns=divisions.columns)
+
+def subsample_time_points(time_series:Union[pd.DataFrame, TrackStore], step:int)->Union[pd.DataFrame, TrackStore]:
+    # every step-th time point
+    if isinstance(time_series, TrackStore):
+        return time_series.subsample(step)
+    return time_series.iloc[0::step]
+
+def reindex_tracks(time_series:Union[pd.DataFrame, TrackStore], like:Union[pd.DataFrame, TrackStore],
+                   fill_value)->Union[pd.DataFrame, TrackStore]:
+    # same cells as like, fill_value for cells not in time_series
+    if isinstance(time_series, TrackStore):
+        return time_series.reindex_like(like, fill_value=fill_value)
+    return time_series.reindex(columns=like.columns, fill_value=fill_value)
+
+def to_dense(time_series:Union[pd.DataFrame, TrackStore])->pd.DataFrame:
+    if isinstance(time_series, TrackStore):
+        return time_series.to_dense()
+    return time_series
 
 def add_subset_number(name:str, subset_nr:str)->str:
-    return f'{subset_nr}_{name}'
-
-def df_to_numeric(df:pd.DataFrame)->pd.DataFrame:
-    for x in df.columns:
-        df[x]=pd.to_numeric(df[x])
-    return df
-
-def extract_raw_time_series(input_df:pd.DataFrame,
-                            channels_to_color:dict[int:str],
-                            min_len:int
-                            )->dict[str:pd.DataFrame]:
-    signals_raw = {}
-    for channel, color in channels_to_color.items():
-        #per color, extract dataframe with each track as a column containing fluorescence time series
-        signals_raw[color] = (input_df.drop_duplicates(subset=["TRACK_ID", "FRAME"])
-                              .pivot(index="FRAME",
-                                                columns="TRACK_ID",
-                                                    values=f'MEAN_INTENSITY_CH{channel}' )
-                              .reset_index().reset_index(drop=True))
-
-        signals_raw[color].FRAME = pd.to_numeric(signals_raw[color].FRAME)
-        signals_raw[color]= signals_raw[color].sort_values(by="FRAME").set_index("FRAME", drop=True)
-        #drop time series shorter than limit
-        signals_raw[color]= signals_raw[color].loc[:, signals_raw[color].count(axis=0)>min_len]
-        signals_raw[color] = df_to_numeric(signals_raw[color])
-    return signals_raw
-
-
-def extract_size_time_series(input_df:pd.DataFrame, min_len:int)->pd.DataFrame:
-    # extract dataframe with each track as a column containing size time series
-    sizes = input_df.drop_duplicates(subset=["TRACK_ID", "FRAME"]).pivot(index="FRAME",
-                                                columns="TRACK_ID",
-                                                    values=f'AREA' ).reset_index().reset_index(drop=True)
-
-    sizes.FRAME = pd.to_numeric(sizes.FRAME)
-    sizes =sizes.sort_values(by="FRAME").set_index("FRAME")
-    # drop time series shorter than limit
-    sizes = sizes.loc[:, sizes.count(axis=0)>min_len]
-    return df_to_numeric(sizes)
\ No newline at end of file
+    # works for single names as well as for a pd.Series of names
+    return f'{subset_nr}_' + name
+
+# TrackMate writes three rows with feature names, short names and units below the header
+SPOT_TABLE_HEADER_ROWS = [1, 2, 3]
+# rows of a spot table parsed between two checks for cancellation
+SPOT_TABLE_CHUNK_ROWS = 100000
+
+def get_spot_table_columns(channels:list[int])->list[str]:
+    return ["TRACK_ID", "FRAME", "AREA"] + [f'MEAN_INTENSITY_CH{channel}' for channel in channels]
+
+def read_spot_table(file:str, channels:list[int],
+                    cancellation_token:Optional[CancellationToken]=None)->pd.DataFrame:
+    """
+    reads a TrackMate spot table, only parses columns used for the analysis
+    :param channels: channel numbers, MEAN_INTENSITY_CH{channel} is read for each
+    :param cancellation_token: the file is read in chunks of SPOT_TABLE_CHUNK_ROWS, checked after each
+    :return: DataFrame with numeric columns TRACK_ID (int), FRAME (int), AREA, MEAN_INTENSITY_CH{channel}
+    """
+    columns = get_spot_table_columns(channels)
+    read_options = {"usecols": columns,
+                    "skiprows": SPOT_TABLE_HEADER_ROWS,
+                    "dtype": {column: np.float64 for column in columns},
+                    "engine": "c"}
+    if cancellation_token is None:
+        spot_table = pd.read_csv(file, **read_options)
+    else:
+        chunks = []
+        with pd.read_csv(file, chunksize=SPOT_TABLE_CHUNK_ROWS, **read_options) as reader:
+            for chunk in reader:
+                cancellation_token.check()
+                chunks.append(chunk)
+        spot_table = pd.concat(chunks, ignore_index=True)
+    #spots not assigned to a track have no TRACK_ID
+    spot_table = spot_table.dropna(subset=["TRACK_ID"])
+    spot_table = spot_table.astype({"TRACK_ID": np.int64, "FRAME": np.int64})
+    return spot_table[columns]
+
+# threads reading subset files of a dataset at the same time (mostly waiting for disk/network)
+MAX_LOADING_THREADS = 8
+
+def load_subset_table(subset:str, file:str, channels:list[int],
+                      spot_table_cache:Optional[SpotTableCache]=None,
+                      cancellation_token:Optional[CancellationToken]=None)->Optional[pd.DataFrame]:
+    """
+    reads the spot table of a subset (from the cache if available) and adds the subset name to the TRACK_IDs
+    :return: DataFrame or None if the file is missing or could not be read
+    :raises AnalysisCancelled: if cancellation_token is cancelled while reading
+    """
+    # loading cell data
+    if not os.path.exists(file):
+        logger.warning(F"file: {file} not found")
+        return None
+    try:
+        logger.debug("processing file %s", file)
+        columns = get_spot_table_columns(channels)
+        input_table = spot_table_cache.load(file, columns) if spot_table_cache else None
+        if input_table is None:
+            #read subset csv, only the columns needed
+            input_table = (read_spot_table(file, channels=channels, cancellation_token=cancellation_token)
+                           .drop_duplicates(subset=["TRACK_ID", "FRAME"])
+                           .reset_index(drop=True))
+            if spot_table_cache:
+                spot_table_cache.store(file, columns, input_table)
+        #add subset name to TRACK_IDs
+        input_table["TRACK_ID"] = add_subset_number(input_table["TRACK_ID"].astype(str), subset)
+        return input_table
+    except AnalysisCancelled:
+        raise
+    except Exception:
+        logger.warning(f'subset {subset} could not be loaded from {file}')
+        return None
+
+def load_subset_tables(input_file_list:list[tuple[str, str]], channels:list[int],
+                       max_threads:int=MAX_LOADING_THREADS,
+                       spot_table_cache:Optional[SpotTableCache]=None,
+                       progress:Optional[StageProgress]=None,
+                       )->tuple[dict[str:pd.DataFrame], list[tuple[str, str]]]:
+    """
+    reads the spot tables of all subsets concurrently
+    :param input_file_list: list of (subset, file)
+    :param progress: updated when a file is loaded, checks for cancellation
+    :return: dict with DataFrame per subset (in order of input_file_list), list of (subset, file) used
+    """
+    progress = progress or StageProgress()
+    loaded_files = 0
+    loaded_files_lock = threading.Lock()
+    def load(subset_file:tuple[str, str])->Optional[pd.DataFrame]:
+        nonlocal loaded_files
+        input_table = load_subset_table(*subset_file, channels=channels, spot_table_cache=spot_table_cache,
+                                        cancellation_token=progress.cancellation_token)
+        with loaded_files_lock:
+            loaded_files += 1
+            progress.update(loaded_files / len(input_file_list))
+        return input_table
+
+    n_threads = max(1, min(max_threads, len(input_file_list)))
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        input_tables = list(executor.map(load, input_file_list))
+
+    input_tables_cells = {}
+    input_files_used = []
+    for (subset, file), input_table in zip(input_file_list, input_tables):
+        if input_table is None:
+            continue
+        #store subset-data in 'input_table_cells'
+        input_tables_cells[subset] = input_table
+        input_files_used.append((subset, file))
+    return input_tables_cells, input_files_used
+
+def pivot_spot_table(input_df:pd.DataFrame, features:list[str])->tuple[np.ndarray, pd.Index, pd.Index]:
+    """
+    pivots all features in one pass, duplicated spots (same TRACK_ID and FRAME) are dropped (first is kept)
+    :param features: columns of input_df
+    :return: values with shape (features, frames, tracks), NaN where a track has no spot;
+             sorted FRAME index; sorted TRACK_ID index
+    """
+    track_codes, track_ids = pd.factorize(input_df["TRACK_ID"], sort=True)
+    frame_codes, frames = pd.factorize(input_df["FRAME"], sort=True)
+
+    #drop duplicates, keep first spot per track and frame
+    first_spot = ~pd.Series(track_codes.astype(np.int64) * len(frames) + frame_codes).duplicated().to_numpy()
+
+    values = np.full((len(features), len(frames), len(track_ids)), np.nan)
+    values[:, frame_codes[first_spot], track_codes[first_spot]] = (
+        input_df[features].to_numpy(dtype=np.float64)[first_spot].T)
+    return values, pd.Index(frames, name="FRAME"), pd.Index(track_ids, name="TRACK_ID")
+
+
+def time_series_from_pivot(values:np.ndarray, frames:pd.Index, track_ids:pd.Index, features:list[str],
+                           min_len:int)->dict[str:pd.DataFrame]:
+    """
+    splits pivoted values into a DataFrame per feature (frames as index, tracks as columns),
+    time series not longer than min_len are dropped
+    """
+    counts = np.count_nonzero(~np.isnan(values), axis=1)
+    keep = counts > min_len
+    if (keep == keep[0]).all():
+        # usual case, all features have values for the same spots: select tracks once, DataFrames are views
+        values = values[:, :, keep[0]]
+        track_ids = track_ids[keep[0]]
+        return {feature: pd.DataFrame(values[i], index=frames, columns=track_ids, copy=False)
+                for i, feature in enumerate(features)}
+    return {feature: pd.DataFrame(values[i][:, keep[i]], index=frames, columns=track_ids[keep[i]], copy=False)
+            for i, feature in enumerate(features)}
+
+
+def time_series_from_ragged_pivot(values:np.ndarray, offsets:np.ndarray, start_rows:np.ndarray, frames:pd.Index,
+                                  track_ids:pd.Index, features:list[str], min_len:int)->dict[str:TrackStore]:
+    """
+    splits ragged pivoted values into a TrackStore per feature, time series not longer than min_len are dropped
+    """
+    time_series = {}
+    for i, feature in enumerate(features):
+        feature_store = TrackStore(values[i], offsets, start_rows, frames, track_ids)
+        time_series[feature] = feature_store.select(feature_store.count() > min_len)
+    return time_series
+
+# use TrackStores if less than this fraction of the DataFrames (frames x tracks) would hold values
+RAGGED_TRACK_STORE_MAX_FILL_RATIO = 0.5
+TRACK_STORE_OPTIONS = ("auto", "dense", "ragged")
+
+def use_ragged_track_store(input_df:pd.DataFrame, track_store:str="auto")->bool:
+    """
+    :param track_store: "dense" (DataFrames), "ragged" (TrackStores) or "auto" (ragged for sparse data)
+    """
+    if track_store not in TRACK_STORE_OPTIONS:
+        raise ValueError(f"track_store has to be one of {TRACK_STORE_OPTIONS}, not {track_store}")
+    if track_store == "auto":
+        return get_fill_ratio(input_df) < RAGGED_TRACK_STORE_MAX_FILL_RATIO
+    return track_store == "ragged"
+
+def get_time_series_features(channels_to_color:dict[int:str])->list[str]:
+    return ["AREA"] + [f'MEAN_INTENSITY_CH{channel}' for channel in channels_to_color]
+
+def get_pivot_cache_key(input_file_list:list[tuple[str, str]], channels:list[int], track_store:str)->tuple:
+    """
+    :param input_file_list: list of (subset, file)
+    :return: key of the pivoted time series in a SessionCache, changes if an input file changes
+    """
+    file_identities = []
+    for subset, file in input_file_list:
+        try:
+            file_identities.append((subset, get_file_identity(file)))
+        except OSError:
+            file_identities.append((subset, file, "missing"))
+    return tuple(file_identities), tuple(channels), track_store
+
+def pivot_time_series(input_df:pd.DataFrame, channels_to_color:dict[int:str], ragged:bool=False)->tuple:
+    """
+    pivots object size and fluorescence of all tracks (see pivot_spot_table and ragged_pivot_spot_table),
+    the result does not depend on min_len and can be reused (time_series_from_pivoted)
+    :param ragged: ragged layout for TrackStores instead of frames x tracks arrays
+    """
+    features = get_time_series_features(channels_to_color)
+    if ragged:
+        return ragged_pivot_spot_table(input_df, features)
+    return pivot_spot_table(input_df, features)
+
+def time_series_from_pivoted(pivoted:tuple, channels_to_color:dict[int:str], min_len:int, ragged:bool=False,
+                             )->tuple[Union[pd.DataFrame, TrackStore], dict[str:Union[pd.DataFrame, TrackStore]]]:
+    """
+    :param pivoted: from pivot_time_series
+    :return: sizes, dict with colors as keys and fluorescence time series as values,
+             time series not longer than min_len are dropped
+    """
+    features = get_time_series_features(channels_to_color)
+    if ragged:
+        time_series = time_series_from_ragged_pivot(*pivoted, features=features, min_len=min_len)
+    else:
+        time_series = time_series_from_pivot(*pivoted, features=features, min_len=min_len)
+
+    sizes = time_series["AREA"]
+    signals_raw = {color: time_series[f'MEAN_INTENSITY_CH{channel}'] for channel, color in channels_to_color.items()}
+    return sizes, signals_raw
+
+def extract_time_series(input_df:pd.DataFrame,
+                        channels_to_color:dict[int:str],
+                        min_len:int,
+                        ragged:bool=False,
+                        )->tuple[Union[pd.DataFrame, TrackStore], dict[str:Union[pd.DataFrame, TrackStore]]]:
+    """
+    extracts object size and fluorescence time series, each track as a column
+    :param ragged: return TrackStores instead of DataFrames
+    :return: sizes, dict with colors as keys and fluorescence time series as values
+    """
+    return time_series_from_pivoted(pivot_time_series(input_df, channels_to_color, ragged=ragged),
+                                    channels_to_color, min_len, ragged=ragged)
\ No newline at end of file
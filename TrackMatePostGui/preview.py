@@ -0,0 +1,78 @@
+import copy
+from typing import Optional, Union
+import numpy as np
+import pandas as pd
+from logger import logger
+from settings import Settings
+from cache import SpotTableCache, SessionCache
+from tracks import TrackStore
+from methods import (load_pivoted_time_series, time_series_from_pivoted, get_time_transformer,
+                     prepare_quality_control, quality_control)
+
+# cells shown as example traces
+PREVIEW_TRACES = 5
+
+
+def select_cells(time_series:Union[pd.DataFrame, TrackStore], cells:pd.Index, fill_value=np.nan)->pd.DataFrame:
+    """
+    :return: DataFrame with a column per cell (fill_value for cells not in time_series)
+    """
+    if isinstance(time_series, TrackStore):
+        time_series = time_series.select(time_series.track_ids.isin(cells)).to_dense(fill_value)
+    return time_series.reindex(columns=cells, fill_value=fill_value)
+
+
+class QualityControlPreview():
+    """
+    Quality control of one dataset for changing thresholds, e.g. while they are adjusted in the advanced settings.
+    The dataset is loaded and the steps that do not depend on the thresholds are done once
+    (prepare_quality_control), update() only reruns quality_control.
+    """
+
+    def __init__(self, input_folder:str, dataset_name:str, files:list, settings:Settings, advanced_settings:dict,
+                 spot_table_cache:Optional[SpotTableCache]=None, session_cache:Optional[SessionCache]=None,
+                 n_traces:int=PREVIEW_TRACES):
+        # get_time_transformer might switch off the time transformation
+        settings = copy.copy(settings)
+        self.dataset_name = dataset_name
+        self.min_len = settings.min_len
+        self.tracking_interval = settings.tracking_interval
+
+        ragged, pivoted = load_pivoted_time_series(input_folder, dataset_name, files, settings, advanced_settings,
+                                                   spot_table_cache=spot_table_cache, session_cache=session_cache)
+        object_sizes, signals_raw = time_series_from_pivoted(pivoted, settings.channel_names, settings.min_len,
+                                                             ragged=ragged)
+        self.time_transformer = get_time_transformer(settings)
+        self.quality_control_input = prepare_quality_control(object_sizes,
+                                                             signals_raw[settings.get_tracking_marker_name()],
+                                                             self.time_transformer)
+        # quality_control filters the first color (as analyze_dataset)
+        self.signals = next(iter(signals_raw.values()))
+
+        # evenly spread over all cells
+        cells = self.signals.columns
+        self.trace_cells = cells[np.linspace(0, len(cells) - 1, min(n_traces, len(cells))).astype(int)]
+        self.traces = select_cells(self.signals, self.trace_cells)
+        logger.debug("quality control preview of %s with %d cells", dataset_name, len(cells))
+
+    def update(self, advanced_settings:dict)->dict:
+        """
+        :param advanced_settings: thresholds
+        :return: dict with numbers of "cells", "approved_cells", "flagged_cells" (cells with potential tracking errors),
+                 "divisions" and "close_divisions" (cells with divisions less than 15 h apart),
+                 raw "traces" of the sample cells (frames x cells) and their "approved_traces" (NaN where removed),
+                 "division_frames" per sample cell, tracking "interval"
+        """
+        results = quality_control(self.quality_control_input, self.signals, advanced_settings, self.min_len,
+                                  self.tracking_interval, self.time_transformer)
+        sample_divisions = select_cells(results["divisions"], self.trace_cells, fill_value=False)
+        return {"cells": len(self.signals.columns),
+                "approved_cells": len(results["filtered"].columns),
+                "flagged_cells": int(np.count_nonzero(np.asarray(results["flags"].sum()) > 0)),
+                "divisions": int(np.asarray(results["divisions"].sum()).sum()),
+                "close_divisions": int(results["close_divisions"].sum()),
+                "traces": self.traces,
+                "interval": self.tracking_interval,
+                "approved_traces": select_cells(results["filtered"], self.trace_cells),
+                "division_frames": {cell: list(sample_divisions.index[sample_divisions[cell].to_numpy()])
+                                    for cell in self.trace_cells}}
@@ -0,0 +1,138 @@
+import cProfile
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import psutil
+except ImportError:
+    # memory is read from /proc on linux, not measured elsewhere
+    psutil = None
+
+# seconds between two measurements of the memory while a stage runs
+RSS_SAMPLE_INTERVAL = 0.005
+
+
+def get_rss()->Optional[int]:
+    """
+    :return: resident set size (memory in RAM) of this process in bytes, None if it can not be measured
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def to_megabytes(size:Optional[int])->Optional[float]:
+    return None if size is None else round(size / 2**20, 1)
+
+
+class PeakRSS():
+    """
+    measures the resident set size in a background thread while the context is active
+
+        with PeakRSS() as rss:
+            ...
+        rss.start, rss.peak
+    """
+
+    def __init__(self, interval:float=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.start = None
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self)->"PeakRSS":
+        self.start = self.peak = get_rss()
+        if self.start is not None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._update(get_rss())
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._update(get_rss())
+
+    def _update(self, rss:Optional[int]):
+        if rss is not None and rss > self.peak:
+            self.peak = rss
+
+
+class StageTimer():
+    """
+    time and peak memory of consecutive stages
+
+        timer = StageTimer()
+        with timer.stage("load"):
+            ...
+        timer.stages
+    """
+
+    def __init__(self):
+        # dicts with "stage", "seconds", "start_rss_mb" and "peak_rss_mb" (None if memory can not be measured)
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name:str):
+        start = time.perf_counter()
+        with PeakRSS() as rss:
+            yield
+        self.stages.append({"stage": name,
+                            "seconds": round(time.perf_counter() - start, 4),
+                            "start_rss_mb": to_megabytes(rss.start),
+                            "peak_rss_mb": to_megabytes(rss.peak)})
+
+
+class DatasetReport(StageTimer):
+    """
+    stages (see StageTimer) and counters (rows read, tracks, flags, divisions, ...) of one dataset,
+    written to run_report.json (see runner.write_run_report)
+    """
+
+    def __init__(self, dataset:str):
+        super().__init__()
+        self.dataset = dataset
+        self.counters = {}
+
+    def count(self, name:str, value:int):
+        self.counters[name] = int(value)
+
+    def to_dict(self)->dict:
+        peaks = [stage["peak_rss_mb"] for stage in self.stages if stage["peak_rss_mb"] is not None]
+        return {"dataset": self.dataset,
+                "seconds": round(sum(stage["seconds"] for stage in self.stages), 4),
+                "peak_rss_mb": max(peaks, default=None),
+                "stages": list(self.stages),
+                "counters": dict(self.counters)}
+
+
+@contextmanager
+def profile_to(path:Optional[str]):
+    """
+    profiles the calls in the context with cProfile and writes the stats to path (read with pstats or snakeviz),
+    does nothing if path is None
+    """
+    if path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
@@ -0,0 +1,83 @@
+import threading
+from typing import Callable, Optional
+
+
+class AnalysisCancelled(Exception):
+    """
+    raised at the next check after a run was stopped (see CancellationToken)
+    """
+
+
+class CancellationToken():
+    """
+    set when a run is stopped, checked by analyze_dataset between stages and inside long loops
+
+        token = CancellationToken()
+        token.cancel()     # e.g. Stop button
+        token.check()      # raises AnalysisCancelled
+
+    :param event: threading.Event by default, a multiprocessing.Manager().Event() to stop worker processes
+    """
+
+    def __init__(self, event=None):
+        self.event = event if event is not None else threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    def is_cancelled(self)->bool:
+        return self.event.is_set()
+
+    def check(self):
+        if self.event.is_set():
+            raise AnalysisCancelled()
+
+
+class StageProgress():
+    """
+    reports the progress of a dataset (0 to 1) to a sink and checks for cancellation at each update,
+    part() maps the progress of a step (0 to 1) to its range of the dataset, e.g. per file while loading
+
+        progress = StageProgress(token, sink)
+        loading = progress.part(0, 0.4)
+        loading.update(0.5)    # sink(0.2)
+    """
+
+    def __init__(self, cancellation_token:Optional[CancellationToken]=None,
+                 sink:Optional[Callable[[float], None]]=None, start:float=0.0, end:float=1.0):
+        self.cancellation_token = cancellation_token
+        self.sink = sink
+        self.start = start
+        self.end = end
+
+    def update(self, fraction:float):
+        """
+        :param fraction: fraction of this step done
+        """
+        if self.cancellation_token is not None:
+            self.cancellation_token.check()
+        if self.sink is not None:
+            self.sink(self.start + min(max(fraction, 0.0), 1.0) * (self.end - self.start))
+
+    def part(self, start:float, end:float)->"StageProgress":
+        """
+        :param start: start of the step, as fraction of this step
+        :param end: end of the step, as fraction of this step
+        """
+        length = self.end - self.start
+        return StageProgress(self.cancellation_token, self.sink,
+                             self.start + start * length, self.start + end * length)
+
+
+class QueueProgressSink():
+    """
+    progress sink of a worker process, puts (dataset, fraction) into a multiprocessing.Manager().Queue()
+    read by the main process (picklable, unlike the callbacks of the main process)
+    """
+
+    def __init__(self, queue, dataset:str):
+        self.queue = queue
+        self.dataset = dataset
+
+    def __call__(self, fraction:float):
+        self.queue.put((self.dataset, fraction))
@@ -0,0 +1,348 @@
+import os
+import json
+import datetime
+import functools
+import traceback
+import multiprocessing
+from contextlib import ExitStack
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+from logger import logger, listen_to_workers, log_to_queue
+from settings import Settings, save_settings_file
+from cache import SpotTableCache, SessionCache
+from methods import analyze_dataset, create_folder, EXPORT_PROGRESS_START
+from progress import AnalysisCancelled, CancellationToken, QueueProgressSink, StageProgress
+from writers import write_result_tables
+from profiling import profile_to
+from figures import render_overview_figure
+
+# processes rendering overview figures while the next datasets are analyzed
+FIGURE_WORKERS = 2
+# time and memory per stage and counters of each dataset, next to used_settings.txt
+RUN_REPORT_FILE = "run_report.json"
+# seconds between checks for cancellation and progress of parallel worker processes
+PROGRESS_INTERVAL = 0.2
+
+
+def create_main_output_folder(input_folder:str)->str:
+    now = datetime.datetime.now()
+    return create_folder(input_folder + "/" + f"grouped_results(post_script_output_"
+                                              f"{now:%y-%m-%d_%H-%M})/")
+
+
+def write_settings_file(settings:Settings, advanced_settings:dict, input_folder:str,
+                        datasets:list, files:list, output_folder:str):
+    settings_file_path = os.path.join(output_folder, "used_settings.txt")
+    with open(settings_file_path, "w") as used_settings_file:
+        settings_text = (
+            f'input folder: {input_folder}\n'
+            f'number of channels: {settings.number_channels}\n'
+            f'tracking channel: {settings.tracking_channel}\n')
+        for n in range(1,settings.number_channels+1):
+            settings_text += f"Name Channel {n}: {settings.channel_names[n]}\n"
+        settings_text += (
+            f'minimum time points: {settings.min_len}\n'
+            f'tracking interval: {settings.tracking_interval}\n'
+            f'number of digits: {settings.digits}\n'
+            f'delimiter: {settings.delimiter}\n'
+            f'transform timepoints: {settings.transform}\n'
+            f'file_suffix: {settings.suffix}\n'
+            f'output formats: {", ".join(settings.output_formats)}\n'
+            f'long layout: {settings.long_layout}\n'
+            f'raw tables of all cells: {settings.write_raw_all_cells}\n'
+            f'overview figures: {settings.render_figures}\n')
+        for setting_name, value in advanced_settings.items():
+            settings_text += f"{setting_name}: {value}\n"
+        settings_text += "\nDATASETS:\n"
+        for dataset in datasets:
+            settings_text+=f'  {dataset}\n'
+
+        settings_text += "\nFILES:\n"
+        for file in files:
+            settings_text += f'  {file}\n'
+
+        used_settings_file.writelines(settings_text)
+        logger.info(f'settings stored at {settings_file_path}')
+
+    # machine readable copy, can be used to rerun the analysis with cli.py
+    save_settings_file(os.path.join(output_folder, "used_settings.json"), settings, advanced_settings)
+
+
+def write_run_report(path:str, dataset_reports:list[dict], workers:int):
+    """
+    :param dataset_reports: see profiling.DatasetReport.to_dict, in order of completion
+    """
+    with open(path, "w") as report_file:
+        json.dump({"workers": workers,
+                   "seconds": round(sum(report["seconds"] for report in dataset_reports), 4),
+                   "datasets": dataset_reports}, report_file, indent=4)
+
+
+def run_datasets(input_folder:str, datasets:list, files:list, settings:Settings, advanced_settings:dict,
+                 main_output_folder:str,
+                 progress_callback:Optional[Callable[[float], None]]=None,
+                 result_callback:Optional[Callable[[dict], None]]=None,
+                 cancellation_token:Optional[CancellationToken]=None,
+                 workers:int=1,
+                 spot_table_cache:Optional[SpotTableCache]=None,
+                 figure_callback:Optional[Callable[[dict], None]]=None,
+                 session_cache:Optional[SessionCache]=None,
+                 profile:bool=False,
+                 )->bool:
+    """
+    analyzes all datasets, used by the GUI and the command line interface
+    :param files: list of file paths
+    :param progress_callback: called with the number of processed datasets, including the processed part of
+                              running datasets (e.g. 2.5), updated between the stages of each dataset
+    :param result_callback: called with the results dict of each dataset (not for datasets stopped while running)
+    :param cancellation_token: cancel() to stop processing, running datasets stop at their next stage or loop step
+    :param workers: number of datasets analyzed in parallel (separate processes)
+    :param spot_table_cache: on-disk cache for parsed input files, None to always read the csv files
+    :param figure_callback: called with the results dict (with "fig_path") when the overview figure of a dataset
+                            is rendered, results are reported before their figure
+    :param session_cache: in-memory cache of pivoted time series, kept between runs (not used by parallel workers)
+    :param profile: write cProfile stats of each dataset to its output folder (with workers=1 the export
+                    of the result tables to a separate {dataset}_export_profile.prof)
+    :return: True if all datasets were processed, False if stopped,
+             time and memory per stage of each dataset are written to run_report.json in main_output_folder
+    """
+    logger.info(f"Start processing {len(files)} files from {len(datasets)} datasets")
+    logger.info(f"data will be stored at {main_output_folder}")
+    logger.info(f"Settings are: {settings}")
+
+    cancellation_token = cancellation_token or CancellationToken()
+    analysis_kwargs = {"input_folder": input_folder,
+                       "files": files,
+                       "settings": settings,
+                       "main_output_folder": main_output_folder,
+                       "advanced_settings": advanced_settings,
+                       "spot_table_cache": spot_table_cache,
+                       "session_cache": session_cache,
+                       "profile": profile,
+                       "cancellation_token": cancellation_token,
+                       }
+
+    # fraction done per dataset, all datasets are in the dict from the start (updated from several threads)
+    dataset_progress = dict.fromkeys(datasets, 0.0)
+    def update_progress(dataset:str, fraction:float):
+        dataset_progress[dataset] = max(dataset_progress[dataset], fraction)
+        if progress_callback:
+            progress_callback(sum(dataset_progress.values()))
+
+    # updated after every dataset, slow or stopped runs have the numbers of the finished datasets
+    dataset_reports = []
+    def report_result(results:dict):
+        if results.get("report") is not None:
+            results["report"] = results["report"].to_dict()
+            dataset_reports.append(results["report"])
+            write_run_report(os.path.join(main_output_folder, RUN_REPORT_FILE), dataset_reports, workers)
+        update_progress(results["dataset"], 1.0)
+        if result_callback:
+            result_callback(results)
+
+    parallel = workers > 1 and len(datasets) > 1
+    render_figures = settings.render_figures and len(datasets) > 0
+    with ExitStack() as stack:
+        # spawn instead of fork, forking the (multithreaded) GUI process is not safe
+        mp_context = multiprocessing.get_context("spawn")
+        manager = worker_init_args = None
+        if parallel or render_figures:
+            # worker processes get the cancellation, report their progress and send their log records
+            # through the manager process, only this process writes the log files
+            manager = stack.enter_context(mp_context.Manager())
+            worker_log_queue = stack.enter_context(listen_to_workers(manager.Queue()))
+            worker_init_args = (worker_log_queue, logger.getEffectiveLevel())
+
+        # overview figures are rendered in separate processes, analysis and reporting do not wait for them
+        figure_executor = None
+        if render_figures:
+            figure_executor = ProcessPoolExecutor(max_workers=min(FIGURE_WORKERS, len(datasets)),
+                                                  mp_context=mp_context,
+                                                  initializer=_init_worker, initargs=worker_init_args)
+        def render_figure(results:dict):
+            figure_data = results.pop("figure_data", None)
+            if figure_executor is None or figure_data is None:
+                return
+            try:
+                rendered = figure_executor.submit(render_overview_figure, figure_data, results["output_folder"])
+            except BrokenProcessPool:
+                # a figure process died before (e.g. out of memory), the pool takes no more figures
+                _render_figure_here(results, figure_data, figure_callback)
+                return
+            rendered.add_done_callback(functools.partial(_figure_rendered, results, figure_data,
+                                                         figure_callback))
+
+        completed = False
+        try:
+            if parallel:
+                completed = _run_datasets_parallel(sorted(datasets), analysis_kwargs, workers, mp_context, manager,
+                                                   worker_init_args, update_progress, report_result,
+                                                   cancellation_token, render_figure)
+            else:
+                completed = _run_datasets_sequential(sorted(datasets), analysis_kwargs, settings,
+                                                     update_progress, report_result, cancellation_token,
+                                                     render_figure)
+        finally:
+            if figure_executor is not None:
+                # figures of reported datasets are finished, when stopped figures not started yet are dropped
+                # and figures being rendered are finished in the background
+                figure_executor.shutdown(wait=completed, cancel_futures=not completed)
+        return completed
+
+
+def _figure_rendered(results:dict, figure_data:dict, figure_callback:Optional[Callable[[dict], None]],
+                     rendered:Future):
+    if rendered.cancelled():
+        return
+    try:
+        results["fig_path"] = rendered.result()
+    except BrokenProcessPool:
+        _render_figure_here(results, figure_data, figure_callback)
+        return
+    except Exception:
+        logger.error(f'overview figure of {results["dataset"]} failed:\n{traceback.format_exc()}')
+        return
+    if figure_callback:
+        figure_callback(results)
+
+
+def _render_figure_here(results:dict, figure_data:dict, figure_callback:Optional[Callable[[dict], None]]):
+    """
+    renders the overview figure in this process when the figure processes are gone, a process of the pool
+    terminated abruptly (killed, out of memory, or the main script can not be imported again by spawn,
+    e.g. code run from stdin)
+    """
+    logger.warning(f'figure process terminated, rendering overview figure of {results["dataset"]} in this process')
+    try:
+        results["fig_path"] = render_overview_figure(figure_data, results["output_folder"])
+    except Exception:
+        logger.error(f'overview figure of {results["dataset"]} failed:\n{traceback.format_exc()}')
+        return
+    if figure_callback:
+        figure_callback(results)
+
+
+def _run_datasets_sequential(datasets:list, analysis_kwargs:dict, settings:Settings,
+                             update_progress:Callable[[str, float], None],
+                             result_callback:Callable[[dict], None],
+                             cancellation_token:CancellationToken,
+                             render_figure:Callable[[dict], None],
+                             )->bool:
+    # result files of a dataset are written in a background thread while the next dataset is analyzed,
+    # results are reported when their files are written
+    def report(results:dict, output_written:Optional[Future]=None):
+        if output_written is not None:
+            try:
+                output_written.result()
+            except AnalysisCancelled:
+                # stopped while writing, the files are incomplete
+                results["cancelled"] = True
+                return
+            except Exception:
+                results["error"] = traceback.format_exc()
+                results["run_complete"] = False
+        result_callback(results)
+
+    pending_output = None
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="result_writer") as output_executor:
+        for dataset in datasets:
+            if cancellation_token.is_cancelled():
+                break
+            # analyze dataset
+            results = analyze_dataset(dataset_name=dataset, write_output=False,
+                                      progress_callback=functools.partial(update_progress, dataset),
+                                      **analysis_kwargs)
+            if results["cancelled"]:
+                break
+            render_figure(results)
+            # at most one dataset waits for its files to be written
+            if pending_output:
+                report(*pending_output)
+                pending_output = None
+            if "result_tables" in results:
+                output_written = output_executor.submit(
+                    _write_result_tables, results, settings,
+                    StageProgress(cancellation_token, functools.partial(update_progress, dataset)
+                                  ).part(EXPORT_PROGRESS_START, 1),
+                    analysis_kwargs["profile"])
+                pending_output = (results, output_written)
+            else:
+                report(results)
+        if pending_output:
+            report(*pending_output)
+    if cancellation_token.is_cancelled():
+        logger.info("process aborted manually")
+        return False
+    return True
+
+
+def _write_result_tables(results:dict, settings:Settings, progress:StageProgress, profile:bool=False):
+    # the export is a stage of the dataset's report, even though it runs after analyze_dataset,
+    # it runs in the writer thread, so it gets its own cProfile file next to the one of the analysis
+    profile_path = os.path.join(results["output_folder"], f"{results['dataset']}_export_profile.prof")
+    with profile_to(profile_path if profile else None), results["report"].stage("export"):
+        write_result_tables(results.pop("result_tables"), results["output_folder"], results["dataset"],
+                            output_formats=settings.output_formats, long_layout=settings.long_layout,
+                            progress=progress)
+
+
+def _init_worker(worker_log_queue, log_level:int):
+    # log records are written by the main process
+    log_to_queue(worker_log_queue, log_level)
+    # worker processes have no display, matplotlib only renders to files
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def _run_datasets_parallel(datasets:list, analysis_kwargs:dict, workers:int, mp_context, manager,
+                           worker_init_args:tuple,
+                           update_progress:Callable[[str, float], None],
+                           result_callback:Callable[[dict], None],
+                           cancellation_token:CancellationToken,
+                           render_figure:Callable[[dict], None],
+                           )->bool:
+    workers = min(workers, len(datasets))
+    # worker processes would only get a copy of the session cache
+    analysis_kwargs = dict(analysis_kwargs, session_cache=None)
+    logger.info(f"analyzing datasets in {workers} parallel processes")
+    worker_cancellation_token = CancellationToken(manager.Event())
+    progress_queue = manager.Queue()
+    analysis_kwargs["cancellation_token"] = worker_cancellation_token
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context, initializer=_init_worker,
+                                   initargs=worker_init_args)
+    futures = {executor.submit(analyze_dataset, dataset_name=dataset,
+                               progress_callback=QueueProgressSink(progress_queue, dataset),
+                               **analysis_kwargs): dataset
+               for dataset in datasets}
+    pending = set(futures)
+    try:
+        while pending:
+            if cancellation_token.is_cancelled():
+                logger.info("process aborted manually")
+                # running datasets stop at their next check
+                worker_cancellation_token.cancel()
+                executor.shutdown(wait=True, cancel_futures=True)
+                return False
+            done, pending = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+            while not progress_queue.empty():
+                update_progress(*progress_queue.get())
+            # report results in order of completion
+            for future in done:
+                try:
+                    results = future.result()
+                except Exception as err:
+                    # e.g. a worker process was killed
+                    results = {"dataset": futures[future],
+                               "error": f"worker process failed: {err!r}",
+                               "cancelled": False,
+                               "output_folder": None,
+                               "run_complete": False,
+                               "fig_path": None}
+                if results["cancelled"]:
+                    continue
+                render_figure(results)
+                result_callback(results)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return True
@@ -0,0 +1,75 @@
+import json
+import os
+from dataclasses import dataclass, asdict, field
+
+# options shared by the GUI, the command line interface and the analysis modules, defined here so that
+# reading them does not import pandas or matplotlib
+# result file formats, see writers.RESULT_WRITERS
+OUTPUT_FORMATS = ("xlsx", "csv", "parquet")
+# neighbouring cells of overview heatmaps with more cells than pixel rows are combined by their mean or max
+HEATMAP_POOLING_OPTIONS = ("mean", "max")
+# on-disk cache of parsed input files, see cache.SpotTableCache
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "TrackMatePostGui")
+DEFAULT_CACHE_SIZE = 5 * 10**9  # bytes
+
+# default thresholds for quality control, can be changed in the advanced settings
+DEFAULT_ADVANCED_SETTINGS = {
+    "size_jump_threshold": 0.2,
+    "tracking_marker_jump_threshold": 0.18,
+    "tracking_marker_division_peak_threshold": 1.5,
+    # "dense" (frames x tracks tables), "ragged" (only the frames of each track) or "auto" (ragged for sparse data)
+    "track_store": "auto",
+    # "mean" or "max" of neighbouring cells in overview heatmaps with more cells than pixel rows
+    "heatmap_pooling": "mean",
+}
+
+
+@dataclass
+class Settings():
+    min_len: int
+    tracking_interval: float
+    number_channels: int
+    channel_names: dict
+    tracking_channel: int
+    digits: int
+    delimiter: str
+    transform: bool
+    suffix: str
+    # output files, see writers.py
+    output_formats: list = field(default_factory=lambda: ["xlsx"])
+    long_layout: bool = False
+    write_raw_all_cells: bool = True
+    # overview figure per dataset, see figures.py
+    render_figures: bool = True
+
+    def get_tracking_marker_name(self):
+        return self.channel_names[self.tracking_channel]
+
+
+def settings_from_dict(settings_dict:dict)->tuple[Settings, dict]:
+    """
+    builds Settings and the advanced settings from a (json) dictionary
+    :param settings_dict: keys as Settings fields, optional "advanced_settings" dict
+    :return: Settings, advanced_settings
+    """
+    settings_dict = dict(settings_dict)
+    advanced_settings = dict(DEFAULT_ADVANCED_SETTINGS)
+    advanced_settings.update(settings_dict.pop("advanced_settings", {}))
+
+    # json only knows string keys, channel numbers are int
+    settings_dict["channel_names"] = {int(channel): name
+                                      for channel, name in settings_dict["channel_names"].items()}
+    settings_dict.setdefault("number_channels", len(settings_dict["channel_names"]))
+    return Settings(**settings_dict), advanced_settings
+
+
+def load_settings_file(path:str)->tuple[Settings, dict]:
+    with open(path, "r") as settings_file:
+        return settings_from_dict(json.load(settings_file))
+
+
+def save_settings_file(path:str, settings:Settings, advanced_settings:dict):
+    settings_dict = asdict(settings)
+    settings_dict["advanced_settings"] = advanced_settings
+    with open(path, "w") as settings_file:
+        json.dump(settings_dict, settings_file, indent=4)
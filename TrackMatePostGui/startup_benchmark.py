@@ -0,0 +1,80 @@
+"""
+benchmark of the startup time: until the main window is shown (main.py), until the analysis modules are loaded
+in the background, and of the headless interface (cli.py), each in a new python process
+
+    python startup_benchmark.py --repeat 5
+
+also lists the heavy modules loaded at each point, the window should not wait for pandas or matplotlib
+and cli.py should not load Qt or Tk. Without a display, Qt is started with --platform offscreen.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BASEDIR = os.path.dirname(os.path.abspath(__file__))
+# modules that take long to import or are not needed by every entry point
+HEAVY_MODULES = ("pandas", "numpy", "matplotlib", "PyQt5", "tkinter", "idlelib")
+
+# run in a new process each, prints a json line with the seconds and the loaded heavy modules
+GUI_STARTUP = """
+import json, sys, time
+start = time.perf_counter()
+sys.argv = ["main.py"]
+import main
+from PyQt5.QtWidgets import QApplication
+app = QApplication(sys.argv)
+window = main.MainWindow()
+window.show()
+app.processEvents()
+shown = time.perf_counter() - start
+shown_modules = [m for m in HEAVY_MODULES if m in sys.modules]
+main.preload_analysis_modules().join()
+print(json.dumps({"gui_shown": [shown, shown_modules],
+                  "gui_ready": [time.perf_counter() - start, [m for m in HEAVY_MODULES if m in sys.modules]]}))
+"""
+CLI_STARTUP = """
+import json, sys, time
+start = time.perf_counter()
+import cli
+cli.create_parser()
+print(json.dumps({"cli": [time.perf_counter() - start, [m for m in HEAVY_MODULES if m in sys.modules]]}))
+"""
+
+
+def measure(code:str, platform:str)->dict:
+    """
+    :param code: one of GUI_STARTUP, CLI_STARTUP
+    :param platform: Qt platform plugin, e.g. offscreen
+    :return: {name: [seconds, loaded heavy modules]}
+    """
+    env = dict(os.environ)
+    if platform:
+        env["QT_QPA_PLATFORM"] = platform
+    output = subprocess.run([sys.executable, "-c", f"HEAVY_MODULES = {HEAVY_MODULES!r}\n{code}"],
+                            cwd=BASEDIR, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None)->int:
+    parser = argparse.ArgumentParser(description="startup time of main.py and cli.py")
+    parser.add_argument("--repeat", type=int, default=5, help="new processes per measurement")
+    parser.add_argument("--platform", default=None if os.environ.get("DISPLAY") else "offscreen",
+                        help="Qt platform plugin, default: offscreen without display")
+    args = parser.parse_args(argv)
+
+    runs = []
+    for _ in range(args.repeat):
+        runs.append({**measure(GUI_STARTUP, args.platform), **measure(CLI_STARTUP, args.platform)})
+
+    print(f"{'':10} {'min s':>7} {'median s':>9}  loaded")
+    for name in ("gui_shown", "gui_ready", "cli"):
+        seconds = [run[name][0] for run in runs]
+        print(f"{name:10} {min(seconds):7.3f} {statistics.median(seconds):9.3f}  {', '.join(runs[-1][name][1])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+import copy
+from typing import Optional, Union
+import numpy as np
+import pandas as pd
+from logger import logger
+from settings import Settings
+from cache import SpotTableCache, SessionCache
+from tracks import TrackStore
+from methods import (load_pivoted_time_series, time_series_from_pivoted, get_time_transformer,
+                     prepare_quality_control, mark_jumps, mark_peaks, get_divisions, get_division_windows,
+                     get_close_divisions, reindex_tracks, filter_cells,
+                     SIZE_JUMP_DIVISION_WINDOW, TRACKING_MARKER_JUMP_DIVISION_WINDOW)
+
+# advanced settings varied by the sweep, besides min_len
+SWEEP_THRESHOLDS = ("size_jump_threshold", "tracking_marker_jump_threshold", "tracking_marker_division_peak_threshold")
+SWEEP_PARAMETERS = SWEEP_THRESHOLDS + ("min_len",)
+
+
+def per_cell(time_series:Union[pd.DataFrame, TrackStore], cells:pd.Index, reduction:str="sum")->np.ndarray:
+    """
+    :param reduction: "sum" or "count" (of values that are not NaN)
+    :return: reduction of each cell in cells (0 for cells not in time_series)
+    """
+    reduced = getattr(time_series, reduction)()
+    if isinstance(time_series, TrackStore):
+        reduced = pd.Series(reduced, index=time_series.track_ids)
+    return reduced.reindex(cells, fill_value=0).to_numpy()
+
+
+def sweep_quality_control(input_folder:str, dataset_name:str, files:list, settings:Settings,
+                          advanced_settings:dict, grid:dict,
+                          spot_table_cache:Optional[SpotTableCache]=None,
+                          session_cache:Optional[SessionCache]=None)->pd.DataFrame:
+    """
+    quality control of one dataset for every combination of thresholds and min_len (no output files).
+    The dataset is loaded and pivoted once, each step is only repeated for the thresholds it depends on
+    (divisions per size jump and peak threshold, flags per combination of all three thresholds).
+    Quality control of a cell does not depend on other cells, so all cells of the smallest min_len are checked
+    once per threshold combination and each min_len only selects the cells that are counted.
+    :param grid: values per parameter of SWEEP_PARAMETERS, parameters not in grid are taken from
+                 settings/advanced_settings
+    :return: DataFrame with a row per combination: the parameters and the numbers of "cells", "approved_cells",
+             "flagged_cells" (cells with potential tracking errors), "divisions" and "close_divisions"
+             (cells with divisions less than 15 h apart), as in QualityControlPreview
+    """
+    unknown = set(grid) - set(SWEEP_PARAMETERS)
+    if unknown:
+        raise ValueError(f"parameters {sorted(unknown)} can not be swept, only {SWEEP_PARAMETERS}")
+    values = {name: sorted(set(grid.get(name) or [advanced_settings[name]])) for name in SWEEP_THRESHOLDS}
+    min_lens = np.array(sorted(set(grid.get("min_len") or [settings.min_len])))
+
+    # get_time_transformer might switch off the time transformation
+    settings = copy.copy(settings)
+    tracking_interval = settings.tracking_interval
+    ragged, pivoted = load_pivoted_time_series(input_folder, dataset_name, files, settings, advanced_settings,
+                                               spot_table_cache=spot_table_cache, session_cache=session_cache)
+    object_sizes, signals_raw = time_series_from_pivoted(pivoted, settings.channel_names, int(min_lens[0]),
+                                                         ragged=ragged)
+    time_transformer = get_time_transformer(settings)
+    quality_control_input = prepare_quality_control(object_sizes, signals_raw[settings.get_tracking_marker_name()],
+                                                    time_transformer)
+    # quality_control filters the first color (as analyze_dataset)
+    signals = next(iter(signals_raw.values()))
+    del pivoted, object_sizes, signals_raw
+
+    cells = signals.columns
+    track_lengths = per_cell(signals, cells, "count")
+    # cells per min_len x cells
+    min_len_cells = track_lengths[np.newaxis, :] > min_lens[:, np.newaxis]
+    logger.debug("quality control sweep of %s with %d cells, %d combinations", dataset_name, len(cells),
+                 np.prod([len(v) for v in values.values()]) * len(min_lens))
+
+    rows = []
+    for size_jump_threshold in values["size_jump_threshold"]:
+        size_jumps = mark_jumps(quality_control_input["size_changes"], size_jump_threshold)
+        for peak_threshold in values["tracking_marker_division_peak_threshold"]:
+            tracking_marker_peaks = mark_peaks(*quality_control_input["tracking_marker_peak_residuals"],
+                                               threshold=peak_threshold)
+            divisions = get_divisions(tracking_marker_peaks, size_jumps, tracking_interval, time_transformer)
+            size_division_windows = get_division_windows(reindex_tracks(divisions, size_jumps, fill_value=False),
+                                                         *SIZE_JUMP_DIVISION_WINDOW, tracking_interval,
+                                                         time_transformer=time_transformer)
+            non_division_size_jumps = (size_jumps != 0) & ~size_division_windows
+            tracking_marker_division_windows = get_division_windows(
+                reindex_tracks(divisions, quality_control_input["tracking_marker_changes"], fill_value=False),
+                *TRACKING_MARKER_JUMP_DIVISION_WINDOW, tracking_interval, time_transformer=time_transformer)
+            close_divisions = get_close_divisions(divisions, interval=tracking_interval)
+            cell_divisions = per_cell(divisions, cells)
+            cell_close_divisions = close_divisions.reindex(cells, fill_value=False).to_numpy()
+
+            for jump_threshold in values["tracking_marker_jump_threshold"]:
+                tracking_marker_jumps = mark_jumps(quality_control_input["tracking_marker_changes"], jump_threshold)
+                non_division_tracking_marker_jumps = (tracking_marker_jumps != 0) & ~tracking_marker_division_windows
+                flags = non_division_size_jumps | reindex_tracks(non_division_tracking_marker_jumps,
+                                                                 non_division_size_jumps, fill_value=False)
+                # with min_len 0 every cell without close divisions is kept (its longest error free part),
+                # a cell is approved for a min_len if that part is long enough (cells without flags always are)
+                kept = filter_cells(signals, flags=flags, close_divisions=close_divisions, min_len=0)
+                kept_cells = cells.isin(kept.columns)
+                kept_lengths = per_cell(kept, cells, "count")
+                cell_flagged = per_cell(flags, cells) > 0
+
+                approved = min_len_cells & kept_cells & (kept_lengths[np.newaxis, :] >= min_lens[:, np.newaxis])
+                for i, min_len in enumerate(min_lens):
+                    rows.append({"size_jump_threshold": size_jump_threshold,
+                                 "tracking_marker_jump_threshold": jump_threshold,
+                                 "tracking_marker_division_peak_threshold": peak_threshold,
+                                 "min_len": int(min_len),
+                                 "cells": int(min_len_cells[i].sum()),
+                                 "approved_cells": int(approved[i].sum()),
+                                 "flagged_cells": int((cell_flagged & min_len_cells[i]).sum()),
+                                 "divisions": int(cell_divisions[min_len_cells[i]].sum()),
+                                 "close_divisions": int((cell_close_divisions & min_len_cells[i]).sum())})
+    return pd.DataFrame(rows, columns=list(SWEEP_PARAMETERS) + ["cells", "approved_cells", "flagged_cells",
+                                                                "divisions", "close_divisions"])
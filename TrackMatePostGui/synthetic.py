@@ -0,0 +1,192 @@
+"""
+synthetic TrackMate spot tables, e.g. for benchmarks (see benchmark.py)
+
+    python synthetic.py --output FOLDER --tracks 1000 --frames 120 --channels 3 --subsets 3
+
+tracks are circadian signals with divisions (peak of the tracking marker, followed by a drop in area),
+some tracks are short, some have a mis-tracking jump (area and tracking marker change for the rest of the track),
+some frames are missing and some spots are not assigned to a track
+"""
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+# length of a cell cycle (h)
+CELL_CYCLE_HOURS = (18, 30)
+# tracking marker at a division and area after a division (relative to the rest of the cell cycle)
+DIVISION_PEAK = 1.8
+DIVISION_AREA_DROP = 0.55
+# area and tracking marker after a mis-tracking jump
+MISTRACKING_AREA_JUMP = 1.6
+MISTRACKING_MARKER_JUMP = 1.4
+# short tracks are shorter than this (frames)
+SHORT_TRACK_FRAMES = 24
+# tracks are generated and written in chunks, limits memory for large tables
+TRACK_CHUNK_SIZE = 10000
+
+
+def get_spot_table_header(n_channels:int)->list[list[str]]:
+    """
+    :return: header row (feature names) and the three rows below it (names, short names, units)
+    """
+    header = [["LABEL", "Label", "Label", ""],
+              ["ID", "Spot ID", "Spot ID", ""],
+              ["TRACK_ID", "Track ID", "Track ID", ""],
+              ["QUALITY", "Quality", "Quality", "(quality)"],
+              ["POSITION_X", "X", "X", "(micron)"],
+              ["POSITION_Y", "Y", "Y", "(micron)"],
+              ["FRAME", "Frame", "Frame", ""]]
+    for channel in range(1, n_channels + 1):
+        header.append([f"MEAN_INTENSITY_CH{channel}", f"Mean intensity ch{channel}", f"Mean ch{channel}",
+                       "(counts)"])
+    header += [["AREA", "Area", "Area", "(micron^2)"],
+               ["PERIMETER", "Perimeter", "Perim.", "(micron)"]]
+    return [list(row) for row in zip(*header)]
+
+
+def sample_track_extents(rng:np.random.Generator, n_tracks:int, n_frames:int,
+                         short_track_ratio:float)->tuple[np.ndarray, np.ndarray]:
+    """
+    :return: first frame and number of frames per track
+    """
+    starts = np.where(rng.random(n_tracks) < 0.5, 0, rng.integers(0, max(1, n_frames // 3), n_tracks))
+    remaining = n_frames - starts
+    lengths = np.where(rng.random(n_tracks) < 0.7, remaining,
+                       rng.integers(np.minimum(SHORT_TRACK_FRAMES, remaining), remaining + 1))
+    short = rng.random(n_tracks) < short_track_ratio
+    lengths[short] = np.minimum(rng.integers(2, SHORT_TRACK_FRAMES, short.sum()), remaining[short])
+    return starts, lengths
+
+
+def get_track_count(spots:int, n_frames:int, short_track_ratio:float=0.2, seed:int=0)->int:
+    """
+    :return: number of tracks for about this number of spots
+    """
+    _, lengths = sample_track_extents(np.random.default_rng(seed), 10000, n_frames, short_track_ratio)
+    return max(1, round(spots / lengths.mean()))
+
+
+def generate_tracks(rng:np.random.Generator, n_tracks:int, n_frames:int, n_channels:int=3,
+                    tracking_interval:float=60.0, short_track_ratio:float=0.2, mistracking_ratio:float=0.2,
+                    gap_ratio:float=0.01, first_track_id:int=0)->pd.DataFrame:
+    """
+    :param n_channels: number of channels, the last one is the tracking marker
+    :param tracking_interval: minutes between frames
+    :return: DataFrame with TRACK_ID, FRAME, AREA and MEAN_INTENSITY_CH{channel}, sorted by track and frame
+    """
+    starts, lengths = sample_track_extents(rng, n_tracks, n_frames, short_track_ratio)
+    tracks = np.repeat(np.arange(n_tracks), lengths)
+    first_points = np.cumsum(lengths) - lengths
+    frames = starts[tracks] + np.arange(len(tracks)) - first_points[tracks]
+    hours = frames * tracking_interval / 60
+
+    phases = rng.uniform(0, 2 * np.pi, n_tracks)[tracks]
+    cycles = np.round(rng.uniform(*CELL_CYCLE_HOURS, n_tracks) * 60 / tracking_interval).astype(np.int64)
+    division_offsets = (rng.random(n_tracks) * cycles).astype(np.int64)
+    cycles, division_offsets = cycles[tracks], division_offsets[tracks]
+
+    # cells grow until they divide, the tracking marker condenses during the division
+    cycle_positions = (frames - division_offsets) % cycles
+    growth = ((frames - division_offsets - 1) % cycles) / cycles
+    area = 100 * DIVISION_AREA_DROP ** (1 - growth) * rng.normal(1, 0.02, len(tracks))
+    marker = 1000 * np.where(cycle_positions == 0, DIVISION_PEAK, 1) * rng.normal(1, 0.02, len(tracks))
+    signals = [500 * (1.5 + np.sin(2 * np.pi * hours / 24 + phases + channel)) * rng.normal(1, 0.02, len(tracks))
+               for channel in range(n_channels - 1)]
+
+    # the track continues with another cell
+    mistracked = rng.random(n_tracks) < mistracking_ratio
+    jump_frames = np.where(mistracked, starts + (rng.random(n_tracks) * lengths).astype(np.int64), n_frames)
+    after_jump = frames >= jump_frames[tracks]
+    area[after_jump] *= MISTRACKING_AREA_JUMP
+    marker[after_jump] *= MISTRACKING_MARKER_JUMP
+
+    keep = rng.random(len(tracks)) >= gap_ratio
+    spots = {"TRACK_ID": first_track_id + tracks, "FRAME": frames, "AREA": area}
+    for channel, values in enumerate(signals + [marker], start=1):
+        spots[f"MEAN_INTENSITY_CH{channel}"] = values
+    return pd.DataFrame({column: values[keep] for column, values in spots.items()})
+
+
+def write_spot_table(path:str, n_tracks:int, n_frames:int, n_channels:int=3, seed:int=0,
+                     untracked_ratio:float=0.01, **track_parameters)->int:
+    """
+    writes a TrackMate shaped spot table (csv with three rows of names and units below the header)
+    :param untracked_ratio: spots without TRACK_ID, relative to the tracked spots
+    :param track_parameters: see generate_tracks
+    :return: number of spots
+    """
+    rng = np.random.default_rng(seed)
+    header = get_spot_table_header(n_channels)
+    spot_count = 0
+    with open(path, "w", newline="") as file:
+        for row in header:
+            file.write(",".join(row) + "\n")
+        for first_track in range(0, n_tracks, TRACK_CHUNK_SIZE):
+            spots = generate_tracks(rng, min(TRACK_CHUNK_SIZE, n_tracks - first_track), n_frames, n_channels,
+                                    first_track_id=first_track, **track_parameters)
+            # copies of random spots without TRACK_ID
+            tracked_count = len(spots)
+            untracked = rng.choice(tracked_count, int(tracked_count * untracked_ratio))
+            spots = spots.iloc[np.concatenate([np.arange(tracked_count), untracked])].reset_index(drop=True)
+            spots["TRACK_ID"] = spots["TRACK_ID"].astype("Int64")
+            spots.loc[tracked_count:, "TRACK_ID"] = pd.NA
+
+            spots.insert(0, "ID", np.arange(spot_count, spot_count + len(spots)))
+            spots.insert(0, "LABEL", "ID" + spots["ID"].astype(str))
+            spots["QUALITY"] = 1.0
+            spots["POSITION_X"] = rng.uniform(0, 1000, len(spots))
+            spots["POSITION_Y"] = rng.uniform(0, 1000, len(spots))
+            spots["PERIMETER"] = 2 * np.sqrt(np.pi * spots["AREA"])
+            spots[header[0]].to_csv(file, header=False, index=False, float_format="%.4f")
+            spot_count += len(spots)
+    return spot_count
+
+
+def write_dataset(output_folder:str, dataset_name:str, n_tracks:int, n_frames:int, subsets:int=1,
+                  digits:int=2, delimiter:str="_", suffix:str="-spots.csv", seed:int=0, **spot_table_parameters
+                  )->list[str]:
+    """
+    writes a spot table per subset ({dataset_name}{delimiter}{subset}{suffix}, subsets counted from 1)
+    :param n_tracks: tracks per subset
+    :param spot_table_parameters: see write_spot_table
+    :return: paths of the spot tables
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    files = []
+    for subset in range(1, subsets + 1):
+        path = os.path.join(output_folder, f"{dataset_name}{delimiter}{subset:0{digits}d}{suffix}")
+        write_spot_table(path, n_tracks, n_frames, seed=seed + subset, **spot_table_parameters)
+        files.append(path)
+    return files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="writes synthetic TrackMate spot tables")
+    parser.add_argument("--output", required=True, help="folder for the spot tables")
+    parser.add_argument("--datasets", nargs="+", default=["synthetic"], help="dataset names")
+    parser.add_argument("--tracks", type=int, help="tracks per subset")
+    parser.add_argument("--spots", type=int, help="about this many spots per subset instead of --tracks")
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--channels", type=int, default=3, help="number of channels, the last is the tracking marker")
+    parser.add_argument("--subsets", type=int, default=3, help="spot tables per dataset")
+    parser.add_argument("--interval", dest="tracking_interval", type=float, default=60.0,
+                        help="tracking interval (min)")
+    parser.add_argument("--short-tracks", dest="short_track_ratio", type=float, default=0.2)
+    parser.add_argument("--mistracking", dest="mistracking_ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.tracks is None and args.spots is None:
+        parser.error("either --tracks or --spots has to be provided")
+
+    n_tracks = args.tracks or get_track_count(args.spots, args.frames, args.short_track_ratio)
+    for i, dataset in enumerate(args.datasets):
+        files = write_dataset(args.output, dataset, n_tracks, args.frames, subsets=args.subsets,
+                              seed=args.seed + 1000 * i, n_channels=args.channels,
+                              tracking_interval=args.tracking_interval, short_track_ratio=args.short_track_ratio,
+                              mistracking_ratio=args.mistracking_ratio)
+        print(F"{dataset}: {len(files)} spot tables with {n_tracks} tracks each")
+
+
+if __name__ == "__main__":
+    main()
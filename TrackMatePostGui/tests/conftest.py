@@ -0,0 +1,75 @@
+"""
+fixtures for the tests: a small synthetic dataset (see synthetic.py) and the settings to analyse it
+
+    cd TrackMatePostGui
+    python -m pytest tests
+"""
+import os
+import sys
+from typing import Optional
+
+import pandas as pd
+import pytest
+
+# the modules of the gui are imported by name, as in main.py and cli.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from settings import Settings, DEFAULT_ADVANCED_SETTINGS
+from methods import analyze_dataset, to_dense
+from synthetic import write_dataset
+
+DATASET = "synthetic"
+N_CHANNELS = 3
+# thresholds that approve only part of the cells of the test dataset, so quality control decides something
+TEST_ADVANCED_SETTINGS = dict(DEFAULT_ADVANCED_SETTINGS, tracking_marker_jump_threshold=0.05)
+
+
+def get_test_settings(min_len:int=48)->Settings:
+    # analyze_dataset changes settings, every analysis gets its own
+    return Settings(min_len=min_len,
+                    tracking_interval=60.0,
+                    number_channels=N_CHANNELS,
+                    channel_names={channel: f"CH{channel}" for channel in range(1, N_CHANNELS + 1)},
+                    tracking_channel=N_CHANNELS,
+                    digits=2,
+                    delimiter="_",
+                    transform=False,
+                    suffix="-spots.csv")
+
+
+@pytest.fixture(scope="session")
+def spot_tables(tmp_path_factory)->tuple[str, list[str]]:
+    """
+    :return: folder and spot tables of a dataset with 2 subsets of 40 tracks over 120 frames
+    """
+    folder = str(tmp_path_factory.mktemp("spot_tables"))
+    files = write_dataset(folder, DATASET, 40, 120, subsets=2, n_channels=N_CHANNELS, tracking_interval=60.0)
+    return folder, files
+
+
+@pytest.fixture
+def output_folder(tmp_path)->str:
+    # methods.analyze_dataset appends the dataset name to the output folder
+    return str(tmp_path) + "/"
+
+
+def analyze(spot_tables:tuple[str, list[str]], output_folder:str, min_len:int=48,
+            advanced_settings:Optional[dict]=None, **analysis_kwargs)->dict:
+    """
+    :param advanced_settings: changes to TEST_ADVANCED_SETTINGS
+    :param analysis_kwargs: see methods.analyze_dataset
+    """
+    input_folder, files = spot_tables
+    results = analyze_dataset(input_folder, DATASET, files, get_test_settings(min_len), output_folder,
+                              dict(TEST_ADVANCED_SETTINGS, **(advanced_settings or {})), write_output=False,
+                              **analysis_kwargs)
+    assert results["error"] is None
+    return results
+
+
+def assert_same_results(results:dict, expected:dict):
+    for key in ("all_cells", "approved_cells", "failed_division_windows"):
+        assert results[key] == expected[key], key
+    assert results["result_tables"].keys() == expected["result_tables"].keys()
+    for name, table in results["result_tables"].items():
+        pd.testing.assert_frame_equal(to_dense(table), to_dense(expected["result_tables"][name]), obj=name)
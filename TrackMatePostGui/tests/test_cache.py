@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from cache import SpotTableCache, SessionCache
+from methods import get_spot_table_columns, load_subset_table
+from conftest import analyze, assert_same_results
+
+
+def test_spot_table_cache_hit_matches_miss(spot_tables, tmp_path):
+    _, files = spot_tables
+    cache = SpotTableCache(str(tmp_path / "cache"))
+    columns = get_spot_table_columns([1, 2, 3])
+    assert cache.load(files[0], columns) is None
+
+    missed = load_subset_table("01", files[0], [1, 2, 3], spot_table_cache=cache)
+    assert cache.load(files[0], columns) is not None
+    hit = load_subset_table("01", files[0], [1, 2, 3], spot_table_cache=cache)
+    pd.testing.assert_frame_equal(hit, missed)
+    pd.testing.assert_frame_equal(hit, load_subset_table("01", files[0], [1, 2, 3]))
+
+
+def test_spot_table_cache_analysis(spot_tables, output_folder, tmp_path, monkeypatch):
+    cache = SpotTableCache(str(tmp_path / "cache"))
+    missed = analyze(spot_tables, output_folder, spot_table_cache=cache)
+    # a hit must not read the spot tables again
+    monkeypatch.setattr("methods.read_spot_table", None)
+    hit = analyze(spot_tables, output_folder, spot_table_cache=cache)
+    assert_same_results(hit, missed)
+
+
+def test_session_cache_hit_matches_miss(spot_tables, output_folder, monkeypatch):
+    session_cache = SessionCache()
+    missed = {track_store: analyze(spot_tables, output_folder, session_cache=session_cache,
+                                   advanced_settings={"track_store": track_store})
+              for track_store in ("dense", "ragged")}
+    assert len(session_cache.entries) == 2
+    # a hit must not read the spot tables again
+    monkeypatch.setattr("methods.read_spot_table", None)
+    for track_store, expected in missed.items():
+        hit = analyze(spot_tables, output_folder, session_cache=session_cache,
+                      advanced_settings={"track_store": track_store})
+        assert expected["report"].counters["rows_read"] > 0
+        assert hit["report"].counters["rows_read"] == 0
+        assert_same_results(hit, expected)
+
+
+def test_session_cache_evicts_least_recently_used():
+    entries = {key: np.zeros(100) for key in "abc"}
+    session_cache = SessionCache(max_size=2 * entries["a"].nbytes)
+    session_cache.store("a", entries["a"])
+    session_cache.store("b", entries["b"])
+    assert session_cache.load("a") is entries["a"]
+    session_cache.store("c", entries["c"])
+    assert list(session_cache.entries) == ["a", "c"]
+    assert not entries["a"].flags.writeable
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from methods import get_division_windows, mark_jumps, mark_jumps_array
+from sweep import sweep_quality_control
+from conftest import DATASET, TEST_ADVANCED_SETTINGS, analyze, assert_same_results, get_test_settings
+
+# counts of analyze_dataset that the sweep reports as well
+SWEEP_COUNTERS = ("cells", "approved_cells", "flagged_cells", "divisions", "close_divisions")
+
+
+def test_mark_jumps_array():
+    values = np.array([[0.3, -0.3, 0.1], [np.nan, 0.2, -0.2]])
+    expected = np.array([[1, -1, 0], [0, 1, -1]], dtype=np.int8)
+    np.testing.assert_array_equal(mark_jumps_array(values, 0.2), expected)
+    # max_cutoff wins where both apply
+    np.testing.assert_array_equal(mark_jumps_array(np.array([0.5]), 0.4, 0.6), [1])
+
+
+def test_mark_jumps_keeps_labels():
+    time_series = pd.DataFrame({"a": [0.1, 0.5], "b": [-0.5, np.nan]}, index=pd.Index([3, 4], name="FRAME"))
+    jumps = mark_jumps(time_series, 0.2)
+    pd.testing.assert_frame_equal(jumps, pd.DataFrame({"a": [0, 1], "b": [-1, 0]}, index=time_series.index,
+                                                      dtype=np.int8))
+    series = mark_jumps(time_series["a"], 0.2)
+    pd.testing.assert_series_equal(series, pd.Series([0, 1], index=time_series.index, name="a", dtype=np.int8))
+
+
+def test_division_windows():
+    divisions = pd.DataFrame({"a": [False, True, False, False, False], "b": False},
+                             index=pd.Index(range(5), name="FRAME"))
+    windows = get_division_windows(divisions, -1, 2, tracking_interval=60.0)
+    # time point 0 is never marked
+    expected = divisions.assign(a=[False, True, True, True, False])
+    pd.testing.assert_frame_equal(windows, expected)
+    # all cells filtered out
+    empty = divisions.iloc[:, :0]
+    pd.testing.assert_frame_equal(get_division_windows(empty, -1, 2, tracking_interval=60.0), empty)
+
+
+def test_dense_and_ragged_results_match(spot_tables, output_folder):
+    dense = analyze(spot_tables, output_folder, advanced_settings={"track_store": "dense"})
+    ragged = analyze(spot_tables, output_folder, advanced_settings={"track_store": "ragged"})
+    # quality control approves only part of the cells
+    assert 0 < dense["approved_cells"] < dense["all_cells"]
+    assert_same_results(ragged, dense)
+    assert ragged["report"].counters == dense["report"].counters
+
+
+def test_no_cells_left(spot_tables, output_folder):
+    # all tracks are shorter than min_len
+    dense = analyze(spot_tables, output_folder, min_len=500, advanced_settings={"track_store": "dense"})
+    ragged = analyze(spot_tables, output_folder, min_len=500, advanced_settings={"track_store": "ragged"})
+    assert dense["all_cells"] == dense["approved_cells"] == 0
+    assert_same_results(ragged, dense)
+
+
+@pytest.mark.parametrize("track_store", ["dense", "ragged"])
+def test_sweep_matches_analysis(spot_tables, output_folder, track_store):
+    input_folder, files = spot_tables
+    grid = {"tracking_marker_jump_threshold": [0.05, 0.18], "min_len": [24, 48]}
+    sweep = sweep_quality_control(input_folder, DATASET, files, get_test_settings(),
+                                  dict(TEST_ADVANCED_SETTINGS, track_store=track_store), grid)
+    assert len(sweep) == 4
+    for _, row in sweep.iterrows():
+        results = analyze(spot_tables, output_folder, min_len=int(row["min_len"]),
+                          advanced_settings={"track_store": track_store, "tracking_marker_jump_threshold":
+                                             row["tracking_marker_jump_threshold"]})
+        counters = results["report"].counters
+        assert {name: row[name] for name in SWEEP_COUNTERS} == {name: counters[name] for name in SWEEP_COUNTERS}
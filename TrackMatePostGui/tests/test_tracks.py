@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from methods import pivot_spot_table
+from tracks import TrackStore, ragged_pivot_spot_table
+
+
+@pytest.fixture
+def spots()->pd.DataFrame:
+    """
+    :return: spots of tracks with different extents, gaps and a duplicated spot
+    """
+    rng = np.random.default_rng(0)
+    rows = [(track, frame) for track in range(8) for frame in range(track, 20 - track % 3 * 4)
+            if rng.random() > 0.1]
+    spots = pd.DataFrame(rows, columns=["TRACK_ID", "FRAME"])
+    spots["AREA"] = rng.uniform(50, 150, len(spots))
+    return pd.concat([spots, spots.iloc[[3]].assign(AREA=0.0)], ignore_index=True)
+
+
+def get_store_and_dense(spots:pd.DataFrame)->tuple[TrackStore, pd.DataFrame]:
+    values, offsets, start_rows, frames, track_ids = ragged_pivot_spot_table(spots, ["AREA"])
+    dense_values, dense_frames, dense_track_ids = pivot_spot_table(spots, ["AREA"])
+    return (TrackStore(values[0], offsets, start_rows, frames, track_ids),
+            pd.DataFrame(dense_values[0], index=dense_frames, columns=dense_track_ids))
+
+
+def test_ragged_pivot_matches_dense_pivot(spots):
+    store, dense = get_store_and_dense(spots)
+    assert store.shape == dense.shape
+    pd.testing.assert_frame_equal(store.to_dense(), dense)
+    # first spot is kept
+    assert dense.loc[spots["FRAME"][3], spots["TRACK_ID"][3]] == spots["AREA"][3]
+    blocks = np.concatenate([block for _, block in store.iter_dense_rows(block_size=3)])
+    np.testing.assert_array_equal(blocks, dense.to_numpy())
+
+
+def test_reductions_match_dense(spots):
+    store, dense = get_store_and_dense(spots)
+    np.testing.assert_array_equal(store.count(), dense.count().to_numpy())
+    np.testing.assert_allclose(store.sum(), dense.sum().to_numpy())
+    np.testing.assert_allclose(store.mean(), dense.mean().to_numpy())
+    np.testing.assert_allclose(store.std(), dense.std().to_numpy())
+
+
+def test_selection_matches_dense(spots):
+    store, dense = get_store_and_dense(spots)
+    track_ids = dense.columns[[1, 4, 6]]
+    pd.testing.assert_frame_equal(store.select_tracks(track_ids).to_dense(), dense[track_ids])
+    with pytest.raises(KeyError):
+        store.select_tracks(pd.Index([100]))
+    pd.testing.assert_frame_equal(store.subsample(3).to_dense(), dense.iloc[::3])
+
+
+@pytest.mark.parametrize("offset", [1, 2, -1])
+def test_shift_frames_matches_dense(spots, offset):
+    store, dense = get_store_and_dense(spots)
+    shifted = dense.reindex(dense.index - offset).set_axis(dense.index)
+    # the store only holds values from the first to the last frame of each track
+    in_track = store.with_values(np.ones(len(store.values))).to_dense().notna()
+    pd.testing.assert_frame_equal(store.shift_frames(offset).to_dense(), shifted.where(in_track))
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import writers
+from methods import to_dense
+from tracks import TrackStore
+from writers import ExcelResultWriter, StreamingExcelResultWriter, split_for_excel, to_long_layout
+
+
+@pytest.fixture
+def time_series()->pd.DataFrame:
+    rng = np.random.default_rng(0)
+    values = rng.uniform(0, 1, (23, 11))
+    values[rng.random(values.shape) < 0.2] = np.nan
+    return pd.DataFrame(values, index=pd.Index(np.arange(23) * 2, name="FRAME"),
+                        columns=pd.Index([f"{track}_01" for track in range(11)], name="TRACK_ID"))
+
+
+def to_track_store(time_series:pd.DataFrame)->TrackStore:
+    # every track from the first to the last row
+    lengths = np.full(len(time_series.columns), len(time_series))
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    return TrackStore(time_series.to_numpy().T.ravel(), offsets, np.zeros(len(lengths), dtype=np.int64),
+                      time_series.index, time_series.columns)
+
+
+@pytest.fixture
+def small_sheets(monkeypatch):
+    monkeypatch.setattr(writers, "EXCEL_MAX_ROWS", 10)
+    monkeypatch.setattr(writers, "EXCEL_MAX_COLUMNS", 4)
+
+
+def assert_sheets_cover(sheets:list, table:pd.DataFrame, name:str):
+    """
+    sheets are within the limits, have unique names and hold the whole table (parts row block by row block)
+    """
+    assert sheets[0][0] == name
+    assert len({sheet_name for sheet_name, _ in sheets}) == len(sheets)
+    assert all(len(sheet_name) <= writers.EXCEL_MAX_SHEET_NAME_LENGTH for sheet_name, _ in sheets)
+    parts = [to_dense(part) for _, part in sheets]
+    for part in parts:
+        assert part.shape[0] <= writers.EXCEL_MAX_ROWS
+        assert part.shape[1] <= writers.EXCEL_MAX_COLUMNS
+    column_blocks = -(-table.shape[1] // writers.EXCEL_MAX_COLUMNS)
+    rows = [pd.concat(parts[row:row + column_blocks], axis=1) for row in range(0, len(parts), column_blocks)]
+    pd.testing.assert_frame_equal(pd.concat(rows), table)
+
+
+@pytest.mark.usefixtures("small_sheets")
+def test_split_for_excel_limits(time_series):
+    # 30 characters, names of the following sheets are shortened for the suffix
+    name = "CH10_norm_acpt_cells_smoothDiv"
+    sheets = split_for_excel(name, time_series)
+    # 3 blocks of rows x 3 blocks of columns
+    assert len(sheets) == 9
+    assert_sheets_cover(sheets, time_series, name)
+
+
+@pytest.mark.usefixtures("small_sheets")
+def test_split_for_excel_track_store(time_series, monkeypatch):
+    sheets = split_for_excel("CH1_raw_all_cells", to_track_store(time_series))
+    assert len(sheets) == 9
+    assert_sheets_cover(sheets, time_series, "CH1_raw_all_cells")
+
+    # TrackStores with few enough rows are split by columns only and stay TrackStores
+    monkeypatch.setattr(writers, "EXCEL_MAX_ROWS", 100)
+    sheets = split_for_excel("CH1_raw_all_cells", to_track_store(time_series))
+    assert len(sheets) == 3
+    assert all(isinstance(part, TrackStore) for _, part in sheets)
+    assert_sheets_cover(sheets, time_series, "CH1_raw_all_cells")
+
+
+def test_split_for_excel_small_table(time_series):
+    assert len(split_for_excel("overview", time_series)) == 1
+    assert len(split_for_excel("empty", pd.DataFrame())) == 1
+
+
+def test_long_layout(time_series):
+    long = to_long_layout(time_series)
+    assert len(long) == time_series.count().sum()
+    assert long.index.name == "TRACK_ID"
+    pivoted = long.reset_index().pivot(index="FRAME", columns="TRACK_ID", values="value")
+    pd.testing.assert_frame_equal(pivoted.reindex(index=time_series.index, columns=time_series.columns), time_series,
+                                  check_names=False)
+    pd.testing.assert_frame_equal(to_long_layout(to_track_store(time_series)), long)
+
+
+def test_streaming_excel_matches_pandas(time_series, tmp_path):
+    tables = {"overview": pd.DataFrame({"value": ["a", 1, 2.5]}, index=["name", "count", "mean"]),
+              "CH1_raw_all_cells": time_series,
+              "CH2_raw_all_cells": to_track_store(time_series)}
+    workbooks = []
+    for writer_class in (ExcelResultWriter, StreamingExcelResultWriter):
+        folder = tmp_path / writer_class.__name__
+        folder.mkdir()
+        writer = writer_class(str(folder), "synthetic")
+        for name, table in tables.items():
+            writer.write(name, to_dense(table) if writer_class is ExcelResultWriter else table)
+        writer.close()
+        workbooks.append(pd.read_excel(folder / "post_script_output_synthetic.xlsx", sheet_name=None, index_col=0))
+    assert workbooks[1].keys() == workbooks[0].keys()
+    for name, sheet in workbooks[1].items():
+        pd.testing.assert_frame_equal(sheet, workbooks[0][name], obj=name)
+    pd.testing.assert_frame_equal(workbooks[1]["CH2_raw_all_cells"], workbooks[1]["CH1_raw_all_cells"])
+
+
+def test_streaming_excel_discard(time_series, tmp_path, monkeypatch):
+    # temporary files of the rows
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    folder = tmp_path / "output"
+    folder.mkdir()
+    writer = StreamingExcelResultWriter(str(folder), "synthetic")
+    writer.write("CH1_raw_all_cells", to_track_store(time_series))
+    writer.write("CH2_raw_all_cells", time_series)
+    writer.discard()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["output"]
+    assert list(folder.iterdir()) == []
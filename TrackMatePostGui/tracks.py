@@ -0,0 +1,252 @@
+import numpy as np
+import pandas as pd
+
+
+class TrackStore():
+    """
+    Time series of many tracks in a ragged (CSR like) layout instead of a frames x tracks table padded with NaN.
+    Track i covers the rows start_rows[i] to start_rows[i] + lengths[i] - 1 of frames,
+    its values are values[offsets[i]:offsets[i + 1]] (NaN where the track has no spot).
+    Stores derived from the same spot table have the same layout per track, element wise operators
+    (==, !=, &, |, ~, /) work on stores with the same tracks and layout.
+    """
+
+    def __init__(self, values:np.ndarray, offsets:np.ndarray, start_rows:np.ndarray,
+                 frames:pd.Index, track_ids:pd.Index):
+        self.values = values
+        self.offsets = offsets
+        self.start_rows = start_rows
+        self.frames = frames
+        self.track_ids = track_ids
+
+    @property
+    def columns(self)->pd.Index:
+        # tracks are the columns of the dense tables
+        return self.track_ids
+
+    @property
+    def shape(self)->tuple[int, int]:
+        # shape of the dense table
+        return len(self.frames), len(self.track_ids)
+
+    @property
+    def lengths(self)->np.ndarray:
+        return np.diff(self.offsets)
+
+    @property
+    def start_frames(self)->np.ndarray:
+        return self.frames.to_numpy()[np.minimum(self.start_rows, len(self.frames) - 1)]
+
+    @property
+    def nbytes(self)->int:
+        return self.values.nbytes + self.offsets.nbytes + self.start_rows.nbytes
+
+    def point_tracks(self)->np.ndarray:
+        """
+        :return: track (position in track_ids) of every value
+        """
+        return np.repeat(np.arange(len(self.track_ids)), self.lengths)
+
+    def point_rows(self)->np.ndarray:
+        """
+        :return: row (position in frames) of every value
+        """
+        return np.arange(len(self.values)) - np.repeat(self.offsets[:-1] - self.start_rows, self.lengths)
+
+    def point_frames(self)->np.ndarray:
+        return self.frames.to_numpy()[self.point_rows()]
+
+    def with_values(self, values:np.ndarray)->"TrackStore":
+        """
+        :return: store with the same tracks and layout
+        """
+        return TrackStore(values, self.offsets, self.start_rows, self.frames, self.track_ids)
+
+    def select(self, keep:np.ndarray)->"TrackStore":
+        """
+        :param keep: boolean array, True for tracks to keep
+        """
+        lengths = self.lengths[keep]
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        positions = np.arange(offsets[-1]) - np.repeat(offsets[:-1] - self.offsets[:-1][keep], lengths)
+        return TrackStore(self.values[positions], offsets, self.start_rows[keep], self.frames, self.track_ids[keep])
+
+    def select_tracks(self, track_ids:pd.Index)->"TrackStore":
+        indexer = self.track_ids.get_indexer(track_ids)
+        if (indexer == -1).any():
+            raise KeyError(f"tracks {list(track_ids[indexer == -1])} not in store")
+        keep = np.zeros(len(self.track_ids), dtype=bool)
+        keep[indexer] = True
+        return self.select(keep)
+
+    def subsample(self, step:int)->"TrackStore":
+        """
+        keeps every step-th row of frames (like .iloc[::step] of the dense table)
+        """
+        if step == 1:
+            return self
+        start_rows = -(-self.start_rows // step)
+        end_rows = -(-(self.start_rows + self.lengths) // step)
+        lengths = np.maximum(end_rows - start_rows, 0)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        sub_store = TrackStore(np.empty(offsets[-1], dtype=self.values.dtype), offsets, start_rows,
+                               self.frames[::step], self.track_ids)
+        tracks = sub_store.point_tracks()
+        sub_store.values[:] = self.values[self.offsets[:-1][tracks]
+                                          + sub_store.point_rows() * step - self.start_rows[tracks]]
+        return sub_store
+
+    def shift_frames(self, offset:int, fill_value=np.nan)->"TrackStore":
+        """
+        :param offset: frames
+        :return: values of the same track offset frames earlier (fill_value if the track has no value there),
+                 like .reindex(index - offset) of the dense table
+        """
+        tracks = self.point_tracks()
+        rows = self.frames.get_indexer(self.point_frames() - offset)
+        in_track = (rows >= self.start_rows[tracks]) & (rows < self.start_rows[tracks] + self.lengths[tracks])
+        values = np.full(len(self.values), fill_value, dtype=self.values.dtype)
+        values[in_track] = self.values[self.offsets[:-1][tracks[in_track]]
+                                       + rows[in_track] - self.start_rows[tracks[in_track]]]
+        return self.with_values(values)
+
+    def reindex_like(self, other:"TrackStore", fill_value=np.nan)->"TrackStore":
+        """
+        :return: store with the tracks and layout of other, fill_value for tracks not in this store
+        """
+        if self.track_ids.equals(other.track_ids) and np.array_equal(self.offsets, other.offsets):
+            return self
+        indexer = self.track_ids.get_indexer(other.track_ids)
+        present = indexer != -1
+        if ((self.lengths[indexer[present]] != other.lengths[present]).any()
+                or (self.start_rows[indexer[present]] != other.start_rows[present]).any()):
+            raise ValueError("stores have different layouts")
+        values = np.full(len(other.values), fill_value, dtype=self.values.dtype)
+        point_indexer = indexer[other.point_tracks()]
+        in_self = point_indexer != -1
+        values[in_self] = self.values[self.offsets[:-1][point_indexer[in_self]]
+                                      + np.arange(len(other.values))[in_self]
+                                      - np.repeat(other.offsets[:-1], other.lengths)[in_self]]
+        return other.with_values(values)
+
+    def count(self)->np.ndarray:
+        """
+        :return: number of values (not NaN) per track
+        """
+        return np.bincount(self.point_tracks(), weights=~np.isnan(self.values),
+                           minlength=len(self.track_ids)).astype(np.int64)
+
+    def sum(self)->np.ndarray:
+        """
+        :return: sum per track, NaN are skipped
+        """
+        return np.bincount(self.point_tracks(), weights=np.where(np.isnan(self.values), 0, self.values),
+                           minlength=len(self.track_ids))
+
+    def mean(self)->np.ndarray:
+        """
+        :return: mean per track, NaN are skipped
+        """
+        valid = ~np.isnan(self.values)
+        sums = np.bincount(self.point_tracks(), weights=np.where(valid, self.values, 0), minlength=len(self.track_ids))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sums / self.count()
+
+    def std(self, ddof:int=1)->np.ndarray:
+        """
+        :return: standard deviation per track, NaN are skipped
+        """
+        tracks = self.point_tracks()
+        squares = (self.values - self.mean()[tracks])**2
+        sums = np.bincount(tracks, weights=np.where(np.isnan(squares), 0, squares), minlength=len(self.track_ids))
+        counts = self.count()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(counts > ddof, np.sqrt(sums / (counts - ddof)), np.nan)
+
+    def to_dense(self, fill_value=np.nan)->pd.DataFrame:
+        """
+        :return: DataFrame with frames as index and tracks as columns
+        """
+        dense = np.full(self.shape, fill_value, dtype=np.result_type(self.values, fill_value))
+        dense[self.point_rows(), self.point_tracks()] = self.values
+        return pd.DataFrame(dense, index=self.frames, columns=self.track_ids)
+
+    def iter_dense_rows(self, block_size:int=1024, fill_value=np.nan):
+        """
+        dense table in blocks of rows, without building the whole table
+        :return: iterator of (first row, array with shape (rows of block, tracks))
+        """
+        point_rows = self.point_rows()
+        order = np.argsort(point_rows, kind="stable")
+        point_tracks = self.point_tracks()[order]
+        point_rows = point_rows[order]
+        values = self.values[order]
+        for start in range(0, len(self.frames), block_size):
+            stop = min(start + block_size, len(self.frames))
+            first, last = np.searchsorted(point_rows, [start, stop])
+            block = np.full((stop - start, len(self.track_ids)), fill_value,
+                            dtype=np.result_type(self.values, fill_value))
+            block[point_rows[first:last] - start, point_tracks[first:last]] = values[first:last]
+            yield start, block
+
+    def _values_of(self, other)->np.ndarray:
+        return other.values if isinstance(other, TrackStore) else other
+
+    def __eq__(self, other)->"TrackStore":
+        return self.with_values(self.values == self._values_of(other))
+
+    def __ne__(self, other)->"TrackStore":
+        return self.with_values(self.values != self._values_of(other))
+
+    def __and__(self, other)->"TrackStore":
+        return self.with_values(self.values & self._values_of(other))
+
+    def __or__(self, other)->"TrackStore":
+        return self.with_values(self.values | self._values_of(other))
+
+    def __invert__(self)->"TrackStore":
+        return self.with_values(~self.values)
+
+    def __truediv__(self, other)->"TrackStore":
+        return self.with_values(self.values / self._values_of(other))
+
+
+def ragged_pivot_spot_table(input_df:pd.DataFrame, features:list[str]
+                            )->tuple[np.ndarray, np.ndarray, np.ndarray, pd.Index, pd.Index]:
+    """
+    like pivot_spot_table, but only stores each track from its first to its last frame,
+    duplicated spots (same TRACK_ID and FRAME) are dropped (first is kept)
+    :param features: columns of input_df
+    :return: values with shape (features, values of all tracks), offsets and start rows per track
+             (see TrackStore), sorted FRAME index, sorted TRACK_ID index
+    """
+    track_codes, track_ids = pd.factorize(input_df["TRACK_ID"], sort=True)
+    frame_codes, frames = pd.factorize(input_df["FRAME"], sort=True)
+    track_codes = track_codes.astype(np.int64)
+    frame_codes = frame_codes.astype(np.int64)
+
+    #drop duplicates, keep first spot per track and frame
+    first_spot = ~pd.Series(track_codes * len(frames) + frame_codes).duplicated().to_numpy()
+    track_codes, frame_codes = track_codes[first_spot], frame_codes[first_spot]
+
+    start_rows = np.full(len(track_ids), len(frames), dtype=np.int64)
+    np.minimum.at(start_rows, track_codes, frame_codes)
+    end_rows = np.zeros(len(track_ids), dtype=np.int64)
+    np.maximum.at(end_rows, track_codes, frame_codes)
+    offsets = np.zeros(len(track_ids) + 1, dtype=np.int64)
+    np.cumsum(end_rows - start_rows + 1, out=offsets[1:])
+
+    values = np.full((len(features), offsets[-1]), np.nan)
+    values[:, offsets[track_codes] + frame_codes - start_rows[track_codes]] = (
+        input_df[features].to_numpy(dtype=np.float64)[first_spot].T)
+    return values, offsets, start_rows, pd.Index(frames, name="FRAME"), pd.Index(track_ids, name="TRACK_ID")
+
+
+def get_fill_ratio(input_df:pd.DataFrame)->float:
+    """
+    :return: fraction of a dense frames x tracks table of input_df that would hold a spot
+    """
+    table_size = input_df["FRAME"].nunique() * input_df["TRACK_ID"].nunique()
+    return len(input_df) / table_size if table_size else 1.0
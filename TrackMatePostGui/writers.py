@@ -0,0 +1,285 @@
+import abc
+import os
+import importlib.util
+from typing import Optional, Union
+import numpy as np
+import pandas as pd
+from logger import logger
+from tracks import TrackStore
+from progress import AnalysisCancelled, CancellationToken, StageProgress
+
+# all other result tables are time series (frames x cells)
+SUMMARY_TABLES = ("overview", "div_flags")
+
+# an Excel sheet holds 16,384 columns (one is the index) and 1,048,576 rows (one is the header)
+EXCEL_MAX_COLUMNS = 16384 - 1
+EXCEL_MAX_ROWS = 1048576 - 1
+EXCEL_MAX_SHEET_NAME_LENGTH = 31
+
+# rows of a time series converted to a dense block at a time while streaming a sheet
+EXCEL_ROW_BLOCK_SIZE = 1024
+# same look as the header and index cells pandas writes
+EXCEL_HEADER_FORMAT = {"bold": True, "border": 1, "align": "center", "valign": "top"}
+
+CSV_COMPRESSION = {"method": "gzip", "compresslevel": 6}
+
+
+def get_output_file_base(output_folder:str, dataset_name:str)->str:
+    return os.path.join(output_folder, f'post_script_output_{dataset_name}')
+
+
+def to_long_layout(time_series:Union[pd.DataFrame, TrackStore])->pd.DataFrame:
+    """
+    :return: DataFrame with TRACK_ID as index and columns FRAME, value, one row per time point with a value
+    """
+    if isinstance(time_series, TrackStore):
+        has_value = ~np.isnan(time_series.values)
+        track_ids = time_series.track_ids[time_series.point_tracks()[has_value]]
+        return pd.DataFrame({"FRAME": time_series.point_frames()[has_value],
+                             "value": time_series.values[has_value]},
+                            index=track_ids.rename("TRACK_ID"))
+    values = time_series.to_numpy(dtype=np.float64).T
+    track_idx, frame_idx = np.nonzero(~np.isnan(values))
+    return pd.DataFrame({"FRAME": time_series.index[frame_idx],
+                         "value": values[track_idx, frame_idx]},
+                        index=time_series.columns[track_idx].rename("TRACK_ID"))
+
+
+def split_for_excel(name:str, table:Union[pd.DataFrame, TrackStore]
+                    )->list[tuple[str, Union[pd.DataFrame, TrackStore]]]:
+    """
+    splits tables larger than an Excel sheet into several sheets, name_2, name_3, ... for the following parts
+    :return: list of (sheet name, part of table)
+    """
+    if isinstance(table, TrackStore) and table.shape[0] > EXCEL_MAX_ROWS:
+        table = table.to_dense()
+    if isinstance(table, TrackStore):
+        parts = [table.select((np.arange(table.shape[1]) >= column)
+                              & (np.arange(table.shape[1]) < column + EXCEL_MAX_COLUMNS))
+                 if table.shape[1] > EXCEL_MAX_COLUMNS else table
+                 for column in range(0, max(table.shape[1], 1), EXCEL_MAX_COLUMNS)]
+    else:
+        parts = [table.iloc[row:row + EXCEL_MAX_ROWS, column:column + EXCEL_MAX_COLUMNS]
+                 for row in range(0, max(len(table), 1), EXCEL_MAX_ROWS)
+                 for column in range(0, max(len(table.columns), 1), EXCEL_MAX_COLUMNS)]
+    if len(parts) > 1:
+        logger.warning(f"{name} is too large for a single Excel sheet, split into {len(parts)} sheets")
+    sheets = [(name, parts[0])]
+    for number, part in enumerate(parts[1:], start=2):
+        suffix = f"_{number}"
+        sheets.append((name[:EXCEL_MAX_SHEET_NAME_LENGTH - len(suffix)] + suffix, part))
+    return sheets
+
+
+def iter_row_blocks(table:Union[pd.DataFrame, TrackStore], block_size:int=EXCEL_ROW_BLOCK_SIZE):
+    """
+    :return: iterator of (index values, rows as array) for blocks of rows of table
+    """
+    if isinstance(table, TrackStore):
+        index = table.frames.to_numpy()
+        for start, block in table.iter_dense_rows(block_size):
+            yield index[start:start + len(block)], block
+        return
+    numeric = all(dtype.kind in "biuf" for dtype in table.dtypes)
+    for start in range(0, len(table), block_size):
+        block = table.iloc[start:start + block_size]
+        yield block.index.to_numpy(), block.to_numpy(dtype=np.float64 if numeric else object)
+
+
+def to_excel_value(value):
+    """
+    :return: value as written by pandas to_excel, None for empty cells
+    """
+    if value is None or (isinstance(value, (float, np.floating)) and np.isnan(value)):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+class ResultWriter(abc.ABC):
+    """
+    Writes the result tables of a dataset in one output format, call close() when all tables are written.
+    Writers with writes_track_stores = True also get time series as TrackStore.
+    Writers that write a table in parts check cancellation_token between them.
+    """
+
+    writes_track_stores = False
+
+    def __init__(self, output_folder:str, dataset_name:str,
+                 cancellation_token:Optional[CancellationToken]=None):
+        self.file_base = get_output_file_base(output_folder, dataset_name)
+        self.cancellation_token = cancellation_token
+
+    @abc.abstractmethod
+    def write(self, name:str, table:Union[pd.DataFrame, TrackStore]):
+        pass
+
+    def close(self):
+        pass
+
+    def discard(self):
+        """
+        called instead of close() when writing was cancelled, files already written are left incomplete
+        """
+        pass
+
+
+class ExcelResultWriter(ResultWriter):
+    """
+    one workbook with a sheet per table (post_script_output_{dataset}.xlsx)
+    """
+
+    def __init__(self, output_folder:str, dataset_name:str,
+                 cancellation_token:Optional[CancellationToken]=None):
+        super().__init__(output_folder, dataset_name, cancellation_token)
+        self.excel_writer = pd.ExcelWriter(self.file_base + ".xlsx")
+
+    def write(self, name:str, table:pd.DataFrame):
+        for sheet_name, part in split_for_excel(name, table):
+            part.to_excel(self.excel_writer, sheet_name=sheet_name)
+
+    def close(self):
+        self.excel_writer.close()
+
+
+class StreamingExcelResultWriter(ResultWriter):
+    """
+    same workbook as ExcelResultWriter, but written row by row with xlsxwriter in constant memory mode,
+    rows are flushed to a temporary file instead of keeping the whole workbook in memory until close(),
+    the workbook is written to a temporary path and only renamed to the xlsx file by close()
+    """
+
+    writes_track_stores = True
+
+    def __init__(self, output_folder:str, dataset_name:str,
+                 cancellation_token:Optional[CancellationToken]=None):
+        import xlsxwriter
+        super().__init__(output_folder, dataset_name, cancellation_token)
+        self.workbook_path = self.file_base + ".xlsx"
+        self.workbook = xlsxwriter.Workbook(self.workbook_path + ".tmp", {"constant_memory": True})
+        self.header_format = self.workbook.add_format(EXCEL_HEADER_FORMAT)
+
+    def write(self, name:str, table:Union[pd.DataFrame, TrackStore]):
+        for sheet_name, part in split_for_excel(name, table):
+            self.write_sheet(self.workbook.add_worksheet(sheet_name), part)
+
+    def write_sheet(self, worksheet, table:Union[pd.DataFrame, TrackStore]):
+        index_name = table.frames.name if isinstance(table, TrackStore) else table.index.name
+        if index_name is not None:
+            worksheet.write(0, 0, to_excel_value(index_name), self.header_format)
+        for column, label in enumerate(table.columns, start=1):
+            worksheet.write(0, column, to_excel_value(label), self.header_format)
+
+        # constant memory mode only allows writing the rows in order
+        row = 1
+        for index, block in iter_row_blocks(table):
+            numeric = block.dtype == np.float64
+            for index_value, values in zip(index, block):
+                # a row of a wide table has thousands of cells
+                if self.cancellation_token is not None:
+                    self.cancellation_token.check()
+                worksheet.write(row, 0, to_excel_value(index_value), self.header_format)
+                if numeric:
+                    for column in np.flatnonzero(~np.isnan(values)):
+                        worksheet.write_number(row, column + 1, values[column])
+                else:
+                    for column, value in enumerate(values, start=1):
+                        value = to_excel_value(value)
+                        if value is not None:
+                            worksheet.write(row, column, value)
+                row += 1
+
+    def close(self):
+        self.workbook.close()
+        os.replace(self.workbook.filename, self.workbook_path)
+
+    def discard(self):
+        # closing removes the temporary files of the rows, the incomplete workbook is deleted
+        try:
+            self.workbook.close()
+        finally:
+            if os.path.exists(self.workbook.filename):
+                os.remove(self.workbook.filename)
+
+
+class CsvResultWriter(ResultWriter):
+    """
+    a gzip compressed csv file per table (post_script_output_{dataset}_{table}.csv.gz)
+    """
+
+    def write(self, name:str, table:pd.DataFrame):
+        table.to_csv(f"{self.file_base}_{name}.csv.gz", compression=CSV_COMPRESSION)
+
+
+class ParquetResultWriter(ResultWriter):
+    """
+    a parquet file per table (post_script_output_{dataset}_{table}.parquet), needs pyarrow
+    """
+
+    def write(self, name:str, table:pd.DataFrame):
+        # parquet only allows string column names
+        table.rename(columns=str).to_parquet(f"{self.file_base}_{name}.parquet")
+
+
+# a writer per settings.OUTPUT_FORMATS,
+# pandas uses xlsxwriter for xlsx if it is installed, otherwise openpyxl which cannot stream
+RESULT_WRITERS = {"xlsx": (StreamingExcelResultWriter if importlib.util.find_spec("xlsxwriter") is not None
+                           else ExcelResultWriter),
+                  "csv": CsvResultWriter,
+                  "parquet": ParquetResultWriter}
+
+
+def check_output_formats(output_formats:list[str]):
+    """
+    raises ValueError if an output format is unknown or cannot be written
+    """
+    if not output_formats:
+        raise ValueError("Please select at least one output format")
+    for output_format in output_formats:
+        if output_format not in RESULT_WRITERS:
+            raise ValueError(f"unknown output format {output_format}, use one of {list(RESULT_WRITERS)}")
+    if "parquet" in output_formats and importlib.util.find_spec("pyarrow") is None:
+        raise ValueError("parquet output needs pyarrow (pip install pyarrow)")
+
+
+def write_result_tables(tables:dict[str:Union[pd.DataFrame, TrackStore]], output_folder:str, dataset_name:str,
+                        output_formats:list[str], long_layout:bool=False,
+                        progress:Optional[StageProgress]=None):
+    """
+    writes all result tables of a dataset in each output format
+    :param tables: table names as keys, time series are converted to DataFrames one at a time
+    :param long_layout: write time series as (TRACK_ID, FRAME, value) rows instead of a column per cell
+    :param progress: updated per table, checks for cancellation (when cancelled, files written so far are
+                     left incomplete and the xlsx workbook is not written)
+    """
+    progress = progress or StageProgress()
+    writers = [RESULT_WRITERS[output_format](output_folder, dataset_name, progress.cancellation_token)
+               for output_format in output_formats]
+    cancelled = False
+    try:
+        for table_number, (name, table) in enumerate(tables.items()):
+            progress.update(table_number / len(tables))
+            if long_layout and name not in SUMMARY_TABLES:
+                table = to_long_layout(table)
+            dense_table = None
+            for writer in writers:
+                if isinstance(table, TrackStore) and not writer.writes_track_stores:
+                    if dense_table is None:
+                        dense_table = table.to_dense()
+                    writer.write(name, dense_table)
+                else:
+                    writer.write(name, table)
+        progress.update(1)
+    except AnalysisCancelled:
+        cancelled = True
+        raise
+    finally:
+        for writer in writers:
+            if cancelled:
+                writer.discard()
+            else:
+                writer.close()
+    logger.debug("results of %s written as %s", dataset_name, ", ".join(output_formats))